@@ -0,0 +1,539 @@
+"""
+Scenario-driven load test for the DevTinder API, run in-process.
+
+server.py is imported and driven through its ASGI interface. HTTP goes
+through httpx's ASGITransport and WebSockets through a minimal ASGI session,
+so the numbers cover the application and Mongo but not the network. The
+database is either a local mongod (a throwaway database, dropped afterwards)
+or mongomock-motor as an in-memory stand-in.
+
+    python benchmarks/loadtest.py                                  # all scenarios, in-memory
+    python benchmarks/loadtest.py --backend mongod --mongo-url mongodb://localhost:27017
+    python benchmarks/loadtest.py auth_storm chat --users 100 --concurrency 50
+    python benchmarks/loadtest.py --save-baseline benchmarks/baseline.json
+    python benchmarks/loadtest.py --compare benchmarks/baseline.json
+
+Mongo operations are counted per collection method call (a cursor counts as
+one operation however many batches it fetches) and attributed to the route
+that issued them; work done outside a request is reported as "background".
+"""
+
+import argparse
+import asyncio
+import importlib
+import json
+import logging
+import os
+import random
+import sys
+import time
+import uuid
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+import httpx
+import numpy as np
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+from database import create_client, warm_up  # noqa: E402
+from metrics import MongoCommandMetrics  # noqa: E402
+
+SKILLS = ["python", "javascript", "typescript", "react", "go", "rust", "mongodb", "docker", "kubernetes", "ml"]
+INTERESTS = ["open source", "startups", "hackathons", "ai", "devops", "gaming", "web3", "security"]
+
+# Collection methods that cost a round trip to Mongo
+MONGO_OPERATIONS = {
+    "find", "find_one", "find_one_and_update", "find_one_and_delete", "insert_one", "insert_many",
+    "update_one", "update_many", "replace_one", "delete_one", "delete_many", "bulk_write",
+    "aggregate", "count_documents", "distinct", "create_index", "create_indexes",
+}
+
+WS_ROUTE = "WS /ws/{user_id}"
+
+# The ASGI scope of the request being served, for attributing Mongo operations
+_current_scope: ContextVar[Optional[dict]] = ContextVar("loadtest_scope", default=None)
+
+
+def route_label(scope: dict) -> str:
+    # Router fills in the matched route, so this is the path template rather than the URL
+    route = scope.get("route")
+    path = route.path if route is not None else scope["path"]
+    return f"{scope.get('method', 'WS')} {path}"
+
+
+class OperationCounter:
+    def __init__(self):
+        self.operations: Counter = Counter()
+
+    def record(self) -> None:
+        scope = _current_scope.get()
+        self.operations[route_label(scope) if scope is not None else "background"] += 1
+
+
+class CountingCollection:
+    def __init__(self, collection, counter: OperationCounter):
+        self._collection = collection
+        self._counter = counter
+
+    def __getattr__(self, name: str) -> Any:
+        attribute = getattr(self._collection, name)
+        if name == "with_options":
+            return lambda *args, **kwargs: CountingCollection(attribute(*args, **kwargs), self._counter)
+        if name not in MONGO_OPERATIONS:
+            return attribute
+
+        def counted(*args, **kwargs):
+            self._counter.record()
+            return attribute(*args, **kwargs)
+        return counted
+
+
+class CountingDatabase:
+    def __init__(self, database, counter: OperationCounter):
+        self._database = database
+        self._counter = counter
+
+    def __getitem__(self, name: str) -> CountingCollection:
+        return CountingCollection(self._database[name], self._counter)
+
+    def __getattr__(self, name: str) -> Any:
+        attribute = getattr(self._database, name)
+        if name == "with_options":
+            return lambda *args, **kwargs: CountingDatabase(attribute(*args, **kwargs), self._counter)
+        if hasattr(attribute, "find_one"):
+            return CountingCollection(attribute, self._counter)
+        if name == "command":
+            def counted(*args, **kwargs):
+                self._counter.record()
+                return attribute(*args, **kwargs)
+            return counted
+        return attribute
+
+
+class ScopeTrackingApp:
+    # Outermost ASGI wrapper; everything the request awaits sees its scope
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        token = _current_scope.set(scope)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _current_scope.reset(token)
+
+
+class LatencyRecorder:
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Counter = Counter()
+
+    def record(self, label: str, seconds: float, ok: bool = True) -> None:
+        self.samples[label].append(seconds)
+        if not ok:
+            self.errors[label] += 1
+
+
+class ASGIWebSocket:
+    """A WebSocket client session talking to the app's ASGI callable directly."""
+
+    def __init__(self, app, path: str, query_string: str = ""):
+        self.app = app
+        self.path = path
+        self.query_string = query_string
+        self.to_app: asyncio.Queue = asyncio.Queue()
+        self.from_app: asyncio.Queue = asyncio.Queue()
+        self.task: Optional[asyncio.Task] = None
+
+    async def connect(self) -> None:
+        scope = {
+            "type": "websocket", "asgi": {"version": "3.0"}, "scheme": "ws",
+            "path": self.path, "raw_path": self.path.encode(), "root_path": "",
+            "query_string": self.query_string.encode(), "headers": [],
+            "client": ("127.0.0.1", 0), "server": ("testserver", 80), "subprotocols": [],
+        }
+        self.task = asyncio.create_task(self.app(scope, self.to_app.get, self.from_app.put))
+        await self.to_app.put({"type": "websocket.connect"})
+        message = await self.from_app.get()
+        if message["type"] != "websocket.accept":
+            raise ConnectionError(f"WebSocket rejected with code {message.get('code')}")
+
+    async def send_text(self, text: str) -> None:
+        await self.to_app.put({"type": "websocket.receive", "text": text})
+
+    async def receive_text(self) -> str:
+        message = await self.from_app.get()
+        if message["type"] == "websocket.close":
+            raise ConnectionError(f"WebSocket closed with code {message.get('code')}")
+        return message["text"]
+
+    async def close(self) -> None:
+        await self.to_app.put({"type": "websocket.disconnect", "code": 1000})
+        await self.task
+        await self.from_app.put({"type": "websocket.close", "code": 1000})
+
+
+@dataclass
+class BenchUser:
+    id: str
+    name: str
+    token: str
+
+
+class ChatClient:
+    # One open socket; acks resolve the matching send, pushes record delivery latency
+    def __init__(self, bench: "Bench", user: BenchUser):
+        self.bench = bench
+        self.user = user
+        self.socket = ASGIWebSocket(bench.app, f"/ws/{user.id}", f"token={user.token}")
+        self.pending: Dict[str, asyncio.Future] = {}
+        self.delivered = 0
+        self.reader: Optional[asyncio.Task] = None
+
+    async def connect(self) -> None:
+        started = time.perf_counter()
+        await self.socket.connect()
+        self.bench.recorder.record(f"{WS_ROUTE} connect", time.perf_counter() - started)
+        self.reader = asyncio.create_task(self._read())
+
+    async def _read(self) -> None:
+        while True:
+            try:
+                frame = json.loads(await self.socket.receive_text())
+            except ConnectionError:
+                return
+            if frame["type"] == "new_message":
+                # The text carries the sender's perf_counter reading
+                sent = float(frame["message"]["text"].rsplit(" ", 1)[-1])
+                self.bench.recorder.record(f"{WS_ROUTE} delivery", time.perf_counter() - sent)
+                self.delivered += 1
+            elif frame.get("client_id") in self.pending:
+                self.pending.pop(frame["client_id"]).set_result(frame)
+
+    async def send(self, receiver_id: str) -> None:
+        client_id = uuid.uuid4().hex
+        future = asyncio.get_running_loop().create_future()
+        self.pending[client_id] = future
+        started = time.perf_counter()
+        await self.socket.send_text(json.dumps({
+            "type": "send", "client_id": client_id, "receiver_id": receiver_id, "text": f"bench {started!r}"
+        }))
+        try:
+            frame = await asyncio.wait_for(future, self.bench.args.timeout)
+            ok = frame["type"] == "ack"
+        except asyncio.TimeoutError:
+            self.pending.pop(client_id, None)
+            ok = False
+        self.bench.recorder.record(WS_ROUTE, time.perf_counter() - started, ok)
+
+    async def close(self) -> None:
+        await self.socket.close()
+        await self.reader
+
+
+class Bench:
+    def __init__(self, server, args: argparse.Namespace):
+        self.server = server
+        self.args = args
+        self.app = ScopeTrackingApp(server.app)
+        self.http = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=self.app), base_url="http://testserver", timeout=args.timeout
+        )
+        self.counter = OperationCounter()
+        self.recorder = LatencyRecorder()
+        self.random = random.Random(args.seed)
+        self.run_id = uuid.uuid4().hex[:8]
+        self.started = time.perf_counter()
+
+    def reset(self) -> None:
+        # Drop whatever scenario setup recorded
+        self.counter.operations.clear()
+        self.recorder = LatencyRecorder()
+        self.started = time.perf_counter()
+
+    async def gather(self, coroutines: Iterable[Awaitable[Any]]) -> List[Any]:
+        semaphore = asyncio.Semaphore(self.args.concurrency)
+
+        async def bounded(coroutine):
+            async with semaphore:
+                return await coroutine
+        return await asyncio.gather(*(bounded(coroutine) for coroutine in coroutines))
+
+    async def request(self, method: str, route: str, path: Optional[str] = None,
+                      user: Optional[BenchUser] = None, **kwargs) -> httpx.Response:
+        headers = {"Authorization": f"Bearer {user.token}"} if user else {}
+        started = time.perf_counter()
+        response = await self.http.request(method, path or route, headers=headers, **kwargs)
+        self.recorder.record(f"{method} {route}", time.perf_counter() - started, response.status_code < 400)
+        return response
+
+    async def signup(self, name: str) -> Optional[BenchUser]:
+        response = await self.request("POST", "/api/auth/signup", json={
+            "name": name, "email": f"{name}@bench.example.com", "password": "benchmark-password"
+        })
+        if response.status_code != 200:
+            return None
+        return BenchUser(response.json()["user"]["id"], name, response.json()["access_token"])
+
+    async def login(self, name: str) -> None:
+        await self.request("POST", "/api/auth/login", json={
+            "email": f"{name}@bench.example.com", "password": "benchmark-password"
+        })
+
+    async def create_users(self, prefix: str, count: int) -> List[BenchUser]:
+        users = await self.gather(self.signup(f"{prefix}{self.run_id}-{i}") for i in range(count))
+        users = [user for user in users if user is not None]
+        await self.gather(
+            self.request("PUT", "/api/profile", user=user, json={
+                "name": user.name,
+                "bio": "Benchmark user",
+                "skills": self.random.sample(SKILLS, 3),
+                "interests": self.random.sample(INTERESTS, 2),
+            })
+            for user in users
+        )
+        return users
+
+    async def connect(self, a: BenchUser, b: BenchUser) -> None:
+        await self.request("POST", "/api/users/{user_id}/friend-request", f"/api/users/{b.id}/friend-request", user=a)
+        await self.request("POST", "/api/users/{user_id}/accept-request", f"/api/users/{a.id}/accept-request", user=b)
+
+    def report(self) -> Dict[str, Dict[str, float]]:
+        elapsed = time.perf_counter() - self.started
+        endpoints = {}
+        for label in sorted(set(self.recorder.samples) | set(self.counter.operations)):
+            samples = np.array(self.recorder.samples.get(label, [])) * 1000
+            count = len(samples)
+            operations = self.counter.operations.get(label, 0)
+            endpoints[label] = {
+                "count": count,
+                "errors": self.recorder.errors.get(label, 0),
+                "p50_ms": float(np.percentile(samples, 50)) if count else 0.0,
+                "p95_ms": float(np.percentile(samples, 95)) if count else 0.0,
+                "p99_ms": float(np.percentile(samples, 99)) if count else 0.0,
+                "throughput_rps": count / elapsed if elapsed else 0.0,
+                "mongo_ops": operations,
+                "mongo_ops_per_request": operations / count if count else 0.0,
+            }
+        return {"duration_seconds": elapsed, "endpoints": endpoints}
+
+
+# Scenarios
+async def auth_storm(bench: Bench) -> None:
+    # Everyone signs up at once, then logs in repeatedly
+    names = [f"auth{bench.run_id}-{i}" for i in range(bench.args.users)]
+    await bench.gather(bench.signup(name) for name in names)
+    await bench.gather(bench.login(name) for _ in range(bench.args.iterations) for name in names)
+
+
+async def feed_browsing(bench: Bench) -> None:
+    users = await bench.create_users("feed", bench.args.users)
+    bench.reset()
+
+    async def browse(user: BenchUser) -> None:
+        for _ in range(bench.args.iterations):
+            cards = (await bench.request("GET", "/api/feed", user=user)).json()
+            if len(cards) > 1:
+                await bench.request("GET", "/api/users/{user_id}", f"/api/users/{cards[1]['id']}", user=user)
+            if cards:
+                await bench.request("POST", "/api/users/{user_id}/pass", f"/api/users/{cards[0]['id']}/pass", user=user)
+            await bench.request("GET", "/api/search", user=user, params={"skills": bench.random.choice(SKILLS)})
+            await bench.request("GET", "/api/suggestions", user=user)
+    await bench.gather(browse(user) for user in users)
+
+
+async def friend_churn(bench: Bench) -> None:
+    users = await bench.create_users("churn", bench.args.users)
+    bench.reset()
+    fanout = max(1, min(bench.args.iterations, len(users) // 2))
+
+    async def send_requests(index: int) -> None:
+        for step in range(1, fanout + 1):
+            target = users[(index + step) % len(users)]
+            await bench.request("POST", "/api/users/{user_id}/friend-request",
+                                f"/api/users/{target.id}/friend-request", user=users[index])
+
+    async def accept_requests(user: BenchUser) -> None:
+        received = (await bench.request("GET", "/api/friend-requests", user=user)).json()
+        for sender in received:
+            await bench.request("POST", "/api/users/{user_id}/accept-request",
+                                f"/api/users/{sender['id']}/accept-request", user=user)
+
+    async def browse_graph(index: int) -> None:
+        user = users[index]
+        await bench.request("GET", "/api/connections", user=user)
+        other = users[(index + fanout + 1) % len(users)]
+        await bench.request("GET", "/api/users/{user_id}/mutual-connections",
+                            f"/api/users/{other.id}/mutual-connections", user=user)
+
+    await bench.gather(send_requests(index) for index in range(len(users)))
+    await bench.gather(accept_requests(user) for user in users)
+    await bench.gather(browse_graph(index) for index in range(len(users)))
+
+
+async def chat(bench: Bench) -> None:
+    # Pairs of connected users, every one of them with an open socket
+    users = await bench.create_users("chat", bench.args.users - bench.args.users % 2)
+    pairs = list(zip(users[::2], users[1::2]))
+    await bench.gather(bench.connect(a, b) for a, b in pairs)
+    partners = {a.id: b for a, b in pairs}
+    partners.update({b.id: a for a, b in pairs})
+    bench.reset()
+
+    clients = [ChatClient(bench, user) for user in users]
+    await bench.gather(client.connect() for client in clients)
+
+    async def converse(client: ChatClient) -> None:
+        partner = partners[client.user.id]
+        for _ in range(bench.args.iterations):
+            await client.send(partner.id)
+        await bench.request("GET", "/api/chat/{connection_id}/history", f"/api/chat/{partner.id}/history", user=client.user)
+        await bench.request("GET", "/api/conversations", user=client.user)
+        await bench.request("POST", "/api/conversations/{connection_id}/read",
+                            f"/api/conversations/{partner.id}/read", user=client.user)
+    await bench.gather(converse(client) for client in clients)
+
+    # Let in-flight pushes arrive before closing
+    expected = bench.args.iterations * len(clients)
+    deadline = time.perf_counter() + bench.args.timeout
+    while sum(client.delivered for client in clients) < expected and time.perf_counter() < deadline:
+        await asyncio.sleep(0.01)
+    await asyncio.gather(*(client.close() for client in clients))
+
+
+SCENARIOS: Dict[str, Callable[[Bench], Awaitable[None]]] = {
+    "auth_storm": auth_storm,
+    "feed_browsing": feed_browsing,
+    "friend_churn": friend_churn,
+    "chat": chat,
+}
+
+
+def print_report(name: str, result: Dict[str, Any]) -> None:
+    print(f"\n{name} ({result['duration_seconds']:.2f}s)")
+    print(f"  {'endpoint':<52}{'count':>7}{'err':>5}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'req/s':>9}{'mongo/req':>11}")
+    for label, stats in result["endpoints"].items():
+        print(
+            f"  {label:<52}{stats['count']:>7}{stats['errors']:>5}{stats['p50_ms']:>9.2f}{stats['p95_ms']:>9.2f}"
+            f"{stats['p99_ms']:>9.2f}{stats['throughput_rps']:>9.1f}{stats['mongo_ops_per_request']:>11.2f}"
+        )
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    # Slower p95 beyond the tolerance, or more Mongo round trips per request
+    regressions = []
+    for scenario, result in results.items():
+        base_endpoints = baseline.get("scenarios", {}).get(scenario, {}).get("endpoints", {})
+        for label, stats in result["endpoints"].items():
+            base = base_endpoints.get(label)
+            if base is None or not stats["count"]:
+                continue
+            if stats["p95_ms"] > base["p95_ms"] * (1 + tolerance) and stats["p95_ms"] - base["p95_ms"] > 1:
+                regressions.append(f"{scenario} {label}: p95 {base['p95_ms']:.2f} -> {stats['p95_ms']:.2f} ms")
+            if stats["mongo_ops_per_request"] > base["mongo_ops_per_request"] + 0.01:
+                regressions.append(
+                    f"{scenario} {label}: mongo/req {base['mongo_ops_per_request']:.2f} -> {stats['mongo_ops_per_request']:.2f}"
+                )
+    return regressions
+
+
+def load_server(args: argparse.Namespace):
+    # server.py reads its configuration at import time
+    if args.bcrypt_rounds is not None:
+        os.environ["BCRYPT_ROUNDS"] = str(args.bcrypt_rounds)
+    # Every simulated client shares one address; keep rate limits out of the measurements unless asked for
+    if not args.rate_limit:
+        os.environ["RATE_LIMIT_ENABLED"] = "false"
+    if args.backend == "mongod":
+        os.environ["MONGO_URL"] = args.mongo_url
+        os.environ["DB_NAME"] = f"devtinder_loadtest_{uuid.uuid4().hex[:8]}"
+    else:
+        os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+        os.environ.setdefault("DB_NAME", "devtinder_loadtest")
+    server = importlib.import_module("server")
+    # Set the database up front; startup only connects when none is set
+    if args.backend == "memory":
+        try:
+            from mongomock_motor import AsyncMongoMockClient
+        except ImportError:
+            raise SystemExit("The in-memory backend needs mongomock-motor: pip install mongomock-motor")
+        server.db = AsyncMongoMockClient()[os.environ["DB_NAME"]]
+    else:
+        server.client = create_client(args.mongo_url, event_listeners=[
+            MongoCommandMetrics(server.mongo_latency, server.mongo_failures)
+        ])
+        server.db = server.client[os.environ["DB_NAME"]]
+    return server
+
+
+async def _main(args: argparse.Namespace) -> int:
+    server = load_server(args)
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.WARNING)
+    database = server.db
+    if args.backend == "mongod":
+        await warm_up(database)
+    bench = Bench(server, args)
+    server.db = CountingDatabase(database, bench.counter)
+    await server.app.router.startup()
+
+    results = {}
+    try:
+        for name in args.scenarios or SCENARIOS:
+            bench.reset()
+            await SCENARIOS[name](bench)
+            results[name] = bench.report()
+            print_report(name, results[name])
+    finally:
+        await bench.http.aclose()
+        if args.backend == "mongod":
+            await database.client.drop_database(database.name)
+        await server.app.router.shutdown()
+
+    if args.save_baseline:
+        Path(args.save_baseline).write_text(json.dumps({
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "backend": args.backend,
+            "settings": {key: getattr(args, key) for key in ("users", "concurrency", "iterations", "bcrypt_rounds", "seed")},
+            "scenarios": results,
+        }, indent=2))
+        print(f"\nBaseline written to {args.save_baseline}")
+
+    if args.compare:
+        regressions = compare(results, json.loads(Path(args.compare).read_text()), args.tolerance)
+        print(f"\n{len(regressions)} regression(s) against {args.compare}")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run in-process load test scenarios against the API")
+    parser.add_argument("scenarios", nargs="*", help=f"scenarios to run (default: all of {', '.join(SCENARIOS)})")
+    parser.add_argument("--backend", default="memory", help="'memory' (mongomock-motor) or 'mongod'")
+    parser.add_argument("--mongo-url", default="mongodb://localhost:27017", help="mongod to use with --backend mongod")
+    parser.add_argument("--users", type=int, default=50, help="users per scenario")
+    parser.add_argument("--concurrency", type=int, default=20, help="requests in flight at once")
+    parser.add_argument("--iterations", type=int, default=5, help="repetitions of each user's loop")
+    parser.add_argument("--bcrypt-rounds", type=int, help="override BCRYPT_ROUNDS (default: server setting)")
+    parser.add_argument("--rate-limit", action="store_true", help="keep the server's rate limits enabled")
+    parser.add_argument("--timeout", type=float, default=30.0, help="seconds to wait for a response or ack")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--save-baseline", metavar="PATH", help="write results as a baseline file")
+    parser.add_argument("--compare", metavar="PATH", help="compare against a baseline; exit 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative p95 increase (default: 0.2)")
+    parser.add_argument("--verbose", action="store_true", help="keep the server's INFO logging")
+    args = parser.parse_args()
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    if args.backend not in ("memory", "mongod"):
+        parser.error("--backend must be 'memory' or 'mongod'")
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(asyncio.run(_main(args)))
@@ -0,0 +1,116 @@
+"""
+Per-item serialization cost for the list endpoints.
+
+Compares the previous path (build models from Mongo dicts, let FastAPI
+validate them again through `response_model` and encode with json.dumps)
+against the validate-once orjson path in serialization.py, on synthetic
+documents shaped like the feed, connections and chat history responses.
+
+    python benchmarks/serialization.py [--items 200] [--repeat 200]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, List
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+# server.py reads these at import time; nothing here talks to Mongo
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'benchmark')
+
+from pydantic import TypeAdapter  # noqa: E402
+
+from serialization import dumps_text, model_list_response  # noqa: E402
+from server import Message, UserSummary  # noqa: E402
+
+
+def user_documents(count: int) -> List[dict]:
+    now = datetime.utcnow()
+    return [
+        {
+            "id": str(uuid.uuid4()),
+            "name": f"Developer {i}",
+            "bio": "Full-stack developer who enjoys distributed systems and good coffee.",
+            "skills": ["python", "react", "mongodb", "docker", "kubernetes"][: 1 + i % 5],
+            "interests": ["open source", "hackathons", "ai"][: 1 + i % 3],
+            "profile_pic": None,
+            "is_online": i % 2 == 0,
+            "last_seen": now - timedelta(minutes=i),
+        }
+        for i in range(count)
+    ]
+
+
+def message_documents(count: int) -> List[dict]:
+    start = datetime.utcnow()
+    a, b = str(uuid.uuid4()), str(uuid.uuid4())
+    return [
+        {
+            "id": str(uuid.uuid4()),
+            "conversation_id": ":".join(sorted([a, b])),
+            "sender_id": a if i % 2 else b,
+            "receiver_id": b if i % 2 else a,
+            "text": f"Message number {i} about the pull request we discussed earlier",
+            "timestamp": start + timedelta(seconds=i),
+        }
+        for i in range(count)
+    ]
+
+
+def legacy_response(model, documents) -> bytes:
+    # Handler builds models, FastAPI re-validates against response_model and encodes
+    models = [model(**document) for document in documents]
+    adapter = TypeAdapter(List[model])
+    content = adapter.dump_python(adapter.validate_python(models), mode="json")
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def fast_response(model, documents) -> bytes:
+    return model_list_response(model, documents).body
+
+
+def measure(fn: Callable[[], object], repeat: int) -> float:
+    fn()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--items', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    users = user_documents(args.items)
+    messages = message_documents(args.items)
+    cases = [
+        ("feed", UserSummary, users),
+        ("connections", UserSummary, users),
+        ("chat history", Message, messages),
+    ]
+
+    print(f"{'endpoint':<14}{'legacy us/item':>16}{'fast us/item':>14}{'speedup':>9}")
+    for name, model, documents in cases:
+        legacy = measure(lambda: legacy_response(model, documents), args.repeat)
+        fast = measure(lambda: fast_response(model, documents), args.repeat)
+        print(f"{name:<14}{legacy / args.items * 1e6:>16.2f}{fast / args.items * 1e6:>14.2f}{legacy / fast:>8.1f}x")
+
+    # WebSocket push of a single message
+    message = Message(**messages[0])
+    push = {"type": "new_message", "message": message, "sender_name": "Developer 0"}
+    legacy = measure(lambda: json.dumps({**push, "message": message.dict()}, default=str), args.repeat * 10)
+    fast = measure(lambda: dumps_text(push), args.repeat * 10)
+    print(f"{'ws push':<14}{legacy * 1e6:>16.2f}{fast * 1e6:>14.2f}{legacy / fast:>8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+MongoDB client settings and startup warm-up.
+
+Everything is read from the environment next to MONGO_URL / DB_NAME; unset
+variables keep the driver defaults:
+
+    MONGO_MAX_POOL_SIZE                 connections per server (driver default 100)
+    MONGO_MIN_POOL_SIZE                 connections kept open while idle
+    MONGO_MAX_IDLE_TIME_MS              close pooled connections idle for longer
+    MONGO_WAIT_QUEUE_TIMEOUT_MS         how long a request waits for a free connection
+    MONGO_SERVER_SELECTION_TIMEOUT_MS   how long to wait for a suitable server
+    MONGO_CONNECT_TIMEOUT_MS
+    MONGO_SOCKET_TIMEOUT_MS
+    MONGO_COMPRESSORS                   e.g. "zstd,snappy,zlib"
+    MONGO_READ_PREFERENCE               default for all reads, e.g. "primary"
+    MONGO_LIST_READ_PREFERENCE          listing endpoints (feed, connections, search), e.g. "secondaryPreferred"
+    MONGO_MAX_STALENESS_SECONDS         staleness bound for secondary reads
+    MONGO_WARMUP_CONNECTIONS            connections opened at startup (default: MONGO_MIN_POOL_SIZE, at least 1)
+"""
+
+import asyncio
+import logging
+import os
+from typing import Any, Dict, Mapping, Optional
+
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pymongo.read_preferences import Nearest, Primary, PrimaryPreferred, Secondary, SecondaryPreferred
+
+logger = logging.getLogger(__name__)
+
+# Environment variable -> MongoClient keyword
+_INT_OPTIONS = {
+    'MONGO_MAX_POOL_SIZE': 'maxPoolSize',
+    'MONGO_MIN_POOL_SIZE': 'minPoolSize',
+    'MONGO_MAX_IDLE_TIME_MS': 'maxIdleTimeMS',
+    'MONGO_WAIT_QUEUE_TIMEOUT_MS': 'waitQueueTimeoutMS',
+    'MONGO_SERVER_SELECTION_TIMEOUT_MS': 'serverSelectionTimeoutMS',
+    'MONGO_CONNECT_TIMEOUT_MS': 'connectTimeoutMS',
+    'MONGO_SOCKET_TIMEOUT_MS': 'socketTimeoutMS',
+}
+
+_READ_PREFERENCES = {
+    'primary': Primary,
+    'primaryPreferred': PrimaryPreferred,
+    'secondary': Secondary,
+    'secondaryPreferred': SecondaryPreferred,
+    'nearest': Nearest,
+}
+
+
+def read_preference(name: Optional[str], max_staleness: int = -1):
+    if not name:
+        return None
+    if name not in _READ_PREFERENCES:
+        raise ValueError(f"Unknown read preference: {name}")
+    if name == 'primary':
+        return Primary()
+    return _READ_PREFERENCES[name](max_staleness=max_staleness)
+
+
+def max_staleness(environ: Mapping[str, str] = os.environ) -> int:
+    return int(environ.get('MONGO_MAX_STALENESS_SECONDS', '-1'))
+
+
+def client_options(environ: Mapping[str, str] = os.environ) -> Dict[str, Any]:
+    options: Dict[str, Any] = {}
+    for variable, keyword in _INT_OPTIONS.items():
+        if environ.get(variable):
+            options[keyword] = int(environ[variable])
+    if environ.get('MONGO_COMPRESSORS'):
+        options['compressors'] = environ['MONGO_COMPRESSORS']
+    preference = read_preference(environ.get('MONGO_READ_PREFERENCE'), max_staleness(environ))
+    if preference is not None:
+        options['read_preference'] = preference
+    return options
+
+
+def list_read_preference(environ: Mapping[str, str] = os.environ):
+    # None (use the client default) unless listing reads may go elsewhere
+    return read_preference(environ.get('MONGO_LIST_READ_PREFERENCE'), max_staleness(environ))
+
+
+def create_client(mongo_url: str, **extra: Any) -> AsyncIOMotorClient:
+    # Aware UTC datetimes, so values read back serialize like the ones just written
+    options: Dict[str, Any] = {"tz_aware": True}
+    options.update(client_options())
+    options.update(extra)
+    return AsyncIOMotorClient(mongo_url, **options)
+
+
+async def warm_up(db: AsyncIOMotorDatabase, connections: Optional[int] = None) -> None:
+    # Concurrent pings check out that many pooled connections, so early requests find them open
+    if connections is None:
+        connections = int(os.environ.get('MONGO_WARMUP_CONNECTIONS') or os.environ.get('MONGO_MIN_POOL_SIZE') or 1)
+    await asyncio.gather(*(db.command('ping') for _ in range(max(connections, 1))))
+    logger.info("MongoDB ready with %d warm connection(s)", max(connections, 1))
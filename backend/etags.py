@@ -0,0 +1,50 @@
+"""
+ETags for conditional GETs on polled endpoints.
+
+A tag is a short digest of the resource's version counter plus whatever else
+selects the representation (page cursor, limit, presence). Counters live on
+documents the write paths update anyway:
+
+    users.version               profile; bumped by profile updates
+    users.connections_version   connection list; bumped when a connection is
+                                accepted or a connection edits their profile.
+                                Online status is not part of the list (it
+                                changes far too often); clients poll it from
+                                /api/connections/presence
+    conversations.version       chat history; bumped for every message
+
+Handlers read the counter before the content, so a concurrent write can only
+make a tag older than its body (one extra full response), never newer.
+"""
+
+import hashlib
+from typing import Optional
+
+from fastapi.responses import Response
+
+
+def make_etag(*parts: object) -> str:
+    # Weak: the same version always re-encodes to an equivalent, not byte-identical, body
+    digest = hashlib.blake2b(repr(parts).encode(), digest_size=12).hexdigest()
+    return f'W/"{digest}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    # If-None-Match uses the weak comparison: W/ prefixes are ignored
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(","))
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "private, no-cache"})
+
+
+def with_etag(response: Response, etag: str) -> Response:
+    # no-cache: clients may keep the body but must revalidate it on every poll
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
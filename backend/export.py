@@ -0,0 +1,131 @@
+"""
+Streaming NDJSON export of conversations and account data.
+
+Records are read from Motor cursors in batches of `batch_size` and written
+out one JSON object per line as each batch is encoded, optionally through an
+incremental gzip compressor, so memory use does not depend on how much there
+is to export. Used by the /api/export endpoints and from the command line:
+
+    python export.py conversation <user_id> <other_user_id> [-o chat.ndjson]
+    python export.py account <user_id> [-o account.ndjson.gz --gzip]
+    python export.py messages [--since 2025-01-01] [-o messages.ndjson.gz --gzip]
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import zlib
+from datetime import datetime
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Optional
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from database import create_client
+from message_store import create_message_store, store_options
+from migrate import conversation_id_for
+from serialization import dumps
+
+# Documents per cursor batch, and lines per chunk written to the stream
+EXPORT_BATCH_SIZE = 500
+
+
+# Messages are read through the message store, whichever layout and tier holds them
+def conversation_records(store, conversation_id: str,
+                         batch_size: int = EXPORT_BATCH_SIZE) -> AsyncIterator[Dict[str, Any]]:
+    return store.conversation_messages(conversation_id, batch_size)
+
+
+def message_records(store, since: Optional[datetime] = None,
+                    batch_size: int = EXPORT_BATCH_SIZE) -> AsyncIterator[Dict[str, Any]]:
+    # Every message, grouped by conversation, for analytics
+    return store.all_messages(since, batch_size)
+
+
+async def account_records(db: AsyncIOMotorDatabase, store, user_id: str,
+                          batch_size: int = EXPORT_BATCH_SIZE) -> AsyncIterator[Dict[str, Any]]:
+    # Everything stored about a user, one record per line tagged with its type
+    user = await db.users.find_one({"id": user_id}, {"_id": 0, "password": 0})
+    if user is None:
+        return
+    yield {"type": "profile", **user}
+
+    for query in ({"from_id": user_id}, {"to_id": user_id}):
+        async for edge in db.edges.find(query, {"_id": 0}).batch_size(batch_size):
+            yield {"type": "edge", **edge}
+    async for swipe in db.swipes.find({"user_id": user_id}, {"_id": 0}).batch_size(batch_size):
+        yield {"type": "swipe", **swipe}
+    async for conversation in db.conversations.find({"participants": user_id}, {"_id": 0}).batch_size(batch_size):
+        yield {"type": "conversation", **conversation}
+        async for message in conversation_records(store, conversation["id"], batch_size):
+            yield {"type": "message", **message}
+
+
+async def ndjson_chunks(records: AsyncIterator[Dict[str, Any]], batch_size: int = EXPORT_BATCH_SIZE) -> AsyncIterator[bytes]:
+    lines = []
+    async for record in records:
+        lines.append(dumps(record))
+        if len(lines) >= batch_size:
+            yield b"\n".join(lines) + b"\n"
+            lines = []
+    if lines:
+        yield b"\n".join(lines) + b"\n"
+
+
+async def gzip_chunks(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    # wbits=31 writes a gzip header and trailer around the deflate stream
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def ndjson_stream(records: AsyncIterator[Dict[str, Any]], compress: bool = False,
+                  batch_size: int = EXPORT_BATCH_SIZE) -> AsyncIterator[bytes]:
+    chunks = ndjson_chunks(records, batch_size)
+    return gzip_chunks(chunks) if compress else chunks
+
+
+async def _main(args: argparse.Namespace) -> int:
+    root_dir = Path(__file__).parent
+    load_dotenv(root_dir / '.env')
+    client = create_client(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    store = create_message_store(db, **store_options())
+    if args.kind == "conversation":
+        records = conversation_records(store, conversation_id_for(args.ids[0], args.ids[1]), args.batch_size)
+    elif args.kind == "account":
+        records = account_records(db, store, args.ids[0], args.batch_size)
+    else:
+        records = message_records(store, args.since, args.batch_size)
+
+    output = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        async for chunk in ndjson_stream(records, args.gzip, args.batch_size):
+            output.write(chunk)
+        return 0
+    finally:
+        if args.output:
+            output.close()
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export DevTinder data as NDJSON")
+    parser.add_argument("kind", choices=["conversation", "account", "messages"])
+    parser.add_argument("ids", nargs="*", help="conversation: both user ids; account: the user id")
+    parser.add_argument("-o", "--output", help="file to write (default: stdout)")
+    parser.add_argument("--gzip", action="store_true", help="gzip-compress the output")
+    parser.add_argument("--since", type=datetime.fromisoformat, help="messages: only those sent from this time on")
+    parser.add_argument("--batch-size", type=int, default=EXPORT_BATCH_SIZE)
+    args = parser.parse_args()
+    expected_ids = {"conversation": 2, "account": 1, "messages": 0}[args.kind]
+    if len(args.ids) != expected_ids:
+        parser.error(f"{args.kind} takes {expected_ids} user id(s)")
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(asyncio.run(_main(args)))
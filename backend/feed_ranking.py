@@ -0,0 +1,112 @@
+"""
+In-memory skill/interest similarity ranking for the swipe feed.
+
+Every user is a row in a bit-packed matrix with one bit per vocabulary term
+("skill:python", "interest:open source", ...). Scoring all candidates
+against the caller is a single AND + popcount over the matrix.
+"""
+
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+# Number of set bits for every byte value
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint16)
+
+
+def profile_terms(skills: Iterable[str], interests: Iterable[str]) -> set:
+    terms = {f"skill:{skill.strip().lower()}" for skill in skills if skill and skill.strip()}
+    terms |= {f"interest:{interest.strip().lower()}" for interest in interests if interest and interest.strip()}
+    return terms
+
+
+class FeedRanker:
+    def __init__(self, initial_capacity: int = 1024):
+        self.vocabulary: Dict[str, int] = {}
+        self.user_rows: Dict[str, int] = {}
+        self.row_users: List[str] = []
+        self.bits = np.zeros((initial_capacity, 1), dtype=np.uint8)
+        # Rows whose profile has been loaded; other rows only stand in for ids (swipes, edges)
+        self.profiled = np.zeros(initial_capacity, dtype=bool)
+        # updated_at of the most recently changed user loaded from Mongo, for incremental syncs
+        self.synced_until: Optional[datetime] = None
+
+    def __len__(self) -> int:
+        return len(self.row_users)
+
+    def _ensure_capacity(self, rows: int, width: int) -> None:
+        capacity, current_width = self.bits.shape
+        if rows <= capacity and width <= current_width:
+            return
+        # Grow geometrically so incremental updates stay amortised O(1)
+        new_capacity = max(capacity, 1)
+        while new_capacity < rows:
+            new_capacity *= 2
+        new_width = max(current_width, 1)
+        while new_width < width:
+            new_width *= 2
+        grown = np.zeros((new_capacity, new_width), dtype=np.uint8)
+        grown[:capacity, :current_width] = self.bits
+        self.bits = grown
+        profiled = np.zeros(new_capacity, dtype=bool)
+        profiled[:capacity] = self.profiled
+        self.profiled = profiled
+
+    def _term_index(self, term: str) -> int:
+        index = self.vocabulary.get(term)
+        if index is None:
+            index = len(self.vocabulary)
+            self.vocabulary[term] = index
+        return index
+
+    def row_for(self, user_id: str) -> int:
+        # Rows double as compact integer surrogates for user ids
+        row = self.user_rows.get(user_id)
+        if row is None:
+            row = len(self.row_users)
+            self.user_rows[user_id] = row
+            self.row_users.append(user_id)
+            self._ensure_capacity(row + 1, self.bits.shape[1])
+        return row
+
+    def upsert(self, user_id: str, skills: Iterable[str], interests: Iterable[str]) -> None:
+        indexes = [self._term_index(term) for term in profile_terms(skills, interests)]
+        row = self.row_for(user_id)
+        self._ensure_capacity(row + 1, len(self.vocabulary) // 8 + 1)
+
+        self.bits[row, :] = 0
+        for index in indexes:
+            self.bits[row, index >> 3] |= np.uint8(1 << (index & 7))
+        self.profiled[row] = True
+
+    def rank(self, user_id: str, exclude_rows: np.ndarray, limit: int,
+             boost: Optional[np.ndarray] = None) -> List[str]:
+        # `boost` adds a per-row signal (e.g. mutual connections) to the overlap score
+        count = len(self.row_users)
+        if count == 0 or limit <= 0:
+            return []
+
+        matrix = self.bits[:count]
+        row = self.user_rows.get(user_id)
+        query = matrix[row] if row is not None else np.zeros(matrix.shape[1], dtype=np.uint8)
+        scores = _POPCOUNT[matrix & query].sum(axis=1, dtype=np.int32)
+        if boost is not None:
+            scores[:len(boost)] += boost[:count]
+
+        # Only users with a loaded profile are candidates
+        scores[~self.profiled[:count]] = -1
+        scores[exclude_rows[exclude_rows < count]] = -1
+        if row is not None:
+            scores[row] = -1
+
+        k = min(limit, int(np.count_nonzero(scores >= 0)))
+        if k <= 0:
+            return []
+        if k < count:
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(count)
+        # Highest overlap first; equal scores keep signup order
+        top = top[np.lexsort((top, -scores[top]))]
+        return [self.row_users[i] for i in top if scores[i] >= 0]
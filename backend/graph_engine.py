@@ -0,0 +1,116 @@
+"""
+In-memory connection graph in CSR form for mutual-connection and
+friend-of-friend queries.
+
+Nodes are small integers (the feed ranker's row surrogates). The bulk of the
+graph is two int32 arrays, `offsets` and `neighbors`, with each node's
+neighbors sorted. Connections accepted after the last build go to a small
+delta map and are merged into the arrays once it grows past
+`compact_threshold`.
+"""
+
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+_EMPTY = np.zeros(0, dtype=np.int32)
+
+
+class ConnectionGraph:
+    def __init__(self, compact_threshold: int = 10_000):
+        self.compact_threshold = compact_threshold
+        self.offsets = np.zeros(1, dtype=np.int32)
+        self.neighbor_ids = _EMPTY
+        self.delta: Dict[int, Set[int]] = {}
+        self.delta_size = 0
+        # updated_at of the most recently accepted edge loaded from Mongo, for incremental syncs
+        self.synced_until: Optional[datetime] = None
+
+    @property
+    def edge_count(self) -> int:
+        # Directed edges; every connection is stored in both directions
+        return len(self.neighbor_ids) + self.delta_size
+
+    def load(self, edges: Iterable[Tuple[int, int]]) -> None:
+        pairs = np.array(list(edges), dtype=np.int32).reshape(-1, 2)
+        # Store both directions even if the source only lists one of them
+        sources = np.concatenate([pairs[:, 0], pairs[:, 1]])
+        targets = np.concatenate([pairs[:, 1], pairs[:, 0]])
+        self._build(sources, targets)
+        self.delta = {}
+        self.delta_size = 0
+
+    def _build(self, sources: np.ndarray, targets: np.ndarray) -> None:
+        if len(sources):
+            # Drop duplicates and sort by (source, target)
+            packed = np.unique((sources.astype(np.int64) << 32) | targets.astype(np.int64))
+            sources = (packed >> 32).astype(np.int32)
+            targets = (packed & 0xFFFFFFFF).astype(np.int32)
+        node_count = int(sources.max()) + 1 if len(sources) else 0
+        self.offsets = np.zeros(node_count + 1, dtype=np.int32)
+        np.cumsum(np.bincount(sources, minlength=node_count), out=self.offsets[1:])
+        self.neighbor_ids = targets
+
+    def add_edge(self, a: int, b: int) -> None:
+        for source, target in ((a, b), (b, a)):
+            if self._base_has(source, target):
+                continue
+            neighbors = self.delta.setdefault(source, set())
+            if target not in neighbors:
+                neighbors.add(target)
+                self.delta_size += 1
+        if self.delta_size > self.compact_threshold:
+            self.compact()
+
+    def _base_neighbors(self, node: int) -> np.ndarray:
+        if node + 1 >= len(self.offsets):
+            return _EMPTY
+        return self.neighbor_ids[self.offsets[node]:self.offsets[node + 1]]
+
+    def _base_has(self, source: int, target: int) -> bool:
+        neighbors = self._base_neighbors(source)
+        position = int(np.searchsorted(neighbors, target))
+        return position < len(neighbors) and neighbors[position] == target
+
+    def compact(self) -> None:
+        base_sources = np.repeat(np.arange(len(self.offsets) - 1, dtype=np.int32), np.diff(self.offsets))
+        delta_sources = np.array([s for s, targets in self.delta.items() for _ in targets], dtype=np.int32)
+        delta_targets = np.array([t for targets in self.delta.values() for t in targets], dtype=np.int32)
+        self._build(np.concatenate([base_sources, delta_sources]), np.concatenate([self.neighbor_ids, delta_targets]))
+        self.delta = {}
+        self.delta_size = 0
+
+    def neighbors(self, node: int) -> np.ndarray:
+        base = self._base_neighbors(node)
+        extra = self.delta.get(node)
+        if not extra:
+            return base
+        return np.union1d(base, np.fromiter(extra, dtype=np.int32, count=len(extra)))
+
+    def mutual(self, a: int, b: int) -> np.ndarray:
+        return np.intersect1d(self.neighbors(a), self.neighbors(b), assume_unique=True)
+
+    def mutual_counts(self, node: int, node_count: int) -> np.ndarray:
+        # For every node, how many of `node`'s connections it is connected to
+        direct = self.neighbors(node)
+        counts = np.zeros(node_count, dtype=np.int32)
+        if len(direct) == 0:
+            return counts
+        second_hop = np.concatenate([self.neighbors(int(n)) for n in direct])
+        second_hop = second_hop[second_hop < node_count]
+        counts += np.bincount(second_hop, minlength=node_count).astype(np.int32)
+        # Existing connections and the node itself are not suggestions
+        counts[direct[direct < node_count]] = 0
+        if node < node_count:
+            counts[node] = 0
+        return counts
+
+    def suggestions(self, node: int, node_count: int, exclude: np.ndarray, limit: int) -> List[Tuple[int, int]]:
+        counts = self.mutual_counts(node, node_count)
+        counts[exclude[exclude < node_count]] = 0
+        candidates = np.flatnonzero(counts)
+        if len(candidates) > limit:
+            candidates = candidates[np.argpartition(-counts[candidates], limit - 1)[:limit]]
+        candidates = candidates[np.lexsort((candidates, -counts[candidates]))]
+        return [(int(c), int(counts[c])) for c in candidates]
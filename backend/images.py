@@ -0,0 +1,206 @@
+"""
+Content-addressed storage for profile images.
+
+An upload is stored under the SHA-256 of its bytes, next to square JPEG
+thumbnails generated at upload time. File names embed the digest, so a name
+always refers to the same bytes and can be cached forever:
+
+    <digest>.<ext>          the original upload
+    <digest>_<size>.jpg     a thumbnail, for each size in THUMBNAIL_SIZES
+
+User documents keep only the short URL of the original. Files live in a
+local directory ("local") or an S3-compatible bucket ("s3").
+"""
+
+import asyncio
+import base64
+import binascii
+import hashlib
+import io
+import os
+import re
+from pathlib import Path
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+# Where images are served; the value stored in profile_pic is this plus the file name
+IMAGE_URL_PREFIX = "/api/images/"
+
+MAX_IMAGE_BYTES = 5 * 1024 * 1024
+# Refuse images that would take huge amounts of memory to decode
+MAX_IMAGE_PIXELS = 40_000_000
+THUMBNAIL_SIZES = (64, 256)
+
+FORMAT_EXTENSIONS = {"JPEG": "jpg", "PNG": "png", "WEBP": "webp", "GIF": "gif"}
+CONTENT_TYPES = {"jpg": "image/jpeg", "png": "image/png", "webp": "image/webp", "gif": "image/gif"}
+NAME_PATTERN = re.compile(r"^[0-9a-f]{64}(_[0-9]+)?\.(jpg|png|webp|gif)$")
+
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+class UnsatisfiableRange(ValueError):
+    pass
+
+
+def content_type(name: str) -> str:
+    return CONTENT_TYPES[name.rsplit(".", 1)[1]]
+
+
+def thumbnail_name(name: str, size: int) -> str:
+    return f"{name.split('.', 1)[0]}_{size}.jpg"
+
+
+def image_url(name: str) -> str:
+    return IMAGE_URL_PREFIX + name
+
+
+def decode_data_url(value: str) -> bytes:
+    # data:image/png;base64,....
+    header, _, payload = value.partition(",")
+    if not header.startswith("data:image/") or not header.endswith(";base64"):
+        raise InvalidImage("Only base64 image data URLs are supported")
+    try:
+        return base64.b64decode(payload, validate=True)
+    except binascii.Error:
+        raise InvalidImage("Invalid base64 image data")
+
+
+def process_image(data: bytes) -> Tuple[str, Dict[str, bytes]]:
+    # Returns the original's name and every file to store, thumbnails included
+    if len(data) > MAX_IMAGE_BYTES:
+        raise InvalidImage(f"Images are limited to {MAX_IMAGE_BYTES // (1024 * 1024)} MB")
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            extension = FORMAT_EXTENSIONS.get(image.format)
+            if extension is None:
+                raise InvalidImage("Unsupported image format")
+            if image.width * image.height > MAX_IMAGE_PIXELS:
+                raise InvalidImage("Image dimensions are too large")
+            # Camera photos carry their orientation in EXIF
+            upright = ImageOps.exif_transpose(image).convert("RGB")
+            name = f"{hashlib.sha256(data).hexdigest()}.{extension}"
+            files = {name: data}
+            for size in THUMBNAIL_SIZES:
+                buffer = io.BytesIO()
+                ImageOps.fit(upright, (size, size), Image.LANCZOS).save(buffer, "JPEG", quality=85, optimize=True)
+                files[thumbnail_name(name, size)] = buffer.getvalue()
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError):
+        raise InvalidImage("Not a valid image")
+    return name, files
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    # Single "bytes=start-end" ranges (inclusive end); anything else gets the full body
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start_text, _, end_text = header[len("bytes="):].strip().partition("-")
+    try:
+        if start_text:
+            start = int(start_text)
+            end = int(end_text) if end_text else size - 1
+        else:
+            # Suffix range: the last N bytes
+            start = max(size - int(end_text), 0)
+            end = size - 1
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        raise UnsatisfiableRange(header)
+    return start, min(end, size - 1)
+
+
+class LocalImageStore:
+    def __init__(self, directory: str):
+        self.directory = Path(directory)
+
+    def _path(self, name: str) -> Path:
+        # Fan out by digest prefix so no directory grows too large
+        return self.directory / name[:2] / name
+
+    def _write(self, name: str, data: bytes) -> None:
+        path = self._path(name)
+        if path.exists():
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = path.with_suffix(f".{os.getpid()}.tmp")
+        temporary.write_bytes(data)
+        os.replace(temporary, path)
+
+    def _read(self, name: str, start: int, end: Optional[int]) -> bytes:
+        with open(self._path(name), "rb") as f:
+            f.seek(start)
+            return f.read() if end is None else f.read(end - start + 1)
+
+    async def put(self, name: str, data: bytes) -> None:
+        await asyncio.to_thread(self._write, name, data)
+
+    async def size(self, name: str) -> Optional[int]:
+        try:
+            return (await asyncio.to_thread(self._path(name).stat)).st_size
+        except FileNotFoundError:
+            return None
+
+    async def read(self, name: str, start: int = 0, end: Optional[int] = None) -> bytes:
+        return await asyncio.to_thread(self._read, name, start, end)
+
+
+class S3ImageStore:
+    def __init__(self, client: Any, bucket: str, prefix: str = "images/"):
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+
+    async def put(self, name: str, data: bytes) -> None:
+        await asyncio.to_thread(
+            self.client.put_object, Bucket=self.bucket, Key=self.prefix + name, Body=data,
+            ContentType=content_type(name), CacheControl=CACHE_CONTROL
+        )
+
+    async def size(self, name: str) -> Optional[int]:
+        try:
+            response = await asyncio.to_thread(self.client.head_object, Bucket=self.bucket, Key=self.prefix + name)
+        except self.client.exceptions.ClientError:
+            return None
+        return response["ContentLength"]
+
+    async def read(self, name: str, start: int = 0, end: Optional[int] = None) -> bytes:
+        byte_range = f"bytes={start}-{'' if end is None else end}"
+        response = await asyncio.to_thread(
+            self.client.get_object, Bucket=self.bucket, Key=self.prefix + name, Range=byte_range
+        )
+        return await asyncio.to_thread(response["Body"].read)
+
+
+def image_store_options(environ: Mapping[str, str] = os.environ) -> Dict[str, Any]:
+    return {
+        "kind": environ.get('IMAGE_STORE', 'local'),
+        "directory": environ.get('IMAGE_STORE_DIR', str(Path(__file__).parent / 'images')),
+        "bucket": environ.get('IMAGE_STORE_BUCKET'),
+    }
+
+
+def create_image_store(kind: str = "local", directory: str = "images", bucket: Optional[str] = None):
+    if kind == "local":
+        return LocalImageStore(directory)
+    if kind == "s3":
+        if not bucket:
+            raise ValueError("IMAGE_STORE=s3 requires IMAGE_STORE_BUCKET")
+        try:
+            import boto3
+        except ImportError:
+            raise RuntimeError("IMAGE_STORE=s3 requires the 'boto3' package")
+        return S3ImageStore(boto3.client("s3"), bucket)
+    raise ValueError(f"Unknown image store: {kind}")
+
+
+async def save_image(store, data: bytes) -> str:
+    # Decoding and resizing are CPU-bound; keep them off the event loop
+    name, files = await asyncio.to_thread(process_image, data)
+    for file_name, content in files.items():
+        await store.put(file_name, content)
+    return name
@@ -0,0 +1,247 @@
+"""
+MongoDB index bootstrap and query-shape advisor.
+
+`ensure_indexes` is run from the server startup hook. Running this module
+directly explains every registered query shape and exits non-zero if any of
+them still needs a collection scan:
+
+    python indexes.py --explain
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import PyMongoError
+
+from database import create_client
+
+logger = logging.getLogger(__name__)
+
+# Indexes per collection: (keys, options)
+INDEX_SPECS: Dict[str, List[Tuple[List[Tuple[str, int]], Dict[str, Any]]]] = {
+    "users": [
+        ([("id", ASCENDING)], {"name": "users_id_unique", "unique": True}),
+        ([("email", ASCENDING)], {"name": "users_email_unique", "unique": True}),
+        # Incremental feed/search index sync of new and edited profiles
+        ([("updated_at", ASCENDING)], {"name": "users_updated_at"}),
+    ],
+    "messages": [
+        # Chat history is a range scan over one conversation ordered by (timestamp, id)
+        (
+            [("conversation_id", ASCENDING), ("timestamp", ASCENDING), ("id", ASCENDING)],
+            {"name": "messages_conversation_timestamp"},
+        ),
+    ],
+    # Bucketed message layout (MESSAGE_STORAGE=buckets): newest buckets of a conversation,
+    # buckets from a cursor onwards, and old buckets for archival
+    "message_buckets": [
+        ([("conversation_id", ASCENDING), ("end", DESCENDING)], {"name": "message_buckets_conversation_end"}),
+        ([("conversation_id", ASCENDING), ("start", ASCENDING)], {"name": "message_buckets_conversation_start"}),
+        ([("end", ASCENDING)], {"name": "message_buckets_end"}),
+    ],
+    "message_archive": [
+        ([("conversation_id", ASCENDING), ("end", DESCENDING)], {"name": "message_archive_conversation_end"}),
+        ([("conversation_id", ASCENDING), ("start", ASCENDING)], {"name": "message_archive_conversation_start"}),
+    ],
+    "conversations": [
+        ([("id", ASCENDING)], {"name": "conversations_id_unique", "unique": True}),
+        # Inbox: a user's conversations by recency
+        ([("participants", ASCENDING), ("updated_at", DESCENDING)], {"name": "conversations_inbox"}),
+    ],
+    "edges": [
+        # Point lookups for a pair, and outgoing edges (connections, sent requests) by state
+        ([("from_id", ASCENDING), ("to_id", ASCENDING)], {"name": "edges_pair_unique", "unique": True}),
+        ([("from_id", ASCENDING), ("state", ASCENDING), ("to_id", ASCENDING)], {"name": "edges_outgoing"}),
+        # Incoming edges (received requests)
+        ([("to_id", ASCENDING), ("state", ASCENDING), ("from_id", ASCENDING)], {"name": "edges_incoming"}),
+        # Incremental connection graph sync of newly accepted edges
+        ([("state", ASCENDING), ("updated_at", ASCENDING)], {"name": "edges_state_updated_at"}),
+    ],
+    "swipes": [
+        (
+            [("user_id", ASCENDING), ("target_id", ASCENDING)],
+            {"name": "swipes_user_target_unique", "unique": True},
+        ),
+    ],
+}
+
+# Query shapes issued by the API endpoints, with placeholder values.
+# Every new query added to server.py should be registered here so the
+# explain check covers it.
+QUERY_SHAPES: List[Dict[str, Any]] = [
+    {"endpoint": "get_current_user", "collection": "users", "filter": {"id": "u1"}},
+    {"endpoint": "login", "collection": "users", "filter": {"email": "a@example.com"}},
+    {"endpoint": "signup", "collection": "users", "filter": {"email": "a@example.com"}},
+    {"endpoint": "send_friend_request", "collection": "users", "filter": {"id": "u2"}},
+    {"endpoint": "send_friend_request (edge)", "collection": "edges", "filter": {"from_id": "u1", "to_id": "u2"}},
+    {
+        "endpoint": "accept_friend_request",
+        "collection": "edges",
+        "filter": {"from_id": "u2", "to_id": "u1", "state": "pending"},
+    },
+    {
+        "endpoint": "get_connections (edges)",
+        "collection": "edges",
+        "filter": {"from_id": "u1", "state": "accepted", "to_id": {"$gt": "u0"}},
+        "sort": [("to_id", ASCENDING)],
+    },
+    {
+        "endpoint": "get_friend_requests",
+        "collection": "edges",
+        "filter": {"to_id": "u1", "state": "pending"},
+        "sort": [("from_id", ASCENDING)],
+    },
+    {"endpoint": "get_feed (edges)", "collection": "edges", "filter": {"from_id": "u1"}},
+    {
+        "endpoint": "get_feed (sync)",
+        "collection": "users",
+        "filter": {"updated_at": {"$gte": datetime(2025, 1, 1)}},
+        "sort": [("updated_at", ASCENDING)],
+    },
+    {
+        "endpoint": "get_feed (graph sync)",
+        "collection": "edges",
+        "filter": {"state": "accepted", "updated_at": {"$gte": datetime(2025, 1, 1)}},
+        "sort": [("updated_at", ASCENDING)],
+    },
+    {"endpoint": "get_feed", "collection": "users", "filter": {"id": {"$in": ["u2", "u3"]}}},
+    {"endpoint": "get_feed (seen)", "collection": "swipes", "filter": {"user_id": "u1"}},
+    {"endpoint": "record_swipe", "collection": "swipes", "filter": {"user_id": "u1", "target_id": "u2"}},
+    {"endpoint": "get_connections", "collection": "users", "filter": {"id": {"$in": ["u2", "u3"]}}},
+    {
+        "endpoint": "get_chat_history",
+        "collection": "messages",
+        "filter": {"conversation_id": "u1:u2"},
+        "sort": [("timestamp", DESCENDING), ("id", DESCENDING)],
+    },
+    {
+        "endpoint": "get_chat_history (cursor)",
+        "collection": "messages",
+        "filter": {
+            "conversation_id": "u1:u2",
+            "$or": [
+                {"timestamp": {"$lt": datetime(2025, 1, 1)}},
+                {"timestamp": datetime(2025, 1, 1), "id": {"$lt": "m1"}},
+            ],
+        },
+        "sort": [("timestamp", DESCENDING), ("id", DESCENDING)],
+    },
+    {
+        "endpoint": "get_chat_history (buckets)",
+        "collection": "message_buckets",
+        "filter": {"conversation_id": "u1:u2", "start": {"$lte": datetime(2025, 1, 1)}},
+        "sort": [("end", DESCENDING)],
+    },
+    {
+        "endpoint": "get_chat_history (buckets, after)",
+        "collection": "message_buckets",
+        "filter": {"conversation_id": "u1:u2", "end": {"$gte": datetime(2025, 1, 1)}},
+        "sort": [("start", ASCENDING)],
+    },
+    {
+        "endpoint": "get_chat_history (archive)",
+        "collection": "message_archive",
+        "filter": {"conversation_id": "u1:u2", "start": {"$lte": datetime(2025, 1, 1)}},
+        "sort": [("end", DESCENDING)],
+    },
+    {
+        "endpoint": "send_message (bucket)",
+        "collection": "message_buckets",
+        "filter": {"conversation_id": "u1:u2", "count": {"$lt": 200}, "migrated": {"$ne": True}},
+    },
+    {"endpoint": "archive_messages", "collection": "message_buckets", "filter": {"end": {"$lt": datetime(2025, 1, 1)}}},
+    {"endpoint": "send_message (inbox)", "collection": "conversations", "filter": {"id": "u1:u2"}},
+    {
+        "endpoint": "get_inbox",
+        "collection": "conversations",
+        "filter": {"participants": "u1", "updated_at": {"$lt": datetime(2025, 1, 1)}},
+        "sort": [("updated_at", DESCENDING)],
+    },
+]
+
+
+# Indexes replaced by ones above, dropped when present
+RETIRED_INDEXES: Dict[str, List[str]] = {
+    # Profile sync moved from created_at to updated_at
+    "users": ["users_created_at"],
+}
+
+
+async def ensure_indexes(db: AsyncIOMotorDatabase) -> None:
+    for collection, names in RETIRED_INDEXES.items():
+        existing = await db[collection].index_information()
+        for name in names:
+            if name in existing:
+                await db[collection].drop_index(name)
+    for collection, specs in INDEX_SPECS.items():
+        for keys, options in specs:
+            try:
+                await db[collection].create_index(keys, **options)
+            except PyMongoError:
+                # A failing index (e.g. duplicate emails) must not keep the API down
+                logger.exception("Failed to create index %s on %s", options.get("name"), collection)
+
+
+def _plan_stages(plan: Any) -> List[str]:
+    stages = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        for value in plan.values():
+            stages.extend(_plan_stages(value))
+    elif isinstance(plan, list):
+        for item in plan:
+            stages.extend(_plan_stages(item))
+    return stages
+
+
+async def explain_query_shapes(db: AsyncIOMotorDatabase) -> List[Dict[str, Any]]:
+    report = []
+    for shape in QUERY_SHAPES:
+        cursor = db[shape["collection"]].find(shape["filter"])
+        if shape.get("sort"):
+            cursor = cursor.sort(shape["sort"])
+        explanation = await cursor.explain()
+        stages = _plan_stages(explanation.get("queryPlanner", {}).get("winningPlan", {}))
+        report.append({
+            "endpoint": shape["endpoint"],
+            "collection": shape["collection"],
+            "stages": stages,
+            "collscan": "COLLSCAN" in stages,
+        })
+    return report
+
+
+async def _main(explain: bool) -> int:
+    root_dir = Path(__file__).parent
+    load_dotenv(root_dir / '.env')
+    client = create_client(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    try:
+        await ensure_indexes(db)
+        if not explain:
+            return 0
+        report = await explain_query_shapes(db)
+        for entry in report:
+            status = "COLLSCAN" if entry["collscan"] else "ok"
+            print(f"{status:8} {entry['endpoint']:24} {entry['collection']:12} {' > '.join(entry['stages'])}")
+        return 1 if any(entry["collscan"] for entry in report) else 0
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create MongoDB indexes and check query plans")
+    parser.add_argument("--explain", action="store_true", help="report query shapes that need a COLLSCAN")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(asyncio.run(_main(args.explain)))
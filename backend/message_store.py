@@ -0,0 +1,365 @@
+"""
+Message storage layouts.
+
+"documents" (default): one document per message in db.messages.
+
+"buckets": one document per conversation per `bucket_size` messages in
+db.message_buckets. New messages are appended to the conversation's open
+bucket with $push, so a page of history is one or two documents rather than
+one per message. Each bucket records the `start` and `end` timestamps of the
+messages it holds.
+
+In bucket mode, buckets whose newest message is older than `archive_after`
+seconds are moved to a cold tier, db.message_archive. The messages either
+stay inline, or with `archive_dir` set they go to a gzip-compressed BSON file
+and the archive document keeps only the metadata and the file name. Reads
+walk the hot tier first and continue into the archive, so callers never see
+the split.
+
+Archival can also be run by hand:
+
+    python message_store.py archive --older-than-days 90
+"""
+
+import argparse
+import asyncio
+import gzip
+import logging
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Mapping, Optional, Tuple
+
+import bson
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from database import create_client
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKET_SIZE = 200
+
+MESSAGE_ORDER = [("timestamp", ASCENDING), ("id", ASCENDING)]
+
+# Archive files decode to aware UTC datetimes, like the hot tier read through a tz_aware client
+ARCHIVE_CODEC_OPTIONS = bson.CodecOptions(tz_aware=True)
+
+# (timestamp, message id), as carried by history cursors
+Cursor = Tuple[datetime, str]
+
+
+def _naive_utc(timestamp: datetime) -> datetime:
+    # Mongo returns naive UTC datetimes; compare everything on that footing
+    if timestamp.tzinfo is None:
+        return timestamp
+    return timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _key(message: Dict[str, Any]) -> Cursor:
+    return _naive_utc(message["timestamp"]), message["id"]
+
+
+def store_options(environ: Mapping[str, str] = os.environ) -> Dict[str, Any]:
+    archive_days = float(environ.get('MESSAGE_ARCHIVE_AFTER_DAYS', '0'))
+    return {
+        "layout": environ.get('MESSAGE_STORAGE', 'documents'),
+        "bucket_size": int(environ.get('MESSAGE_BUCKET_SIZE', str(DEFAULT_BUCKET_SIZE))),
+        "archive_after": archive_days * 86400 if archive_days > 0 else None,
+        "archive_dir": environ.get('MESSAGE_ARCHIVE_DIR') or None,
+        "archive_interval": float(environ.get('MESSAGE_ARCHIVE_INTERVAL_SECONDS', '3600')),
+    }
+
+
+class DocumentMessageStore:
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.collection = db.messages
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+    async def insert_one(self, message: Dict[str, Any]) -> None:
+        await self.collection.insert_one(message)
+
+    async def insert_many(self, messages: List[Dict[str, Any]], ordered: bool = True) -> None:
+        await self.collection.insert_many(messages, ordered=ordered)
+
+    async def page(self, conversation_id: str, before: Optional[Cursor], after: Optional[Cursor],
+                   limit: int) -> Tuple[List[Dict[str, Any]], bool]:
+        # Single range scan on (conversation_id, timestamp, id)
+        query: Dict[str, Any] = {"conversation_id": conversation_id}
+        if after:
+            query["$or"] = [{"timestamp": {"$gt": after[0]}}, {"timestamp": after[0], "id": {"$gt": after[1]}}]
+            direction = ASCENDING
+        else:
+            if before:
+                query["$or"] = [{"timestamp": {"$lt": before[0]}}, {"timestamp": before[0], "id": {"$lt": before[1]}}]
+            # Without a cursor the page is the most recent messages
+            direction = DESCENDING
+
+        # Fetch one extra document to know whether another page exists
+        messages = await self.collection.find(query, {"_id": 0}).sort(
+            [("timestamp", direction), ("id", direction)]
+        ).to_list(length=limit + 1)
+        has_more = len(messages) > limit
+        messages = messages[:limit]
+        if direction == DESCENDING:
+            messages.reverse()
+        return messages, has_more
+
+    async def conversation_messages(self, conversation_id: str, batch_size: int) -> AsyncIterator[Dict[str, Any]]:
+        cursor = self.collection.find({"conversation_id": conversation_id}, {"_id": 0}).sort(MESSAGE_ORDER)
+        async for message in cursor.batch_size(batch_size):
+            yield message
+
+    async def all_messages(self, since: Optional[datetime], batch_size: int) -> AsyncIterator[Dict[str, Any]]:
+        query: Dict[str, Any] = {"timestamp": {"$gte": since}} if since else {}
+        cursor = self.collection.find(query, {"_id": 0}).sort([("conversation_id", ASCENDING)] + MESSAGE_ORDER)
+        async for message in cursor.batch_size(batch_size):
+            yield message
+
+
+class ArchiveTier:
+    """Cold buckets in db.message_archive, with the messages inline or in files under `directory`."""
+
+    def __init__(self, db: AsyncIOMotorDatabase, directory: Optional[str] = None):
+        self.collection = db.message_archive
+        self.directory = Path(directory) if directory else None
+
+    def _path(self, bucket: Dict[str, Any]) -> Path:
+        return self.directory / bucket["conversation_id"].replace(":", "_") / f"{bucket['_id']}.bson.gz"
+
+    def _write_file(self, bucket: Dict[str, Any]) -> str:
+        path = self._path(bucket)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write then rename, so readers never see a partial file
+        temporary = path.with_suffix(".tmp")
+        temporary.write_bytes(gzip.compress(bson.encode({"messages": bucket["messages"]})))
+        os.replace(temporary, path)
+        return str(path.relative_to(self.directory))
+
+    def _read_file(self, name: str) -> List[Dict[str, Any]]:
+        data = gzip.decompress((self.directory / name).read_bytes())
+        return bson.decode(data, codec_options=ARCHIVE_CODEC_OPTIONS)["messages"]
+
+    async def store(self, bucket: Dict[str, Any]) -> None:
+        document = bucket
+        if self.directory is not None:
+            name = await asyncio.to_thread(self._write_file, bucket)
+            document = {key: value for key, value in bucket.items() if key != "messages"}
+            document["file"] = name
+        await self.collection.replace_one({"_id": bucket["_id"]}, document, upsert=True)
+
+    async def buckets(self, query: Dict[str, Any], sort: List[Tuple[str, int]],
+                      batch_size: int = 20) -> AsyncIterator[Dict[str, Any]]:
+        async for bucket in self.collection.find(query).sort(sort).batch_size(batch_size):
+            if "file" in bucket:
+                bucket["messages"] = await asyncio.to_thread(self._read_file, bucket["file"])
+            yield bucket
+
+
+class _PageCollector:
+    # Keeps the best limit + 1 messages seen so far, by id, since a retried
+    # write can leave the same message in two buckets
+    def __init__(self, before: Optional[Cursor], after: Optional[Cursor], limit: int):
+        self.before = before
+        self.after = after
+        self.limit = limit
+        self.found: Dict[str, Dict[str, Any]] = {}
+        # Timestamp of the last message that still makes a full page
+        self.threshold: Optional[datetime] = None
+
+    @property
+    def full(self) -> bool:
+        return self.threshold is not None
+
+    def add(self, messages: List[Dict[str, Any]]) -> None:
+        for message in messages:
+            key = _key(message)
+            if self.after:
+                if key > self.after:
+                    self.found[message["id"]] = message
+            elif self.before is None or key < self.before:
+                self.found[message["id"]] = message
+        if len(self.found) > self.limit:
+            kept = self.messages()
+            self.found = {message["id"]: message for message in kept}
+            self.threshold = _key(kept[-1])[0]
+
+    def beyond(self, bucket: Dict[str, Any]) -> bool:
+        # Page is full and this bucket (and every later one) only holds messages that would not make it
+        if self.threshold is None:
+            return False
+        if self.after:
+            return _naive_utc(bucket["start"]) > self.threshold
+        return _naive_utc(bucket["end"]) < self.threshold
+
+    def messages(self) -> List[Dict[str, Any]]:
+        # Best first: oldest when paging forward, newest otherwise
+        return sorted(self.found.values(), key=_key, reverse=not self.after)[:self.limit + 1]
+
+
+class BucketMessageStore:
+    def __init__(self, db: AsyncIOMotorDatabase, bucket_size: int = DEFAULT_BUCKET_SIZE,
+                 archive_after: Optional[float] = None, archive_dir: Optional[str] = None,
+                 archive_interval: float = 3600.0):
+        self.collection = db.message_buckets
+        self.bucket_size = bucket_size
+        # Always read the archive; only archive new buckets when an age is configured
+        self.archive = ArchiveTier(db, archive_dir)
+        self.archive_after = archive_after
+        self.archive_interval = archive_interval
+        self.archiver: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        if self.archive_after is not None:
+            self.archiver = asyncio.create_task(self._archive_loop())
+
+    async def stop(self) -> None:
+        if self.archiver is not None:
+            self.archiver.cancel()
+
+    def _append(self, message: Dict[str, Any]) -> UpdateOne:
+        # Push onto an open bucket, or start a new one when all are full
+        return UpdateOne(
+            {"conversation_id": message["conversation_id"], "count": {"$lt": self.bucket_size}, "migrated": {"$ne": True}},
+            {
+                "$push": {"messages": message},
+                "$inc": {"count": 1},
+                "$min": {"start": message["timestamp"]},
+                "$max": {"end": message["timestamp"]},
+            },
+            upsert=True
+        )
+
+    async def insert_one(self, message: Dict[str, Any]) -> None:
+        await self.collection.bulk_write([self._append(message)])
+
+    async def insert_many(self, messages: List[Dict[str, Any]], ordered: bool = True) -> None:
+        try:
+            await self.collection.bulk_write([self._append(message) for message in messages], ordered=ordered)
+        except BulkWriteError as e:
+            # Report progress the way an ordered insert_many would, for MessageWriter
+            e.details["nInserted"] = e.details.get("nModified", 0) + e.details.get("nUpserted", 0)
+            raise
+
+    async def _hot_buckets(self, query: Dict[str, Any], sort: List[Tuple[str, int]]) -> AsyncIterator[Dict[str, Any]]:
+        async for bucket in self.collection.find(query).sort(sort).batch_size(20):
+            yield bucket
+
+    async def page(self, conversation_id: str, before: Optional[Cursor], after: Optional[Cursor],
+                   limit: int) -> Tuple[List[Dict[str, Any]], bool]:
+        query: Dict[str, Any] = {"conversation_id": conversation_id}
+        if after:
+            # Oldest first from the cursor. Archived buckets are older, so they come first,
+            # and are read in full since their time ranges may overlap the hot ones.
+            after = (_naive_utc(after[0]), after[1])
+            query["end"] = {"$gte": after[0]}
+            sort = [("start", ASCENDING)]
+            tiers = [(self.archive.buckets(query, sort), False), (self._hot_buckets(query, sort), False)]
+        else:
+            if before:
+                before = (_naive_utc(before[0]), before[1])
+                query["start"] = {"$lte": before[0]}
+            # Newest first; every hot bucket ends after every archived one
+            sort = [("end", DESCENDING)]
+            tiers = [(self._hot_buckets(query, sort), True), (self.archive.buckets(query, sort), True)]
+
+        page = _PageCollector(before, after, limit)
+        for buckets, can_stop in tiers:
+            if can_stop and page.full:
+                break
+            async for bucket in buckets:
+                if can_stop and page.beyond(bucket):
+                    break
+                page.add(bucket["messages"])
+
+        messages = page.messages()
+        has_more = len(messages) > limit
+        messages = messages[:limit]
+        if not after:
+            messages.reverse()
+        return messages, has_more
+
+    async def _all_buckets(self, query: Dict[str, Any], sort: List[Tuple[str, int]]) -> AsyncIterator[Dict[str, Any]]:
+        async for bucket in self.archive.buckets(query, sort):
+            yield bucket
+        async for bucket in self._hot_buckets(query, sort):
+            yield bucket
+
+    async def conversation_messages(self, conversation_id: str, batch_size: int) -> AsyncIterator[Dict[str, Any]]:
+        seen = set()
+        async for bucket in self._all_buckets({"conversation_id": conversation_id}, [("start", ASCENDING)]):
+            for message in sorted(bucket["messages"], key=_key):
+                if message["id"] not in seen:
+                    seen.add(message["id"])
+                    yield message
+
+    async def all_messages(self, since: Optional[datetime], batch_size: int) -> AsyncIterator[Dict[str, Any]]:
+        # Archive first, then hot buckets; each tier in conversation order
+        query: Dict[str, Any] = {"end": {"$gte": since}} if since else {}
+        async for bucket in self._all_buckets(query, [("conversation_id", ASCENDING), ("start", ASCENDING)]):
+            for message in sorted(bucket["messages"], key=_key):
+                if since is None or _naive_utc(message["timestamp"]) >= _naive_utc(since):
+                    yield message
+
+    async def archive_older_than(self, cutoff: datetime) -> int:
+        moved = 0
+        async for bucket in self.collection.find({"end": {"$lt": cutoff}}).batch_size(20):
+            await self.archive.store(bucket)
+            # A message appended since the read keeps the bucket hot; the archive copy is
+            # replaced on a later pass and duplicates are dropped on read
+            result = await self.collection.delete_one({"_id": bucket["_id"], "count": bucket["count"]})
+            moved += result.deleted_count
+        if moved:
+            logger.info("Archived %d message buckets older than %s", moved, cutoff.isoformat())
+        return moved
+
+    async def _archive_loop(self) -> None:
+        while True:
+            try:
+                await self.archive_older_than(datetime.now(timezone.utc) - timedelta(seconds=self.archive_after))
+            except Exception:
+                logger.exception("Message archival failed")
+            await asyncio.sleep(self.archive_interval)
+
+
+def create_message_store(db: AsyncIOMotorDatabase, layout: str = "documents", bucket_size: int = DEFAULT_BUCKET_SIZE,
+                         archive_after: Optional[float] = None, archive_dir: Optional[str] = None,
+                         archive_interval: float = 3600.0):
+    if layout == "documents":
+        return DocumentMessageStore(db)
+    if layout == "buckets":
+        return BucketMessageStore(db, bucket_size, archive_after, archive_dir, archive_interval)
+    raise ValueError(f"Unknown message storage layout: {layout}")
+
+
+async def _main(older_than_days: float) -> int:
+    root_dir = Path(__file__).parent
+    load_dotenv(root_dir / '.env')
+    client = create_client(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    try:
+        options = store_options()
+        options["layout"] = "buckets"
+        store = create_message_store(db, **options)
+        moved = await store.archive_older_than(datetime.now(timezone.utc) - timedelta(days=older_than_days))
+        print(f"Archived {moved} buckets")
+        return 0
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move old message buckets to the archive tier")
+    parser.add_argument("command", choices=["archive"])
+    parser.add_argument("--older-than-days", type=float, required=True)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(asyncio.run(_main(args.older_than_days)))
@@ -0,0 +1,205 @@
+"""
+Write-behind persistence for chat messages.
+
+In "batched" mode accepted messages are appended to an in-memory buffer and
+written with ordered `insert_many` calls once `batch_size` messages are
+waiting or `flush_interval` seconds have passed. Flushes are serialised, so
+messages reach Mongo in the order they were accepted. `write()` returns once
+the batch holding its message is stored (a group commit): concurrent senders
+share one round trip, but nobody acts on a message that is not in Mongo yet.
+In "sync" mode every message is written with `insert_one` before returning.
+
+A message the server (or the driver, e.g. DocumentTooLarge) rejects outright
+would fail on every retry and hold up everything queued behind it, so it is
+moved to a dead-letter collection instead and its `write()` raises
+MessageRejected. Other errors (network, failover) leave the batch at the head
+of the buffer to be retried.
+"""
+
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from bson.errors import InvalidDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+WRITE_MODES = ("sync", "batched")
+
+
+class MessageRejected(Exception):
+    pass
+
+
+class MessageWriter:
+    def __init__(self, mode: str = "sync", batch_size: int = 100, flush_interval: float = 0.05,
+                 max_pending: int = 10_000):
+        if mode not in WRITE_MODES:
+            raise ValueError(f"Unknown message write mode: {mode}")
+        self.mode = mode
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.buffer: List[Dict[str, Any]] = []
+        # Message id -> future of the write() waiting for it to be stored
+        self.waiters: Dict[str, asyncio.Future] = {}
+        # A message store (message_store.py): anything with insert_one / insert_many
+        self.store = None
+        # Collection receiving messages that can never be written
+        self.dead_letters = None
+        self.flush_lock = asyncio.Lock()
+        self.wakeup = asyncio.Event()
+        self.flusher: Optional[asyncio.Task] = None
+        # Metrics
+        self.batches = 0
+        self.messages_written = 0
+        self.max_batch_size = 0
+        self.flush_seconds_total = 0.0
+        self.flush_seconds_max = 0.0
+        self.flush_errors = 0
+        self.dead_lettered = 0
+
+    async def start(self, store, dead_letters=None) -> None:
+        self.store = store
+        self.dead_letters = dead_letters
+        if self.mode == "batched":
+            self.flusher = asyncio.create_task(self._flush_loop())
+
+    async def stop(self) -> None:
+        if self.flusher is not None:
+            self.flusher.cancel()
+        # Drain everything that was accepted before shutting down
+        await self.flush()
+
+    async def write(self, document: Dict[str, Any]) -> None:
+        if self.mode == "sync":
+            await self.store.insert_one(document)
+            return
+        if len(self.buffer) >= self.max_pending:
+            # Mongo is not keeping up; make the caller wait instead of growing without bound
+            await self.flush()
+        stored = asyncio.get_running_loop().create_future()
+        self.waiters[document["id"]] = stored
+        self.buffer.append(document)
+        if len(self.buffer) >= self.batch_size:
+            self.wakeup.set()
+        await stored
+
+    @property
+    def pending(self) -> int:
+        return len(self.buffer)
+
+    async def _flush_loop(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            try:
+                await self.flush()
+            except PyMongoError:
+                await asyncio.sleep(self.flush_interval)
+            except Exception:
+                # Never let the flusher die; write() relies on it to drain the buffer
+                logger.exception("Message flush failed")
+                await asyncio.sleep(self.flush_interval)
+
+    def _settle(self, documents: List[Dict[str, Any]], error: Optional[Exception] = None) -> None:
+        for document in documents:
+            stored = self.waiters.pop(document.get("id"), None)
+            # Done already if the waiting request was cancelled
+            if stored is None or stored.done():
+                continue
+            if error is None:
+                stored.set_result(None)
+            else:
+                stored.set_exception(error)
+
+    async def _dead_letter(self, document: Dict[str, Any], reason: str) -> None:
+        self.dead_lettered += 1
+        logger.error("Moving message %s to dead letters: %s", document.get("id"), reason)
+        self._settle([document], MessageRejected(reason))
+        if self.dead_letters is None:
+            return
+        record = {"message": document, "error": reason, "failed_at": datetime.now(timezone.utc)}
+        try:
+            await self.dead_letters.insert_one(record)
+        except InvalidDocument:
+            # Too large to keep whole; keep everything but the text
+            message = {key: value for key, value in document.items() if key != "text"}
+            message["text_length"] = len(document.get("text") or "")
+            await self.dead_letters.insert_one({**record, "message": message})
+
+    async def _write_individually(self, batch: List[Dict[str, Any]]) -> None:
+        # Rejected by the driver before the batch was sent (or partly sent); find the bad documents
+        for document in batch:
+            try:
+                await self.store.insert_one(document)
+            except DuplicateKeyError:
+                pass
+            except InvalidDocument as e:
+                await self._dead_letter(document, str(e))
+                continue
+            self._settle([document])
+
+    async def flush(self) -> None:
+        async with self.flush_lock:
+            while self.buffer:
+                batch = self.buffer[:self.batch_size]
+                started = time.perf_counter()
+                try:
+                    await self.store.insert_many(batch, ordered=True)
+                except BulkWriteError as e:
+                    # An ordered insert stops at the first error; keep only what was not written
+                    written = e.details.get("nInserted", 0)
+                    errors = e.details.get("writeErrors", [])
+                    self._settle(self.buffer[:written])
+                    del self.buffer[:written]
+                    self.flush_errors += 1
+                    if not errors:
+                        # Write concern error: retry the rest later
+                        logger.exception("Failed to flush %d messages", len(batch) - written)
+                        raise
+                    if errors[0].get("code") != 11000:
+                        await self._dead_letter(self.buffer[0], errors[0].get("errmsg", "write error"))
+                    else:
+                        # A duplicate key was written by an earlier attempt whose result was lost
+                        self._settle(self.buffer[:1])
+                    del self.buffer[:1]
+                    continue
+                except InvalidDocument:
+                    self.flush_errors += 1
+                    await self._write_individually(batch)
+                    del self.buffer[:len(batch)]
+                    continue
+                except PyMongoError:
+                    # Batch stays at the head of the buffer and is retried on the next flush
+                    self.flush_errors += 1
+                    logger.exception("Failed to flush %d messages", len(batch))
+                    raise
+                elapsed = time.perf_counter() - started
+                self._settle(batch)
+                del self.buffer[:len(batch)]
+                self.batches += 1
+                self.messages_written += len(batch)
+                self.max_batch_size = max(self.max_batch_size, len(batch))
+                self.flush_seconds_total += elapsed
+                self.flush_seconds_max = max(self.flush_seconds_max, elapsed)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "pending": len(self.buffer),
+            "batches": self.batches,
+            "messages_written": self.messages_written,
+            "avg_batch_size": self.messages_written / self.batches if self.batches else 0.0,
+            "max_batch_size": self.max_batch_size,
+            "avg_flush_seconds": self.flush_seconds_total / self.batches if self.batches else 0.0,
+            "max_flush_seconds": self.flush_seconds_max,
+            "flush_errors": self.flush_errors,
+            "dead_lettered": self.dead_lettered,
+        }
@@ -0,0 +1,231 @@
+"""
+Data migrations for the DevTinder MongoDB database.
+
+Each migration is idempotent and can be re-run safely:
+
+    python migrate.py                 # run all migrations
+    python migrate.py conversation_ids
+    python migrate.py social_edges
+    python migrate.py profile_images    # move data-URL profile pictures to the image store
+    python migrate.py message_buckets   # opt-in, for MESSAGE_STORAGE=buckets
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+from pathlib import Path
+from typing import Awaitable, Callable, Dict
+
+from datetime import datetime, timezone
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+
+from database import create_client
+from images import InvalidImage, create_image_store, decode_data_url, image_store_options, image_url, save_image
+from indexes import ensure_indexes
+from message_store import store_options
+
+logger = logging.getLogger(__name__)
+
+# Users migrated per bulk write when moving the social graph to db.edges
+EDGE_MIGRATION_BATCH_SIZE = 500
+
+# Length of the last-message preview kept on conversation documents
+MESSAGE_PREVIEW_LENGTH = 100
+
+
+def conversation_id_for(user_a: str, user_b: str) -> str:
+    # Canonical id shared by both directions of a conversation
+    return ":".join(sorted((user_a, user_b)))
+
+
+async def backfill_conversation_ids(db: AsyncIOMotorDatabase) -> int:
+    # Computed server-side with an update pipeline; matches conversation_id_for
+    result = await db.messages.update_many(
+        {"conversation_id": {"$exists": False}},
+        [{
+            "$set": {
+                "conversation_id": {
+                    "$cond": [
+                        {"$lt": ["$sender_id", "$receiver_id"]},
+                        {"$concat": ["$sender_id", ":", "$receiver_id"]},
+                        {"$concat": ["$receiver_id", ":", "$sender_id"]},
+                    ]
+                }
+            }
+        }],
+    )
+    return result.modified_count
+
+
+async def backfill_conversations(db: AsyncIOMotorDatabase) -> int:
+    # Build inbox entries from the newest message of every conversation.
+    # Existing entries are kept; unread counters start at zero.
+    pipeline = [
+        {"$match": {"conversation_id": {"$exists": True}}},
+        {"$sort": {"timestamp": 1}},
+        {"$group": {"_id": "$conversation_id", "last": {"$last": "$$ROOT"}}},
+        {"$project": {
+            "_id": 0,
+            "id": "$_id",
+            "participants": {"$split": ["$_id", ":"]},
+            "updated_at": "$last.timestamp",
+            "last_message": {
+                "id": "$last.id",
+                "sender_id": "$last.sender_id",
+                "text": {"$substrCP": ["$last.text", 0, MESSAGE_PREVIEW_LENGTH]},
+                "timestamp": "$last.timestamp",
+            },
+        }},
+        {"$merge": {"into": "conversations", "on": "id", "whenMatched": "keepExisting", "whenNotMatched": "insert"}},
+    ]
+    await db.messages.aggregate(pipeline).to_list(length=None)
+    return await db.conversations.count_documents({})
+
+
+async def migrate_social_graph(db: AsyncIOMotorDatabase) -> int:
+    # Move connections / friend request arrays out of user documents into db.edges.
+    # Edges that already exist are left untouched, so this is safe to re-run.
+    legacy = {"$or": [
+        {"connections": {"$exists": True}},
+        {"friend_requests_sent": {"$exists": True}},
+        {"friend_requests_received": {"$exists": True}},
+    ]}
+    projection = {"_id": 0, "id": 1, "connections": 1, "friend_requests_sent": 1}
+    migrated = 0
+    while True:
+        users = await db.users.find(legacy, projection).to_list(length=EDGE_MIGRATION_BATCH_SIZE)
+        if not users:
+            return migrated
+
+        now = datetime.now(timezone.utc)
+        edges = []
+        for user in users:
+            # Each side of a connection lists the other, so this yields both directions
+            for other_id in user.get("connections", []):
+                edges.append(UpdateOne(
+                    {"from_id": user["id"], "to_id": other_id},
+                    {"$setOnInsert": {"state": "accepted", "created_at": now, "updated_at": now}},
+                    upsert=True
+                ))
+            # Received requests are the mirror image of sent ones
+            for other_id in user.get("friend_requests_sent", []):
+                edges.append(UpdateOne(
+                    {"from_id": user["id"], "to_id": other_id},
+                    {"$setOnInsert": {"state": "pending", "created_at": now, "updated_at": now}},
+                    upsert=True
+                ))
+        if edges:
+            await db.edges.bulk_write(edges, ordered=False)
+
+        await db.users.update_many(
+            {"id": {"$in": [user["id"] for user in users]}},
+            {"$unset": {"connections": "", "friend_requests_sent": "", "friend_requests_received": ""}}
+        )
+        migrated += len(users)
+
+
+def _migrated_bucket(conversation_id: str, messages) -> dict:
+    return {
+        "conversation_id": conversation_id,
+        "messages": messages,
+        "count": len(messages),
+        "start": messages[0]["timestamp"],
+        "end": messages[-1]["timestamp"],
+        # Live writes never append to these, so re-running can safely rebuild them
+        "migrated": True,
+    }
+
+
+async def migrate_messages_to_buckets(db: AsyncIOMotorDatabase) -> int:
+    # Copy db.messages into db.message_buckets for MESSAGE_STORAGE=buckets, one
+    # conversation at a time. A conversation is rebuilt until it is marked done,
+    # so an interrupted run can be repeated. db.messages is left in place.
+    bucket_size = store_options()["bucket_size"]
+    migrated = 0
+    async for conversation in db.conversations.find({"buckets_migrated": {"$ne": True}}, {"_id": 0, "id": 1}):
+        conversation_id = conversation["id"]
+        await db.message_buckets.delete_many({"conversation_id": conversation_id, "migrated": True})
+        messages = []
+        cursor = db.messages.find({"conversation_id": conversation_id}, {"_id": 0}).sort([("timestamp", 1), ("id", 1)])
+        async for message in cursor:
+            messages.append(message)
+            if len(messages) == bucket_size:
+                await db.message_buckets.insert_one(_migrated_bucket(conversation_id, messages))
+                migrated += len(messages)
+                messages = []
+        if messages:
+            await db.message_buckets.insert_one(_migrated_bucket(conversation_id, messages))
+            migrated += len(messages)
+        await db.conversations.update_one({"id": conversation_id}, {"$set": {"buckets_migrated": True}})
+    return migrated
+
+
+async def migrate_profile_images(db: AsyncIOMotorDatabase) -> int:
+    # Replace inline data-URL profile pictures with image store URLs
+    store = create_image_store(**image_store_options())
+    migrated = 0
+    async for user in db.users.find({"profile_pic": {"$regex": "^data:"}}, {"_id": 0, "id": 1, "profile_pic": 1}):
+        try:
+            name = await save_image(store, decode_data_url(user["profile_pic"]))
+        except InvalidImage as e:
+            logger.warning("Leaving profile picture of user %s in place: %s", user["id"], e)
+            continue
+        await db.users.update_one({"id": user["id"]}, {"$set": {"profile_pic": image_url(name)}})
+        migrated += 1
+    return migrated
+
+
+MIGRATIONS: Dict[str, Callable[[AsyncIOMotorDatabase], Awaitable[int]]] = {
+    "conversation_ids": backfill_conversation_ids,
+    # Needs conversation_ids to have run first
+    "conversations": backfill_conversations,
+    "social_edges": migrate_social_graph,
+    "profile_images": migrate_profile_images,
+    # Needs conversations; only run when named
+    "message_buckets": migrate_messages_to_buckets,
+}
+
+# Migrations for opt-in features, skipped unless asked for by name
+OPTIONAL_MIGRATIONS = {"message_buckets"}
+
+
+async def run_migrations(db: AsyncIOMotorDatabase, names=None) -> Dict[str, int]:
+    results = {}
+    for name, migration in MIGRATIONS.items():
+        if names and name not in names:
+            continue
+        if not names and name in OPTIONAL_MIGRATIONS:
+            continue
+        results[name] = await migration(db)
+        logger.info("Migration %s updated %d documents", name, results[name])
+    return results
+
+
+async def _main(names) -> int:
+    root_dir = Path(__file__).parent
+    load_dotenv(root_dir / '.env')
+    client = create_client(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    try:
+        # $merge needs the unique index on conversations.id
+        await ensure_indexes(db)
+        await run_migrations(db, names)
+        return 0
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run DevTinder data migrations")
+    parser.add_argument("names", nargs="*", help="migrations to run (default: all)")
+    args = parser.parse_args()
+    unknown = set(args.names) - set(MIGRATIONS)
+    if unknown:
+        parser.error(f"unknown migrations: {', '.join(sorted(unknown))}")
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(asyncio.run(_main(args.names)))
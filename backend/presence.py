@@ -0,0 +1,122 @@
+"""
+In-memory presence registry with coalesced `is_online`/`last_seen` writes.
+
+Connects and disconnects only touch in-process state. A background task
+flushes the latest state of every changed user to Mongo in one `bulk_write`
+per interval. Going offline is held back for `debounce_seconds`, so a quick
+reconnect (deploy, network flap) never produces a write at all.
+"""
+
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional, Set
+
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+
+logger = logging.getLogger(__name__)
+
+
+class PresenceRegistry:
+    def __init__(self, debounce_seconds: float = 10.0, flush_interval: float = 5.0):
+        self.debounce_seconds = debounce_seconds
+        self.flush_interval = flush_interval
+        self.sockets: Dict[str, int] = {}
+        self.last_seen: Dict[str, datetime] = {}
+        self.offline_since: Dict[str, float] = {}
+        self.dirty: Set[str] = set()
+        # Users whose document already said online when they went offline, so a
+        # reconnect within the debounce window has nothing left to write
+        self.stored_online: Set[str] = set()
+        self.collection = None
+        self.flusher: Optional[asyncio.Task] = None
+
+    def connected(self, user_id: str) -> None:
+        self.sockets[user_id] = self.sockets.get(user_id, 0) + 1
+        self.last_seen[user_id] = datetime.now(timezone.utc)
+        if self.offline_since.pop(user_id, None) is None:
+            self.dirty.add(user_id)
+        elif user_id in self.stored_online:
+            # Cancels a pending offline write: a flap costs nothing
+            self.stored_online.discard(user_id)
+            self.dirty.discard(user_id)
+
+    def disconnected(self, user_id: str) -> None:
+        remaining = self.sockets.get(user_id, 0) - 1
+        self.last_seen[user_id] = datetime.now(timezone.utc)
+        if remaining > 0:
+            self.sockets[user_id] = remaining
+            return
+        self.sockets.pop(user_id, None)
+        self.offline_since[user_id] = time.monotonic()
+        if user_id not in self.dirty:
+            self.stored_online.add(user_id)
+        self.dirty.add(user_id)
+
+    def is_online(self, user_id: str) -> Optional[bool]:
+        # None means this process has no fresher state than the user document
+        if user_id in self.sockets:
+            return True
+        if user_id in self.offline_since:
+            return False
+        return None
+
+    def apply(self, user: Dict) -> Dict:
+        online = self.is_online(user["id"])
+        if online is not None:
+            user["is_online"] = online
+            user["last_seen"] = self.last_seen[user["id"]]
+        return user
+
+    async def start(self, collection) -> None:
+        self.collection = collection
+        self.flusher = asyncio.create_task(self._flush_loop())
+
+    async def stop(self) -> None:
+        if self.flusher is not None:
+            self.flusher.cancel()
+        await self.flush(force=True)
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except PyMongoError:
+                logger.exception("Presence flush failed")
+
+    async def flush(self, force: bool = False) -> int:
+        if self.collection is None:
+            return 0
+        now = time.monotonic()
+        flushed = {}
+        operations = []
+        for user_id in list(self.dirty):
+            offline_since = self.offline_since.get(user_id)
+            if offline_since is not None and not force and now - offline_since < self.debounce_seconds:
+                continue
+            self.dirty.discard(user_id)
+            self.stored_online.discard(user_id)
+            flushed[user_id] = offline_since
+            operations.append(UpdateOne(
+                {"id": user_id},
+                {"$set": {"is_online": offline_since is None, "last_seen": self.last_seen[user_id]}}
+            ))
+        if not operations:
+            return 0
+
+        try:
+            await self.collection.bulk_write(operations, ordered=False)
+        except PyMongoError:
+            self.dirty.update(flushed)
+            raise
+
+        for user_id, offline_since in flushed.items():
+            # Once the offline state is written the document is authoritative again,
+            # unless the user reconnected while the write was in flight
+            if offline_since is not None and self.offline_since.get(user_id) == offline_since:
+                del self.offline_since[user_id]
+                del self.last_seen[user_id]
+        return len(operations)
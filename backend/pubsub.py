@@ -0,0 +1,227 @@
+"""
+Delivery backends for real-time WebSocket messages.
+
+Each process only holds its own sockets. `ConnectionManager` publishes every
+outgoing message to a broker, and the broker hands it back to whichever
+process (or processes) hold a socket for the target user:
+
+- InProcessBroker: single worker, delivers directly (no fan-out)
+- UnixSocketBroker: several workers on one host, datagrams over Unix sockets
+- RedisBroker: several nodes, one pub/sub channel per connected user. Works
+  with `redis.asyncio.Redis`; the in-memory `MemoryPubSubClient` stands in for
+  it in tests and only reaches subscribers in the same process.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import socket
+import uuid
+from collections import defaultdict
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+Deliver = Callable[[str, str], Awaitable[None]]
+
+# Unix datagrams are bounded by the socket send buffer (about 200KB by default);
+# chat messages are capped well below this (MESSAGE_MAX_LENGTH)
+MAX_DATAGRAM_BYTES = 64 * 1024
+
+
+class InProcessBroker:
+    def __init__(self):
+        self.deliver: Optional[Deliver] = None
+
+    async def start(self, deliver: Deliver) -> None:
+        self.deliver = deliver
+
+    async def stop(self) -> None:
+        pass
+
+    async def subscribe(self, user_id: str) -> None:
+        pass
+
+    async def unsubscribe(self, user_id: str) -> None:
+        pass
+
+    async def publish(self, user_id: str, message: str) -> None:
+        await self.deliver(user_id, message)
+
+
+class _DatagramProtocol(asyncio.DatagramProtocol):
+    def __init__(self, broker: "UnixSocketBroker"):
+        self.broker = broker
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        try:
+            envelope = json.loads(data)
+        except ValueError:
+            logger.warning("Dropping malformed broker datagram")
+            return
+        # Every worker receives every datagram; only deliver to users held here
+        if envelope["user_id"] in self.broker.local_users:
+            asyncio.ensure_future(self.broker.deliver(envelope["user_id"], envelope["message"]))
+
+
+class UnixSocketBroker(InProcessBroker):
+    def __init__(self, directory: str):
+        super().__init__()
+        self.directory = Path(directory)
+        self.path = self.directory / f"{os.getpid()}-{uuid.uuid4().hex[:8]}.sock"
+        self.local_users: Set[str] = set()
+        self.transport = None
+        self.sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sender.setblocking(False)
+
+    async def start(self, deliver: Deliver) -> None:
+        await super().start(deliver)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+            lambda: _DatagramProtocol(self), local_addr=str(self.path), family=socket.AF_UNIX
+        )
+
+    async def stop(self) -> None:
+        if self.transport is not None:
+            self.transport.close()
+        self.sender.close()
+        self.path.unlink(missing_ok=True)
+
+    async def subscribe(self, user_id: str) -> None:
+        self.local_users.add(user_id)
+
+    async def unsubscribe(self, user_id: str) -> None:
+        self.local_users.discard(user_id)
+
+    async def publish(self, user_id: str, message: str) -> None:
+        if user_id in self.local_users:
+            await self.deliver(user_id, message)
+
+        data = json.dumps({"user_id": user_id, "message": message}).encode('utf-8')
+        if len(data) > MAX_DATAGRAM_BYTES:
+            # The sender has already persisted the message; other workers' sockets just miss the push
+            logger.warning("Message for %s is %d bytes, too large to fan out to other workers", user_id, len(data))
+            return
+        for peer in self.directory.glob("*.sock"):
+            if peer == self.path:
+                continue
+            try:
+                self.sender.sendto(data, str(peer))
+            except (ConnectionRefusedError, FileNotFoundError):
+                # The worker behind this socket is gone
+                peer.unlink(missing_ok=True)
+            except BlockingIOError:
+                logger.warning("Broker peer %s is not keeping up, dropping message", peer.name)
+            except OSError as e:
+                # e.g. EMSGSIZE; publishing must never fail a request whose message is already stored
+                logger.warning("Could not send to broker peer %s: %s", peer.name, e)
+
+
+class MemoryPubSubClient:
+    """Minimal in-memory stand-in for the parts of redis.asyncio.Redis used by RedisBroker."""
+
+    def __init__(self):
+        self.subscribers: Dict[str, Set["_MemoryPubSub"]] = defaultdict(set)
+
+    def pubsub(self) -> "_MemoryPubSub":
+        return _MemoryPubSub(self)
+
+    async def publish(self, channel: str, data: str) -> int:
+        subscribers = list(self.subscribers.get(channel, ()))
+        for pubsub in subscribers:
+            pubsub.queue.put_nowait({"type": "message", "channel": channel, "data": data})
+        return len(subscribers)
+
+    async def close(self) -> None:
+        pass
+
+
+class _MemoryPubSub:
+    def __init__(self, client: MemoryPubSubClient):
+        self.client = client
+        self.queue: asyncio.Queue = asyncio.Queue()
+
+    async def subscribe(self, *channels: str) -> None:
+        for channel in channels:
+            self.client.subscribers[channel].add(self)
+
+    async def unsubscribe(self, *channels: str) -> None:
+        for channel in channels:
+            self.client.subscribers[channel].discard(self)
+
+    async def get_message(self, ignore_subscribe_messages: bool = False, timeout: float = 0.0):
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def close(self) -> None:
+        for subscribers in self.client.subscribers.values():
+            subscribers.discard(self)
+
+
+class RedisBroker(InProcessBroker):
+    def __init__(self, client, channel_prefix: str = "devtinder:ws:"):
+        super().__init__()
+        self.client = client
+        self.channel_prefix = channel_prefix
+        self.pubsub = None
+        self.reader: Optional[asyncio.Task] = None
+
+    async def start(self, deliver: Deliver) -> None:
+        await super().start(deliver)
+        self.pubsub = self.client.pubsub()
+        self.reader = asyncio.create_task(self._read())
+
+    async def stop(self) -> None:
+        if self.reader is not None:
+            self.reader.cancel()
+        if self.pubsub is not None:
+            await self.pubsub.close()
+        await self.client.close()
+
+    async def _read(self) -> None:
+        while True:
+            try:
+                message = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Pub/sub read failed")
+                await asyncio.sleep(1.0)
+                continue
+            if not message or message.get("type") != "message":
+                continue
+            channel, data = message["channel"], message["data"]
+            if isinstance(channel, bytes):
+                channel = channel.decode('utf-8')
+            if isinstance(data, bytes):
+                data = data.decode('utf-8')
+            await self.deliver(channel[len(self.channel_prefix):], data)
+
+    async def subscribe(self, user_id: str) -> None:
+        await self.pubsub.subscribe(self.channel_prefix + user_id)
+
+    async def unsubscribe(self, user_id: str) -> None:
+        await self.pubsub.unsubscribe(self.channel_prefix + user_id)
+
+    async def publish(self, user_id: str, message: str) -> None:
+        await self.client.publish(self.channel_prefix + user_id, message)
+
+
+def create_broker(kind: str, socket_dir: str = "/tmp/devtinder-ws", redis_url: Optional[str] = None):
+    if kind == "memory":
+        return InProcessBroker()
+    if kind == "unix":
+        return UnixSocketBroker(socket_dir)
+    if kind == "redis":
+        if not redis_url:
+            raise ValueError("WS_BROKER=redis requires REDIS_URL")
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("WS_BROKER=redis requires the 'redis' package")
+        return RedisBroker(redis.from_url(redis_url))
+    raise ValueError(f"Unknown WebSocket broker: {kind}")
@@ -0,0 +1,317 @@
+"""
+Admission control: token-bucket rate limits and a global concurrency cap.
+
+Every HTTP request is assigned a route class by method and path prefix. Each
+class has a token bucket per client: the user id from a valid bearer token,
+otherwise the client IP. Classes marked per-IP (login, signup) always use the
+IP. A request that finds its bucket empty gets 429 with Retry-After. A request
+that is admitted must then get one of `max_concurrent` slots. It may queue
+briefly for a slot, but if the queue is full or the wait times out it gets
+503. Both checks run before the app, so shed load never reaches bcrypt or
+Mongo.
+
+Limits are "<requests>/<seconds>": a bucket holds that many tokens and refills
+at requests/seconds per second. Buckets live in memory per worker
+(`MemoryBucketStore`), or in Redis shared by all workers (`RedisBucketStore`).
+"""
+
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, List, Mapping, Optional, Sequence, Tuple
+
+from serialization import FastJSONResponse
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Limit:
+    rate: float       # tokens added per second
+    capacity: float   # bucket size, i.e. the allowed burst
+
+    @classmethod
+    def parse(cls, value: str) -> "Limit":
+        requests, _, seconds = value.partition("/")
+        return cls(rate=float(requests) / float(seconds or 1), capacity=float(requests))
+
+
+@dataclass(frozen=True)
+class RouteClass:
+    name: str
+    methods: Optional[frozenset]   # None matches every method
+    prefixes: Tuple[str, ...]
+    limit: Optional[Limit]         # None: not rate limited
+    per_ip: bool = False
+
+
+# First match wins; (name, methods, path prefixes, default limit, always keyed by IP)
+DEFAULT_ROUTE_CLASSES = (
+    ("auth", {"POST"}, ("/api/auth/",), "10/60", True),
+    ("feed", {"GET"}, ("/api/feed", "/api/suggestions", "/api/search"), "60/60", False),
+    ("export", {"GET"}, ("/api/export/",), "10/60", False),
+    ("write", {"POST", "PUT", "PATCH", "DELETE"}, ("/api/",), "120/60", False),
+    ("read", None, ("/api/",), "600/60", False),
+)
+
+
+def route_classes(environ: Mapping[str, str] = os.environ) -> List[RouteClass]:
+    # RATE_LIMIT_<CLASS> overrides a default; "off" disables that class
+    classes = []
+    for name, methods, prefixes, default, per_ip in DEFAULT_ROUTE_CLASSES:
+        value = environ.get(f'RATE_LIMIT_{name.upper()}', default)
+        limit = None if value.lower() == 'off' else Limit.parse(value)
+        classes.append(RouteClass(name, frozenset(methods) if methods else None, prefixes, limit, per_ip))
+    return classes
+
+
+class MemoryBucketStore:
+    """Per-process buckets in an LRU dict; each take is O(1).
+
+    A bucket that has been idle long enough to refill is the same as no
+    bucket, so idle keys are dropped from the cold end of the LRU as new keys
+    arrive. `max_keys` caps memory when many clients are all active at once.
+    """
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        # key -> [tokens, last update (monotonic), seconds to refill from empty]
+        self.buckets: "OrderedDict[str, list]" = OrderedDict()
+        self.evictions = 0
+
+    async def take(self, key: str, limit: Limit, cost: float = 1.0) -> Tuple[bool, float]:
+        # Returns (allowed, seconds until `cost` tokens are available)
+        now = time.monotonic()
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = [limit.capacity, now, limit.capacity / limit.rate]
+            self._evict(now)
+        else:
+            bucket[0] = min(limit.capacity, bucket[0] + (now - bucket[1]) * limit.rate)
+            bucket[1] = now
+            self.buckets.move_to_end(key)
+        if bucket[0] >= cost:
+            bucket[0] -= cost
+            return True, 0.0
+        return False, (cost - bucket[0]) / limit.rate
+
+    def _evict(self, now: float) -> None:
+        # Oldest first; stop at the first bucket that has not refilled yet
+        while self.buckets:
+            key, (_, updated, refill_seconds) = next(iter(self.buckets.items()))
+            if len(self.buckets) <= self.max_keys and now - updated < refill_seconds:
+                break
+            del self.buckets[key]
+            self.evictions += 1
+
+    async def close(self) -> None:
+        pass
+
+
+# Atomic refill-and-take; time comes from the Redis server so workers agree on it
+_TAKE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local allowed = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000))
+return {allowed, tostring(tokens)}
+"""
+
+
+class RedisBucketStore:
+    """Buckets shared by every worker; keys expire once they would be full again."""
+
+    def __init__(self, client, key_prefix: str = "devtinder:ratelimit:"):
+        self.client = client
+        self.key_prefix = key_prefix
+        self.script = client.register_script(_TAKE_SCRIPT)
+
+    async def take(self, key: str, limit: Limit, cost: float = 1.0) -> Tuple[bool, float]:
+        allowed, tokens = await self.script(keys=[self.key_prefix + key], args=[limit.rate, limit.capacity, cost])
+        if int(allowed):
+            return True, 0.0
+        return False, (cost - float(tokens)) / limit.rate
+
+    async def close(self) -> None:
+        await self.client.close()
+
+
+def create_bucket_store(kind: str = "memory", redis_url: Optional[str] = None, max_keys: int = 100_000):
+    if kind == "memory":
+        return MemoryBucketStore(max_keys)
+    if kind == "redis":
+        if not redis_url:
+            raise ValueError("RATE_LIMIT_BACKEND=redis requires REDIS_URL")
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("RATE_LIMIT_BACKEND=redis requires the 'redis' package")
+        return RedisBucketStore(redis.from_url(redis_url))
+    raise ValueError(f"Unknown rate limit backend: {kind}")
+
+
+class ConcurrencyLimiter:
+    """Caps requests in flight; a bounded number may wait briefly for a slot."""
+
+    def __init__(self, max_concurrent: int, max_queued: int = 0, queue_timeout: float = 0.5):
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.semaphore = asyncio.Semaphore(max_concurrent)
+        self.in_flight = 0
+        self.queued = 0
+
+    async def acquire(self) -> bool:
+        if self.in_flight < self.max_concurrent and not self.queued:
+            await self.semaphore.acquire()
+        elif self.queued >= self.max_queued:
+            return False
+        else:
+            self.queued += 1
+            acquire = asyncio.ensure_future(self.semaphore.acquire())
+            try:
+                await asyncio.wait_for(asyncio.shield(acquire), self.queue_timeout)
+            except asyncio.TimeoutError:
+                # The permit may be granted just as the wait times out; hand it back
+                # rather than leak it, or the cap would shrink with every such race
+                acquire.cancel()
+                try:
+                    await acquire
+                except asyncio.CancelledError:
+                    return False
+                self.semaphore.release()
+                return False
+            finally:
+                self.queued -= 1
+        self.in_flight += 1
+        return True
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self.semaphore.release()
+
+
+def forwarded_for(scope) -> bool:
+    return any(name == b"x-forwarded-for" for name, _ in scope.get("headers", ()))
+
+
+def client_ip(scope, trusted_proxies: int = 0) -> str:
+    # Each proxy appends the address it received the request from, and anything to
+    # the left of what our own proxies appended is client-controlled. With N trusted
+    # proxies in front of the app, the client is the N-th entry from the right.
+    if trusted_proxies > 0:
+        for name, value in scope.get("headers", ()):
+            if name == b"x-forwarded-for":
+                entries = [entry.strip() for entry in value.decode("latin-1").split(",") if entry.strip()]
+                if entries:
+                    return entries[-min(trusted_proxies, len(entries))]
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+def user_key(class_name: str, user_id: str) -> str:
+    return f"{class_name}:user:{user_id}"
+
+
+async def take_token(store, route_class: RouteClass, key: str) -> Tuple[bool, float]:
+    try:
+        return await store.take(key, route_class.limit)
+    except Exception:
+        # A shared store outage should not take the API down with it
+        logger.exception("Rate limit store failed; admitting request")
+        return True, 0.0
+
+
+def bearer_token(scope) -> Optional[str]:
+    for name, value in scope.get("headers", ()):
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            return token.strip() if scheme.lower() == "bearer" and token else None
+    return None
+
+
+class AdmissionMiddleware:
+    """ASGI middleware applying the route-class rate limits, then the concurrency cap."""
+
+    def __init__(self, app, classes: Sequence[RouteClass], store, identify: Callable[[str], Optional[str]],
+                 limiter: Optional[ConcurrencyLimiter] = None, rejected=None,
+                 skip_paths: Sequence[str] = (), trusted_proxies: int = 0):
+        self.app = app
+        self.classes = list(classes)
+        self.store = store
+        # Token -> user id, or None when the token is not valid
+        self.identify = identify
+        self.limiter = limiter
+        self.rejected = rejected
+        self.skip_paths = set(skip_paths)
+        self.trusted_proxies = trusted_proxies
+        self.warned_untrusted_proxy = False
+
+    def route_class(self, method: str, path: str) -> Optional[RouteClass]:
+        for route_class in self.classes:
+            if (route_class.methods is None or method in route_class.methods) and path.startswith(route_class.prefixes):
+                return route_class
+        return None
+
+    def client_key(self, scope, route_class: RouteClass) -> str:
+        if not route_class.per_ip:
+            token = bearer_token(scope)
+            user_id = self.identify(token) if token else None
+            if user_id is not None:
+                return user_key(route_class.name, user_id)
+        if not self.trusted_proxies and not self.warned_untrusted_proxy and forwarded_for(scope):
+            # Behind a proxy every client arrives from its address and shares one bucket
+            self.warned_untrusted_proxy = True
+            logger.warning("Requests carry X-Forwarded-For but RATE_LIMIT_TRUSTED_PROXIES is 0; "
+                           "IP-keyed limits apply to the proxy's address, shared by all clients")
+        return f"{route_class.name}:ip:{client_ip(scope, self.trusted_proxies)}"
+
+    def _reject(self, reason: str, route_class: str, status_code: int, detail: str, retry_after: float):
+        if self.rejected is not None:
+            self.rejected.inc(reason, route_class)
+        return FastJSONResponse(
+            {"detail": detail}, status_code=status_code, headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.skip_paths:
+            await self.app(scope, receive, send)
+            return
+
+        route_class = self.route_class(scope["method"], scope["path"])
+        class_name = route_class.name if route_class is not None else "other"
+        if route_class is not None and route_class.limit is not None:
+            allowed, retry_after = await take_token(self.store, route_class, self.client_key(scope, route_class))
+            if not allowed:
+                response = self._reject("rate_limited", class_name, 429, "Too many requests", retry_after)
+                await response(scope, receive, send)
+                return
+
+        if self.limiter is None:
+            await self.app(scope, receive, send)
+            return
+        if not await self.limiter.acquire():
+            response = self._reject("overloaded", class_name, 503, "Server is busy, try again shortly",
+                                    self.limiter.queue_timeout)
+            await response(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.limiter.release()
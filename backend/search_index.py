@@ -0,0 +1,127 @@
+"""
+In-memory inverted index over user skills, interests and names.
+
+Each term ("skill:python", "name:alice") maps to a sorted int32 posting list
+of document ids (the feed ranker's row surrogates). Multi-term queries
+intersect posting lists smallest-first. Each field also keeps a sorted
+vocabulary so autocomplete is a binary search for the prefix range.
+"""
+
+import bisect
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+FIELDS = ("skill", "interest", "name")
+
+_EMPTY = np.zeros(0, dtype=np.int32)
+
+
+def normalize(value: str) -> str:
+    return " ".join(value.lower().split())
+
+
+class SearchIndex:
+    def __init__(self):
+        self.postings: Dict[str, np.ndarray] = {}
+        self.doc_terms: Dict[int, Set[str]] = {}
+        # Sorted vocabulary per field, plus the first spelling seen for display
+        self.vocabulary: Dict[str, List[str]] = {field: [] for field in FIELDS}
+        self.display: Dict[str, str] = {}
+
+    def __len__(self) -> int:
+        return len(self.doc_terms)
+
+    def _terms(self, skills: Iterable[str], interests: Iterable[str], name: str) -> Dict[str, str]:
+        terms = {}
+        for field, values in (("skill", skills), ("interest", interests), ("name", (name or "").split())):
+            for value in values:
+                term = normalize(value or "")
+                if term:
+                    terms.setdefault(f"{field}:{term}", value.strip())
+        return terms
+
+    def upsert(self, doc: int, skills: Iterable[str], interests: Iterable[str], name: str) -> None:
+        terms = self._terms(skills, interests, name)
+        old_terms = self.doc_terms.get(doc, set())
+        for key in old_terms - terms.keys():
+            postings = self.postings[key]
+            self.postings[key] = postings[postings != doc]
+        for key in terms.keys() - old_terms:
+            postings = self.postings.get(key)
+            if postings is None:
+                postings = _EMPTY
+                field, term = key.split(":", 1)
+                bisect.insort(self.vocabulary[field], term)
+                self.display[key] = terms[key]
+            position = int(np.searchsorted(postings, doc))
+            self.postings[key] = np.insert(postings, position, doc)
+        self.doc_terms[doc] = set(terms)
+
+    def load(self, docs: Iterable[Tuple[int, Iterable[str], Iterable[str], str]]) -> None:
+        # Bulk build for many new documents: gather ids per term, then sort each
+        # posting list and the vocabulary once instead of inserting one at a time.
+        # Documents already in the index go through upsert().
+        gathered: Dict[str, List[int]] = {}
+        for doc, skills, interests, name in docs:
+            if doc in self.doc_terms:
+                self.upsert(doc, skills, interests, name)
+                continue
+            terms = self._terms(skills, interests, name)
+            for key, display in terms.items():
+                gathered.setdefault(key, []).append(doc)
+                self.display.setdefault(key, display)
+            self.doc_terms[doc] = set(terms)
+
+        new_terms: Dict[str, List[str]] = {field: [] for field in FIELDS}
+        for key, doc_ids in gathered.items():
+            added = np.array(doc_ids, dtype=np.int32)
+            postings = self.postings.get(key)
+            if postings is None:
+                field, term = key.split(":", 1)
+                new_terms[field].append(term)
+                self.postings[key] = np.unique(added)
+            else:
+                self.postings[key] = np.union1d(postings, added)
+        for field, terms in new_terms.items():
+            if terms:
+                self.vocabulary[field] = sorted(self.vocabulary[field] + terms)
+
+    def _prefix_terms(self, field: str, prefix: str) -> List[str]:
+        vocabulary = self.vocabulary[field]
+        start = bisect.bisect_left(vocabulary, prefix)
+        end = bisect.bisect_left(vocabulary, prefix + "\uffff")
+        return vocabulary[start:end]
+
+    def search(self, skills: Iterable[str] = (), interests: Iterable[str] = (),
+               name_prefix: Optional[str] = None) -> np.ndarray:
+        lists = []
+        for field, values in (("skill", skills), ("interest", interests)):
+            for value in values:
+                lists.append(self.postings.get(f"{field}:{normalize(value)}", _EMPTY))
+        if name_prefix and normalize(name_prefix):
+            # Every word of the query must prefix-match some word of the name
+            for word in normalize(name_prefix).split():
+                matches = [self.postings[f"name:{term}"] for term in self._prefix_terms("name", word)]
+                lists.append(np.unique(np.concatenate(matches)) if matches else _EMPTY)
+        if not lists:
+            return _EMPTY
+
+        # Intersect smallest first so the working set only shrinks
+        lists.sort(key=len)
+        result = lists[0]
+        for postings in lists[1:]:
+            if len(result) == 0:
+                break
+            result = np.intersect1d(result, postings, assume_unique=True)
+        return result
+
+    def autocomplete(self, field: str, prefix: str, limit: int = 10) -> List[Tuple[str, int]]:
+        # Matching terms, most used first
+        matches = [
+            (self.display[f"{field}:{term}"], len(self.postings[f"{field}:{term}"]))
+            for term in self._prefix_terms(field, normalize(prefix))
+        ]
+        matches = [match for match in matches if match[1] > 0]
+        matches.sort(key=lambda match: -match[1])
+        return matches[:limit]
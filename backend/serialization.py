@@ -0,0 +1,66 @@
+"""
+Fast JSON serialization shared by HTTP responses and WebSocket pushes.
+
+List endpoints validate Mongo documents once into their Pydantic model,
+dump them in JSON mode with pydantic-core and encode with orjson, returning
+the bytes directly so FastAPI does not validate and encode them a second
+time. Models are always dumped in JSON mode, so datetimes are formatted the
+same way on every HTTP and WebSocket path: UTC with a "Z" suffix. Mongo
+stores UTC, so a naive datetime (from a client without tz_aware, or an
+archive file) is taken to be UTC as well.
+"""
+
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Annotated, Any, Iterable, List, Type
+
+import orjson
+from fastapi.responses import Response
+from pydantic import AfterValidator, BaseModel, TypeAdapter
+
+# Bare datetimes: naive values are UTC, and UTC gets a "Z" suffix, matching UTCDateTime
+ORJSON_OPTIONS = orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z
+
+
+def _assume_utc(value: datetime) -> datetime:
+    return value if value.tzinfo is not None else value.replace(tzinfo=timezone.utc)
+
+
+# Model field type for stored timestamps; naive values are read as UTC
+UTCDateTime = Annotated[datetime, AfterValidator(_assume_utc)]
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, BaseModel):
+        return obj.model_dump(mode="json")
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(content, default=_default, option=ORJSON_OPTIONS)
+
+
+def dumps_text(content: Any) -> str:
+    # WebSocket text frames
+    return dumps(content).decode('utf-8')
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+@lru_cache(maxsize=None)
+def _list_adapter(model: Type[BaseModel]) -> TypeAdapter:
+    return TypeAdapter(List[model])
+
+
+def dump_models(model: Type[BaseModel], documents: Iterable[Any]) -> List[dict]:
+    adapter = _list_adapter(model)
+    return adapter.dump_python(adapter.validate_python(list(documents)), mode="json")
+
+
+def model_list_response(model: Type[BaseModel], documents: Iterable[Any]) -> FastJSONResponse:
+    return FastJSONResponse(dump_models(model, documents))
@@ -1,30 +1,74 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, WebSocket, WebSocketDisconnect, status
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, WebSocket, WebSocketDisconnect, Query, Request, UploadFile, File, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.responses import Response, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
 import os
+import inspect
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field, EmailStr
+from pydantic import BaseModel, Field, EmailStr, ValidationError
+from pymongo.errors import DuplicateKeyError
 from typing import List, Optional, Dict, Any
 import uuid
 from datetime import datetime, timezone, timedelta
-import bcrypt
 import jwt
 from jwt import PyJWTError
 import json
+import base64
+from indexes import ensure_indexes, explain_query_shapes
+from migrate import MESSAGE_PREVIEW_LENGTH, conversation_id_for, run_migrations
+from feed_ranking import FeedRanker
+from swipes import SwipeHistory
+from passwords import PasswordHasher, PasswordHasherBusy
+from user_cache import UserCache
+from pubsub import create_broker
+from presence import PresenceRegistry
+from sockets import OutboundSocket
+from message_writer import MessageRejected, MessageWriter
+from graph_engine import ConnectionGraph
+from search_index import FIELDS as SEARCH_FIELDS, SearchIndex
+from serialization import FastJSONResponse, UTCDateTime, dump_models, dumps_text, model_list_response
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, MongoCommandMetrics, Registry, RequestMetricsMiddleware
+from database import create_client, list_read_preference, warm_up
+from export import account_records, conversation_records, ndjson_stream
+from message_store import create_message_store, store_options
+from etags import etag_matches, make_etag, not_modified, with_etag
+from rate_limit import AdmissionMiddleware, ConcurrencyLimiter, create_bucket_store, route_classes, take_token, user_key
+from images import (
+    CACHE_CONTROL as IMAGE_CACHE_CONTROL, MAX_IMAGE_BYTES, NAME_PATTERN as IMAGE_NAME_PATTERN, THUMBNAIL_SIZES,
+    InvalidImage, UnsatisfiableRange, content_type as image_content_type, create_image_store, decode_data_url,
+    image_store_options, image_url, parse_range, save_image, thumbnail_name
+)
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
+# Metrics, served in Prometheus text format at /metrics
+metrics = Registry()
+http_requests = metrics.counter("http_requests_total", "HTTP requests by route and status", ("method", "route", "status"))
+http_latency = metrics.histogram("http_request_duration_seconds", "HTTP request latency by route", ("method", "route"))
+mongo_latency = metrics.histogram("mongodb_command_duration_seconds", "MongoDB command latency", ("collection", "command"))
+mongo_failures = metrics.counter("mongodb_command_failures_total", "Failed MongoDB commands", ("collection", "command"))
+ws_published = metrics.counter("websocket_messages_published_total", "Messages published to WebSocket recipients")
+ws_delivered = metrics.counter("websocket_messages_delivered_total", "Messages queued on this worker's WebSocket connections")
+http_rejected = metrics.counter("http_requests_rejected_total", "Requests shed by admission control", ("reason", "route_class"))
+
+# MongoDB connection; the client is created and warmed up at startup.
+# Pool size, timeouts, compression and read preference come from MONGO_* variables (see database.py)
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+DB_NAME = os.environ['DB_NAME']
+MONGO_LIST_READ_PREFERENCE = list_read_preference()
+client = None
+db = None
+# Listing endpoints (feed, connections, search) read through this handle, which may prefer secondaries
+list_db = None
+MONGO_ENSURE_INDEXES = os.environ.get('MONGO_ENSURE_INDEXES', 'true').lower() == 'true'
+MONGO_EXPLAIN_QUERIES = os.environ.get('MONGO_EXPLAIN_QUERIES', 'false').lower() == 'true'
+MONGO_RUN_MIGRATIONS = os.environ.get('MONGO_RUN_MIGRATIONS', 'false').lower() == 'true'
 
-# Create the main app without a prefix
-app = FastAPI()
+# Create the main app without a prefix; responses are encoded with orjson
+app = FastAPI(default_response_class=FastJSONResponse)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -34,34 +78,166 @@ JWT_SECRET = "devtinder_secret_key_2025"
 JWT_ALGORITHM = "HS256"
 JWT_EXPIRATION_HOURS = 24
 
+# Message persistence: "sync" (insert_one per message) or "batched" (write-behind insert_many)
+message_writer = MessageWriter(
+    mode=os.environ.get('MESSAGE_WRITE_MODE', 'sync'),
+    batch_size=int(os.environ.get('MESSAGE_WRITE_BATCH_SIZE', '100')),
+    flush_interval=float(os.environ.get('MESSAGE_WRITE_FLUSH_SECONDS', '0.05'))
+)
+
+# Message storage layout and archival (MESSAGE_STORAGE, MESSAGE_BUCKET_SIZE, MESSAGE_ARCHIVE_*; see message_store.py)
+MESSAGE_STORE_OPTIONS = store_options()
+message_store = None
+
+# Profile images live outside user documents (IMAGE_STORE, IMAGE_STORE_DIR, IMAGE_STORE_BUCKET; see images.py)
+image_store = create_image_store(**image_store_options())
+
+# Feed
+FEED_SIZE = 20
+# Feed score weight of each mutual connection, relative to one shared skill/interest
+FEED_MUTUAL_WEIGHT = int(os.environ.get('FEED_MUTUAL_WEIGHT', '1'))
+# How far back each incremental profile sync re-reads, to cover clock skew between workers
+FEED_SYNC_OVERLAP = timedelta(seconds=float(os.environ.get('FEED_SYNC_OVERLAP_SECONDS', '2')))
+
+# Social graph
+EDGE_PENDING = "pending"
+EDGE_ACCEPTED = "accepted"
+CONNECTIONS_PAGE_SIZE = 50
+CONNECTIONS_MAX_PAGE_SIZE = 200
+
+# Longest accepted chat message, in characters; keeps documents and broker frames small
+MESSAGE_MAX_LENGTH = int(os.environ.get('MESSAGE_MAX_LENGTH', '4000'))
+
+# Chat history pagination
+CHAT_PAGE_SIZE = 50
+CHAT_MAX_PAGE_SIZE = 200
+
 # Security
 security = HTTPBearer()
 
+# Password hashing runs on a bounded thread pool off the event loop
+password_hasher = PasswordHasher(
+    rounds=int(os.environ.get('BCRYPT_ROUNDS', '12')),
+    max_workers=int(os.environ.get('PASSWORD_HASH_WORKERS', '4')),
+    max_pending=int(os.environ.get('PASSWORD_HASH_MAX_PENDING', '64'))
+)
+
+# Cache of authenticated user records, invalidated by every handler that writes a user
+user_cache = UserCache(
+    max_size=int(os.environ.get('USER_CACHE_SIZE', '10000')),
+    ttl_seconds=float(os.environ.get('USER_CACHE_TTL_SECONDS', '30'))
+)
+
+# Known connected (user, other) pairs, so the chat connection check rarely hits Mongo
+connected_pairs = UserCache(
+    max_size=int(os.environ.get('CONNECTION_CACHE_SIZE', '100000')),
+    ttl_seconds=float(os.environ.get('CONNECTION_CACHE_TTL_SECONDS', '3600'))
+)
+
+# Online status lives in memory; last_seen is flushed to Mongo in batches
+presence = PresenceRegistry(
+    debounce_seconds=float(os.environ.get('PRESENCE_DEBOUNCE_SECONDS', '10')),
+    flush_interval=float(os.environ.get('PRESENCE_FLUSH_SECONDS', '5'))
+)
+
 # WebSocket connection manager
+# Only sockets held by this process are tracked here; deliveries go through
+# the broker so they reach users connected to other workers or nodes.
 class ConnectionManager:
-    def __init__(self):
-        self.active_connections: Dict[str, WebSocket] = {}
+    def __init__(self, broker, max_queue: int = 256, slow_consumer_policy: str = "disconnect"):
+        # A user may hold several sockets (tabs, devices)
+        self.active_connections: Dict[str, List[OutboundSocket]] = {}
+        self.broker = broker
+        self.max_queue = max_queue
+        self.slow_consumer_policy = slow_consumer_policy
         
-    async def connect(self, websocket: WebSocket, user_id: str):
+    async def connect(self, websocket: WebSocket, user_id: str) -> OutboundSocket:
         await websocket.accept()
-        self.active_connections[user_id] = websocket
+        connection = OutboundSocket(websocket, self.max_queue, self.slow_consumer_policy)
+        if user_id not in self.active_connections:
+            self.active_connections[user_id] = []
+            await self.broker.subscribe(user_id)
+        self.active_connections[user_id].append(connection)
         # Update user online status
-        await db.users.update_one(
-            {"id": user_id},
-            {"$set": {"is_online": True, "last_seen": datetime.now(timezone.utc)}}
-        )
+        presence.connected(user_id)
+        return connection
         
-    def disconnect(self, user_id: str):
-        if user_id in self.active_connections:
-            del self.active_connections[user_id]
+    async def disconnect(self, user_id: str, connection: OutboundSocket):
+        connection.discard()
+        connections = self.active_connections.get(user_id, [])
+        if connection in connections:
+            connections.remove(connection)
+            if not connections:
+                del self.active_connections[user_id]
+                await self.broker.unsubscribe(user_id)
         # Update user offline status (will be done in disconnect handler)
         
     async def send_personal_message(self, message: str, user_id: str):
-        if user_id in self.active_connections:
-            websocket = self.active_connections[user_id]
-            await websocket.send_text(message)
+        ws_published.inc()
+        await self.broker.publish(user_id, message)
+
+    async def deliver_local(self, user_id: str, message: str):
+        # Only enqueues; each socket's writer task does the actual send
+        connections = self.active_connections.get(user_id, [])
+        for connection in connections:
+            connection.send(message)
+        if connections:
+            ws_delivered.inc(amount=len(connections))
 
-manager = ConnectionManager()
+# WS_BROKER: memory (single worker), unix (workers on one host) or redis (several nodes)
+ws_broker = create_broker(
+    os.environ.get('WS_BROKER', 'memory'),
+    socket_dir=os.environ.get('WS_BROKER_SOCKET_DIR', '/tmp/devtinder-ws'),
+    redis_url=os.environ.get('REDIS_URL')
+)
+# WS_SLOW_CONSUMER_POLICY: drop (oldest queued message) or disconnect
+manager = ConnectionManager(
+    ws_broker,
+    max_queue=int(os.environ.get('WS_SEND_QUEUE_SIZE', '256')),
+    slow_consumer_policy=os.environ.get('WS_SLOW_CONSUMER_POLICY', 'disconnect')
+)
+
+# Admission control (see rate_limit.py). Token buckets per user, or per IP before
+# login, for each route class (RATE_LIMIT_AUTH, _FEED, _EXPORT, _WRITE, _READ as
+# "<requests>/<seconds>" or "off"); RATE_LIMIT_BACKEND=redis shares them between workers
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+rate_limit_buckets = create_bucket_store(
+    os.environ.get('RATE_LIMIT_BACKEND', 'memory'),
+    redis_url=os.environ.get('REDIS_URL'),
+    max_keys=int(os.environ.get('RATE_LIMIT_MAX_KEYS', '100000'))
+)
+RATE_LIMIT_CLASSES = route_classes() if RATE_LIMIT_ENABLED else []
+# Chat messages sent over the WebSocket draw from the same per-user bucket as POST /api/chat/send
+WS_SEND_CLASS = next((route_class for route_class in RATE_LIMIT_CLASSES
+                      if route_class.name == "write" and route_class.limit is not None), None)
+# Proxies in front of the app that append to X-Forwarded-For (0: use the socket address)
+RATE_LIMIT_TRUSTED_PROXIES = int(os.environ.get('RATE_LIMIT_TRUSTED_PROXIES', '0'))
+# Requests in flight per worker; beyond that a few may queue briefly, the rest get 503 (0 disables)
+MAX_CONCURRENT_REQUESTS = int(os.environ.get('MAX_CONCURRENT_REQUESTS', '256'))
+request_limiter = ConcurrencyLimiter(
+    MAX_CONCURRENT_REQUESTS,
+    max_queued=int(os.environ.get('MAX_QUEUED_REQUESTS', '256')),
+    queue_timeout=float(os.environ.get('REQUEST_QUEUE_TIMEOUT_SECONDS', '1.0'))
+) if MAX_CONCURRENT_REQUESTS > 0 else None
+
+# Skill/interest ranking index for the feed, loaded at startup
+feed_ranker = FeedRanker()
+
+# Users each user has already swiped on, as sorted arrays of ranker rows
+swipe_history = SwipeHistory(
+    max_users=int(os.environ.get('SWIPE_HISTORY_SIZE', '100000')),
+    ttl_seconds=float(os.environ.get('SWIPE_HISTORY_TTL_SECONDS', '30'))
+)
+
+# Accepted connections in CSR form, keyed by the same ranker rows
+connection_graph = ConnectionGraph()
+
+# Skill/interest/name search, keyed by the same ranker rows
+search_index = SearchIndex()
+
+def index_user_profile(user_id: str, name: str, skills: List[str], interests: List[str]):
+    feed_ranker.upsert(user_id, skills, interests)
+    search_index.upsert(feed_ranker.row_for(user_id), skills, interests, name)
 
 # Define Models
 class UserCreate(BaseModel):
@@ -89,12 +265,11 @@ class User(BaseModel):
     skills: List[str] = []
     interests: List[str] = []
     profile_pic: Optional[str] = None
-    connections: List[str] = []
-    friend_requests_sent: List[str] = []
-    friend_requests_received: List[str] = []
     is_online: bool = False
-    last_seen: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
-    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    last_seen: UTCDateTime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    created_at: UTCDateTime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    # Last profile change; other workers pick changes up by it (sync_feed_ranker)
+    updated_at: UTCDateTime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class UserResponse(BaseModel):
     id: str
@@ -104,23 +279,98 @@ class UserResponse(BaseModel):
     skills: List[str] = []
     interests: List[str] = []
     profile_pic: Optional[str] = None
-    connections: List[str] = []
-    friend_requests_sent: List[str] = []
-    friend_requests_received: List[str] = []
     is_online: bool = False
-    last_seen: datetime
-    created_at: datetime
+    last_seen: UTCDateTime
+    created_at: UTCDateTime
+    # Profile version for ETags (see etags.py); not part of the API
+    version: int = Field(0, exclude=True)
+
+# The social graph lives in db.edges; legacy arrays are never loaded with a user
+USER_RESPONSE_PROJECTION = {
+    "_id": 0, "password": 0, "connections": 0, "friend_requests_sent": 0, "friend_requests_received": 0
+}
+
+# Compact card used by list endpoints; the full profile is fetched on demand
+class ProfileCard(BaseModel):
+    id: str
+    name: str
+    bio: Optional[str] = ""
+    skills: List[str] = []
+    interests: List[str] = []
+    profile_pic: Optional[str] = None
+
+class UserSummary(ProfileCard):
+    is_online: bool = False
+    last_seen: Optional[UTCDateTime] = None
+
+# Another user's profile page; email and other account fields stay with /api/profile
+class PublicProfile(UserSummary):
+    created_at: UTCDateTime
+
+# Online status on its own, for lists whose cards are cached by ETag
+class UserPresence(BaseModel):
+    id: str
+    is_online: bool = False
+    last_seen: Optional[UTCDateTime] = None
+
+PROFILE_CARD_PROJECTION = {"_id": 0, "id": 1, "name": 1, "bio": 1, "skills": 1, "interests": 1, "profile_pic": 1}
+USER_SUMMARY_PROJECTION = {**PROFILE_CARD_PROJECTION, "is_online": 1, "last_seen": 1}
+PUBLIC_PROFILE_PROJECTION = {**USER_SUMMARY_PROJECTION, "created_at": 1}
+USER_PRESENCE_PROJECTION = {"_id": 0, "id": 1, "is_online": 1, "last_seen": 1}
+
+# profile_pic holds /api/images/<sha256>.<ext>; thumbnails are keyed by edge length in pixels
+class ProfileImage(BaseModel):
+    profile_pic: str
+    thumbnails: Dict[str, str]
+
+class Suggestion(UserSummary):
+    mutual_count: int = 0
+
+class SearchSuggestion(BaseModel):
+    term: str
+    count: int
+
+class MutualConnections(BaseModel):
+    user_id: str
+    count: int
+    user_ids: List[str] = []
+
+def message_timestamp() -> datetime:
+    # Mongo keeps milliseconds; trimming up front makes the ack, the push and history agree
+    now = datetime.now(timezone.utc)
+    return now.replace(microsecond=now.microsecond // 1000 * 1000)
 
 class Message(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    conversation_id: Optional[str] = None
     sender_id: str
     receiver_id: str
     text: str
-    timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    timestamp: UTCDateTime = Field(default_factory=message_timestamp)
+
+class MessagePage(BaseModel):
+    messages: List[Message]
+    # Pass as `before` to load older messages, or as `after` to poll for newer ones
+    before_cursor: Optional[str] = None
+    after_cursor: Optional[str] = None
+    has_more: bool = False
+
+class LastMessage(BaseModel):
+    id: str
+    sender_id: str
+    text: str
+    timestamp: UTCDateTime
+
+class Conversation(BaseModel):
+    conversation_id: str
+    participant_id: str
+    last_message: Optional[LastMessage] = None
+    unread_count: int = 0
+    updated_at: UTCDateTime
 
 class MessageCreate(BaseModel):
     receiver_id: str
-    text: str
+    text: str = Field(max_length=MESSAGE_MAX_LENGTH)
 
 class FriendRequestResponse(BaseModel):
     success: bool
@@ -132,11 +382,17 @@ class TokenResponse(BaseModel):
     user: UserResponse
 
 # Helper functions
-def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+async def hash_password(password: str) -> str:
+    try:
+        return await password_hasher.hash(password)
+    except PasswordHasherBusy:
+        raise HTTPException(status_code=503, detail="Server busy, please retry", headers={"Retry-After": "1"})
 
-def verify_password(password: str, hashed: str) -> bool:
-    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+async def verify_password(password: str, hashed: str) -> bool:
+    try:
+        return await password_hasher.verify(password, hashed)
+    except PasswordHasherBusy:
+        raise HTTPException(status_code=503, detail="Server busy, please retry", headers={"Retry-After": "1"})
 
 def create_jwt_token(user_id: str) -> str:
     payload = {
@@ -145,21 +401,53 @@ def create_jwt_token(user_id: str) -> str:
     }
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+def encode_message_cursor(message: Dict[str, Any]) -> str:
+    raw = f"{message['timestamp'].isoformat()}|{message['id']}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('utf-8')
+
+def decode_message_cursor(cursor: str):
+    try:
+        timestamp, message_id = base64.urlsafe_b64decode(cursor.encode('utf-8')).decode('utf-8').split("|", 1)
+        return datetime.fromisoformat(timestamp), message_id
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def rate_limit_identity(token: str) -> Optional[str]:
+    # Signature check only; rate limiting must not cost a Mongo read
+    try:
+        return decode_jwt_token(token)
+    except HTTPException:
+        return None
+
+def decode_jwt_token(token: str) -> str:
     try:
-        token = credentials.credentials
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        user_id = payload.get("user_id")
-        if user_id is None:
-            raise HTTPException(status_code=401, detail="Invalid token")
-        
-        user = await db.users.find_one({"id": user_id})
-        if user is None:
-            raise HTTPException(status_code=401, detail="User not found")
-        
-        return UserResponse(**user)
     except PyJWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
+    user_id = payload.get("user_id")
+    if user_id is None:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    return user_id
+
+async def get_user_by_id(user_id: str) -> Optional[UserResponse]:
+    cached_user = user_cache.get(user_id)
+    if cached_user is not None:
+        return cached_user
+    
+    user = await db.users.find_one({"id": user_id}, USER_RESPONSE_PROJECTION)
+    if user is None:
+        return None
+    
+    user_response = UserResponse(**user)
+    user_cache.set(user_id, user_response)
+    return user_response
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    user_id = decode_jwt_token(credentials.credentials)
+    user = await get_user_by_id(user_id)
+    if user is None:
+        raise HTTPException(status_code=401, detail="User not found")
+    return user
 
 # Auth endpoints
 @api_router.post("/auth/signup", response_model=TokenResponse)
@@ -170,14 +458,18 @@ async def signup(user_data: UserCreate):
         raise HTTPException(status_code=400, detail="Email already registered")
     
     # Create new user
-    hashed_password = hash_password(user_data.password)
+    hashed_password = await hash_password(user_data.password)
     user_dict = user_data.dict()
     user_dict["password"] = hashed_password
     user = User(**user_dict)
     
-    # Save to database
+    # Save to database; the unique email index settles concurrent signups with the same email
     user_doc = user.dict()
-    await db.users.insert_one(user_doc)
+    try:
+        await db.users.insert_one(user_doc)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Email already registered")
+    index_user_profile(user.id, user.name, user.skills, user.interests)
     
     # Create token
     token = create_jwt_token(user.id)
@@ -192,13 +484,26 @@ async def signup(user_data: UserCreate):
 @api_router.post("/auth/login", response_model=TokenResponse)
 async def login(login_data: UserLogin):
     # Find user by email
-    user = await db.users.find_one({"email": login_data.email})
+    user = await db.users.find_one(
+        {"email": login_data.email},
+        {"connections": 0, "friend_requests_sent": 0, "friend_requests_received": 0}
+    )
     if not user:
         raise HTTPException(status_code=401, detail="Invalid email or password")
     
     # Verify password
-    if not verify_password(login_data.password, user["password"]):
+    if not await verify_password(login_data.password, user["password"]):
         raise HTTPException(status_code=401, detail="Invalid email or password")
+
+    # Upgrade the stored hash when the configured bcrypt cost has changed. Best effort:
+    # with the hashing pool saturated, skip it (the next login retries) rather than fail a valid login
+    if password_hasher.needs_rehash(user["password"]):
+        try:
+            new_hash = await password_hasher.hash(login_data.password)
+        except PasswordHasherBusy:
+            new_hash = None
+        if new_hash is not None:
+            await db.users.update_one({"id": user["id"]}, {"$set": {"password": new_hash}})
     
     # Create token
     token = create_jwt_token(user["id"])
@@ -212,33 +517,319 @@ async def login(login_data: UserLogin):
 
 # Profile endpoints
 @api_router.get("/profile", response_model=UserResponse)
-async def get_profile(current_user: UserResponse = Depends(get_current_user)):
-    return current_user
+async def get_profile(request: Request, current_user: UserResponse = Depends(get_current_user)):
+    # The tag comes from the same cached record as the body, so no Mongo read either way
+    etag = make_etag("profile", current_user.id, current_user.version, current_user.is_online, current_user.last_seen)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return not_modified(etag)
+    return with_etag(FastJSONResponse(dump_models(UserResponse, [current_user])[0]), etag)
 
 @api_router.put("/profile", response_model=UserResponse)
 async def update_profile(profile_data: UserProfile, current_user: UserResponse = Depends(get_current_user)):
     # Update user profile
     update_data = profile_data.dict()
+    update_data["updated_at"] = datetime.now(timezone.utc)
+    # Inline data URLs are moved to the image store so user documents stay small
+    if update_data["profile_pic"] and update_data["profile_pic"].startswith("data:"):
+        try:
+            update_data["profile_pic"] = image_url(await save_image(image_store, decode_data_url(update_data["profile_pic"])))
+        except InvalidImage as e:
+            raise HTTPException(status_code=400, detail=str(e))
     await db.users.update_one(
         {"id": current_user.id},
-        {"$set": update_data}
+        {"$set": update_data, "$inc": {"version": 1}}
     )
+    index_user_profile(current_user.id, profile_data.name, profile_data.skills, profile_data.interests)
+    await bump_connection_versions(await connection_ids([current_user.id]))
     
     # Return updated user
-    updated_user = await db.users.find_one({"id": current_user.id})
-    return UserResponse(**updated_user)
+    updated_user = await db.users.find_one({"id": current_user.id}, USER_RESPONSE_PROJECTION)
+    user_response = UserResponse(**updated_user)
+    user_cache.set(current_user.id, user_response)
+    return user_response
+
+def profile_image(name: str) -> ProfileImage:
+    return ProfileImage(
+        profile_pic=image_url(name),
+        thumbnails={str(size): image_url(thumbnail_name(name, size)) for size in THUMBNAIL_SIZES}
+    )
+
+@api_router.post("/profile/image", response_model=ProfileImage)
+async def upload_profile_image(
+    request: Request,
+    file: Optional[UploadFile] = File(None),
+    current_user: UserResponse = Depends(get_current_user)
+):
+    # Either a multipart form with a "file" field (browser forms), or the raw image
+    # as the body with an image/* Content-Type
+    body = bytearray()
+    if file is not None:
+        if not (file.content_type or "").startswith("image/"):
+            raise HTTPException(status_code=415, detail="The uploaded file must be an image")
+        while chunk := await file.read(64 * 1024):
+            body.extend(chunk)
+            if len(body) > MAX_IMAGE_BYTES:
+                raise HTTPException(status_code=413, detail="Image is too large")
+    elif request.headers.get("content-type", "").startswith("image/"):
+        async for chunk in request.stream():
+            body.extend(chunk)
+            if len(body) > MAX_IMAGE_BYTES:
+                raise HTTPException(status_code=413, detail="Image is too large")
+    else:
+        raise HTTPException(status_code=415, detail="Upload a multipart \"file\" field or an image/* body")
+    try:
+        name = await save_image(image_store, bytes(body))
+    except InvalidImage as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    image = profile_image(name)
+    await db.users.update_one({"id": current_user.id}, {"$set": {"profile_pic": image.profile_pic, "updated_at": datetime.now(timezone.utc)}, "$inc": {"version": 1}})
+    user_cache.invalidate(current_user.id)
+    await bump_connection_versions(await connection_ids([current_user.id]))
+    return image
+
+@api_router.get("/images/{name}")
+async def get_image(name: str, request: Request):
+    # Names are content hashes, so a cached copy never goes stale
+    if not IMAGE_NAME_PATTERN.match(name):
+        raise HTTPException(status_code=404, detail="Image not found")
+    size = await image_store.size(name)
+    if size is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+    headers = {"Cache-Control": IMAGE_CACHE_CONTROL, "ETag": f'"{name.split(".", 1)[0]}"', "Accept-Ranges": "bytes"}
+    if request.headers.get("if-none-match") in (headers["ETag"], "*"):
+        return Response(status_code=304, headers=headers)
+
+    try:
+        byte_range = parse_range(request.headers.get("range"), size)
+    except UnsatisfiableRange:
+        return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+    if byte_range is None:
+        return Response(content=await image_store.read(name), media_type=image_content_type(name), headers=headers)
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return Response(
+        content=await image_store.read(name, start, end), status_code=206,
+        media_type=image_content_type(name), headers=headers
+    )
+
+# Social graph helpers
+# An edge is directed: a pending request is one edge from sender to receiver,
+# an accepted connection is a pair of accepted edges, one in each direction.
+async def get_edge(from_id: str, to_id: str) -> Optional[Dict[str, Any]]:
+    return await db.edges.find_one({"from_id": from_id, "to_id": to_id}, {"_id": 0})
+
+async def is_connected(user_id: str, other_id: str) -> bool:
+    # Connections are never removed, so positive answers can be cached
+    pair = f"{user_id}:{other_id}"
+    if connected_pairs.get(pair):
+        return True
+    edge = await db.edges.find_one(
+        {"from_id": user_id, "to_id": other_id, "state": EDGE_ACCEPTED}, {"_id": 1}
+    )
+    if edge is None:
+        return False
+    connected_pairs.set(pair, True)
+    return True
+
+async def connection_ids(user_ids: List[str]) -> List[str]:
+    # From Mongo rather than connection_graph, which only sees connections accepted on other
+    # workers at its next sync. Covered by the edges_outgoing index.
+    cursor = db.edges.find({"from_id": {"$in": user_ids}, "state": EDGE_ACCEPTED}, {"_id": 0, "to_id": 1})
+    return sorted({edge["to_id"] async for edge in cursor})
+
+async def bump_connection_versions(user_ids: List[str]):
+    # Their /api/connections pages show something that changed
+    if user_ids:
+        await db.users.update_many({"id": {"$in": user_ids}}, {"$inc": {"connections_version": 1}})
+
+async def list_edge_users(query: Dict[str, Any], id_field: str, after: Optional[str], limit: int,
+                          projection: Dict[str, Any] = USER_SUMMARY_PROJECTION) -> List[Dict[str, Any]]:
+    # Keyset pagination over the other endpoint's id
+    if after:
+        query[id_field] = {"$gt": after}
+    edges = await list_db.edges.find(query, {"_id": 0, id_field: 1}).sort(id_field, 1).limit(limit).to_list(length=limit)
+    user_ids = [edge[id_field] for edge in edges]
+    if not user_ids:
+        return []
+    users = await list_db.users.find({"id": {"$in": user_ids}}, projection).to_list(length=limit)
+    users.sort(key=lambda user: user["id"])
+    # Online status comes from the presence registry rather than the stored flag
+    if "is_online" in projection:
+        users = [presence.apply(user) for user in users]
+    return users
+
+async def sync_connection_graph():
+    # Pick up connections accepted since the last sync, including on other workers. The
+    # first call loads every accepted edge; later ones re-read the same overlap as
+    # sync_feed_ranker, and add_edge ignores edges the graph already has.
+    initial = connection_graph.synced_until is None
+    query: Dict[str, Any] = {"state": EDGE_ACCEPTED}
+    if not initial:
+        query["updated_at"] = {"$gte": connection_graph.synced_until - FEED_SYNC_OVERLAP}
+    edges = []
+    projection = {"_id": 0, "from_id": 1, "to_id": 1, "updated_at": 1}
+    async for edge in db.edges.find(query, projection).sort("updated_at", 1):
+        edges.append((feed_ranker.row_for(edge["from_id"]), feed_ranker.row_for(edge["to_id"])))
+        # Edges from before updated_at existed sort first and are only read by the initial load
+        if edge.get("updated_at") is not None:
+            connection_graph.synced_until = edge["updated_at"]
+    if initial:
+        connection_graph.load(edges)
+    else:
+        for a, b in edges:
+            connection_graph.add_edge(a, b)
+
+# Feed helpers
+async def sync_feed_ranker():
+    # Pick up users created or edited since the last sync, including on other workers.
+    # Re-reading a short overlap covers clock skew between workers; upserts are idempotent.
+    query = {}
+    if feed_ranker.synced_until is not None:
+        query = {"updated_at": {"$gte": feed_ranker.synced_until - FEED_SYNC_OVERLAP}}
+    projection = {"_id": 0, "id": 1, "name": 1, "skills": 1, "interests": 1, "updated_at": 1}
+    profiles = []
+    async for user in db.users.find(query, projection).sort("updated_at", 1):
+        skills, interests = user.get("skills", []), user.get("interests", [])
+        feed_ranker.upsert(user["id"], skills, interests)
+        profiles.append((feed_ranker.row_for(user["id"]), skills, interests, user.get("name", "")))
+        # Users from before updated_at existed sort first and are only read by the initial load
+        if user.get("updated_at") is not None:
+            feed_ranker.synced_until = user["updated_at"]
+    # One bulk build rather than a posting-list insert per user (the startup load reads everyone)
+    search_index.load(profiles)
+
+async def get_seen_rows(user: UserResponse):
+    seen = swipe_history.get(user.id)
+    if seen is not None:
+        return seen
+
+    # Likes and passes, plus every edge to or from the user (connections, requests either way)
+    seen_ids = []
+    async for edge in db.edges.find({"from_id": user.id}, {"_id": 0, "to_id": 1}):
+        seen_ids.append(edge["to_id"])
+    async for edge in db.edges.find({"to_id": user.id, "state": EDGE_PENDING}, {"_id": 0, "from_id": 1}):
+        seen_ids.append(edge["from_id"])
+    async for swipe in db.swipes.find({"user_id": user.id}, {"_id": 0, "target_id": 1}):
+        seen_ids.append(swipe["target_id"])
+    return swipe_history.load(user.id, (feed_ranker.row_for(seen_id) for seen_id in seen_ids))
+
+async def record_swipe(user_id: str, target_id: str, action: str):
+    await db.swipes.update_one(
+        {"user_id": user_id, "target_id": target_id},
+        {"$set": {"action": action, "timestamp": datetime.now(timezone.utc)}},
+        upsert=True
+    )
+    swipe_history.add(user_id, feed_ranker.row_for(target_id))
 
 # Feed endpoint - get users to swipe through
-@api_router.get("/feed", response_model=List[UserResponse])
+@api_router.get("/feed", response_model=List[UserSummary])
 async def get_feed(current_user: UserResponse = Depends(get_current_user)):
-    # Exclude self, connections, and pending friend requests
-    exclude_ids = [current_user.id] + current_user.connections + current_user.friend_requests_sent + current_user.friend_requests_received
-    
-    users = await db.users.find({
-        "id": {"$nin": exclude_ids}
-    }).to_list(length=20)  # Limit to 20 users
+    await sync_feed_ranker()
+    await sync_connection_graph()
+
+    # Exclude self and everyone already swiped on, connected with or pending
+    seen_rows = await get_seen_rows(current_user)
+
+    # Rank candidates by skill/interest overlap, then load just those profiles
+    # Mutual connections add to the score of friends-of-friends
+    mutual_counts = connection_graph.mutual_counts(feed_ranker.row_for(current_user.id), len(feed_ranker))
+    ranked_ids = feed_ranker.rank(current_user.id, seen_rows, FEED_SIZE, boost=mutual_counts * FEED_MUTUAL_WEIGHT)
+    users = await list_db.users.find({"id": {"$in": ranked_ids}}, USER_SUMMARY_PROJECTION).to_list(length=FEED_SIZE)
+    rank = {user_id: position for position, user_id in enumerate(ranked_ids)}
+    users.sort(key=lambda user: rank[user["id"]])
     
-    return [UserResponse(**user) for user in users]
+    return model_list_response(UserSummary, (presence.apply(user) for user in users))
+
+@api_router.get("/users/{user_id}", response_model=PublicProfile)
+async def get_user_profile(user_id: str, current_user: UserResponse = Depends(get_current_user)):
+    user = await db.users.find_one({"id": user_id}, PUBLIC_PROFILE_PROJECTION)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    return PublicProfile(**presence.apply(user))
+
+@api_router.get("/users/{user_id}/mutual-connections", response_model=MutualConnections)
+async def get_mutual_connections(
+    user_id: str,
+    limit: int = Query(FEED_SIZE, ge=0, le=CONNECTIONS_MAX_PAGE_SIZE),
+    current_user: UserResponse = Depends(get_current_user)
+):
+    await sync_connection_graph()
+    # Look rows up without creating them; an unknown id has no connections
+    user_row = feed_ranker.user_rows.get(user_id)
+    current_row = feed_ranker.user_rows.get(current_user.id)
+    if user_row is None or current_row is None:
+        return MutualConnections(user_id=user_id, count=0, user_ids=[])
+    mutual = connection_graph.mutual(current_row, user_row)
+    return MutualConnections(
+        user_id=user_id,
+        count=len(mutual),
+        user_ids=[feed_ranker.row_users[row] for row in mutual[:limit]]
+    )
+
+@api_router.get("/suggestions", response_model=List[Suggestion])
+async def get_suggestions(
+    limit: int = Query(FEED_SIZE, ge=1, le=CONNECTIONS_MAX_PAGE_SIZE),
+    current_user: UserResponse = Depends(get_current_user)
+):
+    await sync_connection_graph()
+    # Friends-of-friends ranked by mutual connections, minus anyone already swiped on or pending
+    seen_rows = await get_seen_rows(current_user)
+    suggested = connection_graph.suggestions(feed_ranker.row_for(current_user.id), len(feed_ranker), seen_rows, limit)
+    mutual_counts = {feed_ranker.row_users[row]: count for row, count in suggested}
+    if not mutual_counts:
+        return []
+
+    users = await list_db.users.find({"id": {"$in": list(mutual_counts)}}, USER_SUMMARY_PROJECTION).to_list(length=limit)
+    users.sort(key=lambda user: -mutual_counts[user["id"]])
+    for user in users:
+        presence.apply(user)["mutual_count"] = mutual_counts[user["id"]]
+    return model_list_response(Suggestion, users)
+
+@api_router.post("/users/{user_id}/pass", response_model=FriendRequestResponse)
+async def pass_user(user_id: str, current_user: UserResponse = Depends(get_current_user)):
+    if user_id == current_user.id:
+        return FriendRequestResponse(success=False, message="Cannot pass on yourself")
+
+    target_user = await db.users.find_one({"id": user_id}, {"_id": 1})
+    if not target_user:
+        return FriendRequestResponse(success=False, message="User not found")
+
+    await record_swipe(current_user.id, user_id, "pass")
+    return FriendRequestResponse(success=True, message="User passed")
+
+# Search endpoints
+@api_router.get("/search", response_model=List[UserSummary])
+async def search_users(
+    skills: List[str] = Query([]),
+    interests: List[str] = Query([]),
+    q: Optional[str] = None,
+    limit: int = Query(FEED_SIZE, ge=1, le=CONNECTIONS_MAX_PAGE_SIZE),
+    current_user: UserResponse = Depends(get_current_user)
+):
+    # Include users who signed up or edited their profile on other workers
+    await sync_feed_ranker()
+
+    # All given skills and interests must match; q prefix-matches words of the name
+    rows = search_index.search(skills, interests, q)
+    user_ids = [feed_ranker.row_users[row] for row in rows[:limit + 1] if feed_ranker.row_users[row] != current_user.id][:limit]
+    if not user_ids:
+        return []
+
+    users = await list_db.users.find({"id": {"$in": user_ids}}, USER_SUMMARY_PROJECTION).to_list(length=limit)
+    order = {user_id: position for position, user_id in enumerate(user_ids)}
+    users.sort(key=lambda user: order[user["id"]])
+    return model_list_response(UserSummary, (presence.apply(user) for user in users))
+
+@api_router.get("/search/autocomplete", response_model=List[SearchSuggestion])
+async def autocomplete(
+    prefix: str,
+    field: str = Query("skill", pattern=f"^({'|'.join(SEARCH_FIELDS)})$"),
+    limit: int = Query(10, ge=1, le=50),
+    current_user: UserResponse = Depends(get_current_user)
+):
+    await sync_feed_ranker()
+    return [SearchSuggestion(term=term, count=count) for term, count in search_index.autocomplete(field, prefix, limit)]
 
 # Friend request endpoints
 @api_router.post("/users/{user_id}/friend-request", response_model=FriendRequestResponse)
@@ -248,134 +839,411 @@ async def send_friend_request(user_id: str, current_user: UserResponse = Depends
         return FriendRequestResponse(success=False, message="Cannot send friend request to yourself")
     
     # Check if user exists
-    target_user = await db.users.find_one({"id": user_id})
+    target_user = await db.users.find_one({"id": user_id}, {"_id": 1})
     if not target_user:
         return FriendRequestResponse(success=False, message="User not found")
     
-    # Check if already connected
-    if user_id in current_user.connections:
+    # Check if already connected or request already sent
+    edge = await get_edge(current_user.id, user_id)
+    if edge and edge["state"] == EDGE_ACCEPTED:
         return FriendRequestResponse(success=False, message="Already connected with this user")
-    
-    # Check if request already sent
-    if user_id in current_user.friend_requests_sent:
+    if edge:
         return FriendRequestResponse(success=False, message="Friend request already sent")
     
     # Check if request already received from this user
-    if user_id in current_user.friend_requests_received:
+    if await get_edge(user_id, current_user.id):
         return FriendRequestResponse(success=False, message="This user has already sent you a request")
     
     # Send friend request
-    await db.users.update_one(
-        {"id": current_user.id},
-        {"$push": {"friend_requests_sent": user_id}}
-    )
-    
-    await db.users.update_one(
-        {"id": user_id},
-        {"$push": {"friend_requests_received": current_user.id}}
-    )
+    now = datetime.now(timezone.utc)
+    try:
+        await db.edges.insert_one({
+            "from_id": current_user.id,
+            "to_id": user_id,
+            "state": EDGE_PENDING,
+            "created_at": now,
+            "updated_at": now
+        })
+    except DuplicateKeyError:
+        return FriendRequestResponse(success=False, message="Friend request already sent")
+
+    # A friend request is a "like"; the pending request also hides the sender from the target's feed
+    await record_swipe(current_user.id, user_id, "like")
+    swipe_history.add(user_id, feed_ranker.row_for(current_user.id))
     
     return FriendRequestResponse(success=True, message="Friend request sent successfully")
 
 @api_router.post("/users/{user_id}/accept-request", response_model=FriendRequestResponse)
 async def accept_friend_request(user_id: str, current_user: UserResponse = Depends(get_current_user)):
-    # Check if request exists
-    if user_id not in current_user.friend_requests_received:
+    # Accept request - flip the pending edge and add the reverse one
+    now = datetime.now(timezone.utc)
+    request = await db.edges.find_one_and_update(
+        {"from_id": user_id, "to_id": current_user.id, "state": EDGE_PENDING},
+        {"$set": {"state": EDGE_ACCEPTED, "updated_at": now}}
+    )
+    if request is None:
         return FriendRequestResponse(success=False, message="No friend request found from this user")
     
-    # Accept request - add to connections and remove from requests
-    await db.users.update_one(
-        {"id": current_user.id},
-        {
-            "$push": {"connections": user_id},
-            "$pull": {"friend_requests_received": user_id}
-        }
-    )
-    
-    await db.users.update_one(
-        {"id": user_id},
-        {
-            "$push": {"connections": current_user.id},
-            "$pull": {"friend_requests_sent": current_user.id}
-        }
+    await db.edges.update_one(
+        {"from_id": current_user.id, "to_id": user_id},
+        {"$set": {"state": EDGE_ACCEPTED, "updated_at": now}, "$setOnInsert": {"created_at": now}},
+        upsert=True
     )
+    connection_graph.add_edge(feed_ranker.row_for(current_user.id), feed_ranker.row_for(user_id))
+    await bump_connection_versions([current_user.id, user_id])
     
     return FriendRequestResponse(success=True, message="Friend request accepted successfully")
 
 # Chat endpoints
-@api_router.get("/chat/{connection_id}", response_model=List[Message])
-async def get_chat_history(connection_id: str, current_user: UserResponse = Depends(get_current_user)):
+async def load_message_page(user_id: str, connection_id: str, before: Optional[str], after: Optional[str], limit: int) -> Dict[str, Any]:
+    if before and after:
+        raise HTTPException(status_code=400, detail="Use either before or after, not both")
+
+    # Make buffered messages visible before reading
+    if message_writer.pending:
+        await message_writer.flush()
+
+    messages, has_more = await message_store.page(
+        conversation_id_for(user_id, connection_id),
+        decode_message_cursor(before) if before else None,
+        decode_message_cursor(after) if after else None,
+        limit
+    )
+
+    # Raw documents; the endpoints validate and encode them in one pass
+    return {
+        "messages": messages,
+        "before_cursor": encode_message_cursor(messages[0]) if messages else before,
+        "after_cursor": encode_message_cursor(messages[-1]) if messages else after,
+        "has_more": has_more
+    }
+
+async def chat_etag(user_id: str, connection_id: str, *page: Any) -> str:
+    conversation_id = conversation_id_for(user_id, connection_id)
+    conversation = await db.conversations.find_one({"id": conversation_id}, {"_id": 0, "version": 1})
+    return make_etag("chat", conversation_id, (conversation or {}).get("version", 0), *page)
+
+@api_router.get("/chat/{connection_id}/history", response_model=MessagePage)
+async def get_chat_page(
+    connection_id: str,
+    request: Request,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    limit: int = Query(CHAT_PAGE_SIZE, ge=1, le=CHAT_MAX_PAGE_SIZE),
+    current_user: UserResponse = Depends(get_current_user)
+):
     # Check if connected
-    if connection_id not in current_user.connections:
+    if not await is_connected(current_user.id, connection_id):
         raise HTTPException(status_code=403, detail="Not connected with this user")
-    
-    # Get messages between users
-    messages = await db.messages.find({
-        "$or": [
-            {"sender_id": current_user.id, "receiver_id": connection_id},
-            {"sender_id": connection_id, "receiver_id": current_user.id}
-        ]
-    }).sort("timestamp", 1).to_list(length=None)
-    
-    return [Message(**message) for message in messages]
+    etag = await chat_etag(current_user.id, connection_id, "history", before, after, limit)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return not_modified(etag)
 
-@api_router.post("/chat/send", response_model=Message)
-async def send_message(message_data: MessageCreate, current_user: UserResponse = Depends(get_current_user)):
+    page = await load_message_page(current_user.id, connection_id, before, after, limit)
+    page["messages"] = dump_models(Message, page["messages"])
+    return with_etag(FastJSONResponse(page), etag)
+
+# Deprecated: a bare list of at most `limit` messages. The cursors of /history are sent as
+# Link headers instead: rel="prev" for older messages (only while there are more),
+# rel="next" to poll for newer ones.
+@api_router.get("/chat/{connection_id}", response_model=List[Message], deprecated=True)
+async def get_chat_history(
+    connection_id: str,
+    request: Request,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    limit: int = Query(CHAT_PAGE_SIZE, ge=1, le=CHAT_MAX_PAGE_SIZE),
+    current_user: UserResponse = Depends(get_current_user)
+):
     # Check if connected
-    if message_data.receiver_id not in current_user.connections:
+    if not await is_connected(current_user.id, connection_id):
+        raise HTTPException(status_code=403, detail="Not connected with this user")
+    etag = await chat_etag(current_user.id, connection_id, before, after, limit)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return not_modified(etag)
+
+    page = await load_message_page(current_user.id, connection_id, before, after, limit)
+    response = with_etag(model_list_response(Message, page["messages"]), etag)
+    base_url = request.url.remove_query_params(["before", "after"])
+    links = []
+    # Paging forward, everything before the cursor is older history
+    if page["messages"] and (page["has_more"] or after):
+        links.append(f'<{base_url.include_query_params(before=page["before_cursor"])}>; rel="prev"')
+    if page["after_cursor"]:
+        links.append(f'<{base_url.include_query_params(after=page["after_cursor"])}>; rel="next"')
+    if links:
+        response.headers["Link"] = ", ".join(links)
+    response.headers["Deprecation"] = "true"
+    return response
+
+async def deliver_message(sender: UserResponse, message_data: MessageCreate) -> Message:
+    # Check if connected
+    if not await is_connected(sender.id, message_data.receiver_id):
         raise HTTPException(status_code=403, detail="Not connected with this user")
     
     # Create message
     message = Message(
-        sender_id=current_user.id,
+        conversation_id=conversation_id_for(sender.id, message_data.receiver_id),
+        sender_id=sender.id,
         receiver_id=message_data.receiver_id,
         text=message_data.text
     )
     
-    # Save to database
-    await db.messages.insert_one(message.dict())
+    # Save to database. In batched write mode this waits for the flush that stores the
+    # message, so the inbox entry and the push below never point at a missing message
+    try:
+        await message_writer.write(message.dict())
+    except MessageRejected:
+        raise HTTPException(status_code=400, detail="Message could not be stored")
+
+    # Keep the inbox entry current: last message preview and the receiver's unread count
+    await db.conversations.update_one(
+        {"id": message.conversation_id},
+        {
+            "$set": {
+                "participants": sorted([sender.id, message_data.receiver_id]),
+                "last_message": {
+                    "id": message.id,
+                    "sender_id": sender.id,
+                    "text": message.text[:MESSAGE_PREVIEW_LENGTH],
+                    "timestamp": message.timestamp
+                },
+                "updated_at": message.timestamp,
+                f"unread.{sender.id}": 0
+            },
+            "$inc": {f"unread.{message_data.receiver_id}": 1, "version": 1}
+        },
+        upsert=True
+    )
     
     # Send real-time message to receiver if online
-    message_json = json.dumps({
+    message_json = dumps_text({
         "type": "new_message",
-        "message": message.dict(),
-        "sender_name": current_user.name
-    }, default=str)
+        "message": message,
+        "sender_name": sender.name
+    })
     await manager.send_personal_message(message_json, message_data.receiver_id)
     
     return message
 
-# Get user connections
-@api_router.get("/connections", response_model=List[UserResponse])
-async def get_connections(current_user: UserResponse = Depends(get_current_user)):
-    if not current_user.connections:
-        return []
-    
-    connections = await db.users.find({
-        "id": {"$in": current_user.connections}
-    }).to_list(length=None)
+@api_router.post("/chat/send", response_model=Message)
+async def send_message(message_data: MessageCreate, current_user: UserResponse = Depends(get_current_user)):
+    return await deliver_message(current_user, message_data)
+
+# Inbox endpoints
+@api_router.get("/conversations", response_model=List[Conversation])
+async def get_inbox(
+    before: Optional[datetime] = None,
+    limit: int = Query(CHAT_PAGE_SIZE, ge=1, le=CHAT_MAX_PAGE_SIZE),
+    current_user: UserResponse = Depends(get_current_user)
+):
+    # Most recent first; pass the last updated_at as `before` for the next page
+    query: Dict[str, Any] = {"participants": current_user.id}
+    if before:
+        query["updated_at"] = {"$lt": before}
+    conversations = await db.conversations.find(query, {"_id": 0}).sort("updated_at", -1).limit(limit).to_list(length=limit)
     
-    return [UserResponse(**user) for user in connections]
+    return model_list_response(Conversation, (
+        {
+            "conversation_id": conversation["id"],
+            "participant_id": next((p for p in conversation["participants"] if p != current_user.id), current_user.id),
+            "last_message": conversation.get("last_message"),
+            "unread_count": conversation.get("unread", {}).get(current_user.id, 0),
+            "updated_at": conversation["updated_at"]
+        }
+        for conversation in conversations
+    ))
+
+@api_router.post("/conversations/{connection_id}/read", response_model=FriendRequestResponse)
+async def mark_conversation_read(connection_id: str, current_user: UserResponse = Depends(get_current_user)):
+    await db.conversations.update_one(
+        {"id": conversation_id_for(current_user.id, connection_id)},
+        {"$set": {f"unread.{current_user.id}": 0}}
+    )
+    return FriendRequestResponse(success=True, message="Conversation marked as read")
+
+# Get user connections
+# Cards without online status: presence changes far more often than profiles, so it is
+# polled separately from /connections/presence and never invalidates this list's ETag
+@api_router.get("/connections", response_model=List[ProfileCard])
+async def get_connections(
+    request: Request,
+    after: Optional[str] = None,
+    limit: int = Query(CONNECTIONS_PAGE_SIZE, ge=1, le=CONNECTIONS_MAX_PAGE_SIZE),
+    current_user: UserResponse = Depends(get_current_user)
+):
+    # Read through list_db like the page itself, so the tag is never newer than the body
+    versions = await list_db.users.find_one({"id": current_user.id}, {"_id": 0, "connections_version": 1})
+    etag = make_etag("connections", current_user.id, (versions or {}).get("connections_version", 0), after, limit)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return not_modified(etag)
+
+    # Ordered by user id; pass the last id as `after` for the next page
+    users = await list_edge_users(
+        {"from_id": current_user.id, "state": EDGE_ACCEPTED}, "to_id", after, limit, PROFILE_CARD_PROJECTION
+    )
+    return with_etag(model_list_response(ProfileCard, users), etag)
+
+@api_router.get("/connections/presence", response_model=List[UserPresence])
+async def get_connections_presence(
+    after: Optional[str] = None,
+    limit: int = Query(CONNECTIONS_PAGE_SIZE, ge=1, le=CONNECTIONS_MAX_PAGE_SIZE),
+    current_user: UserResponse = Depends(get_current_user)
+):
+    # Same pages as /connections; no ETag, since this is what changes
+    users = await list_edge_users(
+        {"from_id": current_user.id, "state": EDGE_ACCEPTED}, "to_id", after, limit, USER_PRESENCE_PROJECTION
+    )
+    return model_list_response(UserPresence, users)
+
+@api_router.get("/friend-requests", response_model=List[UserSummary])
+async def get_friend_requests(
+    direction: str = Query("received", pattern="^(received|sent)$"),
+    after: Optional[str] = None,
+    limit: int = Query(CONNECTIONS_PAGE_SIZE, ge=1, le=CONNECTIONS_MAX_PAGE_SIZE),
+    current_user: UserResponse = Depends(get_current_user)
+):
+    if direction == "received":
+        users = await list_edge_users({"to_id": current_user.id, "state": EDGE_PENDING}, "from_id", after, limit)
+    else:
+        users = await list_edge_users({"from_id": current_user.id, "state": EDGE_PENDING}, "to_id", after, limit)
+    return model_list_response(UserSummary, users)
+
+# Export endpoints
+# Streamed as NDJSON straight from the cursors; ?compress=true gzips on the fly
+def export_response(records, filename: str, compress: bool) -> StreamingResponse:
+    if compress:
+        filename += ".gz"
+    return StreamingResponse(
+        ndjson_stream(records, compress),
+        media_type="application/gzip" if compress else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@api_router.get("/export/chat/{connection_id}")
+async def export_chat(connection_id: str, compress: bool = False, current_user: UserResponse = Depends(get_current_user)):
+    # Make buffered messages part of the export
+    if message_writer.pending:
+        await message_writer.flush()
+    records = conversation_records(message_store, conversation_id_for(current_user.id, connection_id))
+    return export_response(records, f"chat-{connection_id}.ndjson", compress)
+
+@api_router.get("/export/account")
+async def export_account(compress: bool = False, current_user: UserResponse = Depends(get_current_user)):
+    if message_writer.pending:
+        await message_writer.flush()
+    return export_response(account_records(db, message_store, current_user.id), f"account-{current_user.id}.ndjson", compress)
 
 # WebSocket endpoint
+# Frames are JSON objects:
+#   client -> {"type": "send", "client_id": "...", "receiver_id": "...", "text": "..."}
+#   server -> {"type": "ack", "client_id": "...", "id": "...", "timestamp": "...", "conversation_id": "..."}
+#   server -> {"type": "error", "client_id": "...", "detail": "..."}
+#   server -> {"type": "error", "client_id": "...", "detail": "Too many requests", "retry_after": seconds}
+#   client -> {"type": "ping"}, server -> {"type": "pong"}
+# Incoming messages for the user are pushed as {"type": "new_message", ...}
+async def handle_socket_frame(user_id: str, connection: OutboundSocket, raw: str):
+    try:
+        frame = json.loads(raw)
+        frame_type = frame.get("type")
+    except (ValueError, AttributeError):
+        connection.send(dumps_text({"type": "error", "detail": "Invalid frame"}))
+        return
+
+    client_id = frame.get("client_id")
+    if frame_type == "ping":
+        connection.send(dumps_text({"type": "pong"}))
+        return
+    if frame_type != "send":
+        connection.send(dumps_text({"type": "error", "client_id": client_id, "detail": "Unknown frame type"}))
+        return
+    if WS_SEND_CLASS is not None:
+        allowed, retry_after = await take_token(rate_limit_buckets, WS_SEND_CLASS, user_key(WS_SEND_CLASS.name, user_id))
+        if not allowed:
+            http_rejected.inc("rate_limited", WS_SEND_CLASS.name)
+            connection.send(dumps_text({
+                "type": "error", "client_id": client_id, "detail": "Too many requests", "retry_after": retry_after
+            }))
+            return
+
+    try:
+        # Identity was verified at the handshake; the cached record keeps this off Mongo
+        sender = await get_user_by_id(user_id)
+        if sender is None:
+            raise HTTPException(status_code=401, detail="User not found")
+        message = await deliver_message(sender, MessageCreate(receiver_id=frame.get("receiver_id"), text=frame.get("text")))
+    except ValidationError:
+        connection.send(dumps_text({"type": "error", "client_id": client_id, "detail": f"receiver_id and text (at most {MESSAGE_MAX_LENGTH} characters) are required"}))
+        return
+    except HTTPException as e:
+        connection.send(dumps_text({"type": "error", "client_id": client_id, "detail": e.detail}))
+        return
+
+    connection.send(dumps_text({
+        "type": "ack",
+        "client_id": client_id,
+        "id": message.id,
+        "timestamp": message.timestamp,
+        "conversation_id": message.conversation_id
+    }))
+
 @app.websocket("/ws/{user_id}")
-async def websocket_endpoint(websocket: WebSocket, user_id: str):
-    await manager.connect(websocket, user_id)
+async def websocket_endpoint(websocket: WebSocket, user_id: str, token: Optional[str] = None):
+    # Browsers cannot set headers on WebSockets, so the JWT comes as ?token=
+    try:
+        if token is None or decode_jwt_token(token) != user_id:
+            raise HTTPException(status_code=401, detail="Invalid token")
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    connection = await manager.connect(websocket, user_id)
     try:
         while True:
-            # Keep connection alive
-            await websocket.receive_text()
+            await handle_socket_frame(user_id, connection, await websocket.receive_text())
     except WebSocketDisconnect:
-        manager.disconnect(user_id)
+        pass
+    finally:
+        await manager.disconnect(user_id, connection)
         # Update user offline status
-        await db.users.update_one(
-            {"id": user_id},
-            {"$set": {"is_online": False, "last_seen": datetime.now(timezone.utc)}}
-        )
+        presence.disconnected(user_id)
+
+# Metrics endpoint
+metrics.callback(
+    "websocket_connections", "Open WebSocket connections on this worker",
+    lambda: sum(len(connections) for connections in manager.active_connections.values())
+)
+metrics.callback("user_cache_size", "Cached user records", lambda: user_cache.stats()["size"])
+for key in ("hits", "misses", "evictions"):
+    metrics.callback(f"user_cache_{key}_total", f"User cache {key}", lambda key=key: user_cache.stats()[key], kind="counter")
+metrics.callback("message_writer_pending", "Messages buffered for write-behind", lambda: message_writer.pending)
+for key in ("batches", "messages_written", "flush_errors", "dead_lettered"):
+    metrics.callback(f"message_writer_{key}_total", f"Message writer {key.replace('_', ' ')}",
+                     lambda key=key: message_writer.stats()[key], kind="counter")
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    return Response(content=metrics.render(), media_type=METRICS_CONTENT_TYPE)
+
+if request_limiter is not None:
+    metrics.callback("http_requests_in_flight", "Requests holding an admission slot", lambda: request_limiter.in_flight)
+    metrics.callback("http_requests_queued", "Requests waiting for an admission slot", lambda: request_limiter.queued)
 
 # Include the router in the main app
 app.include_router(api_router)
 
+# Inside CORS so rejections still carry CORS headers, outside everything that touches Mongo
+if RATE_LIMIT_ENABLED or request_limiter is not None:
+    app.add_middleware(
+        AdmissionMiddleware,
+        classes=RATE_LIMIT_CLASSES,
+        store=rate_limit_buckets,
+        identify=rate_limit_identity,
+        limiter=request_limiter,
+        rejected=http_rejected,
+        skip_paths=["/metrics"],
+        trusted_proxies=RATE_LIMIT_TRUSTED_PROXIES
+    )
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -383,6 +1251,7 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(RequestMetricsMiddleware, requests=http_requests, latency=http_latency, skip_paths=["/metrics"])
 
 # Configure logging
 logging.basicConfig(
@@ -391,6 +1260,52 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def startup_db_client():
+    global client, db, list_db, message_store
+    # A database may already be set (tests, benchmarks); otherwise connect and pre-open the pool
+    if db is None:
+        client = create_client(mongo_url, event_listeners=[MongoCommandMetrics(mongo_latency, mongo_failures)])
+        db = client[DB_NAME]
+        await warm_up(db)
+    list_db = db if MONGO_LIST_READ_PREFERENCE is None else db.with_options(read_preference=MONGO_LIST_READ_PREFERENCE)
+
+    if MONGO_ENSURE_INDEXES:
+        await ensure_indexes(db)
+    if MONGO_RUN_MIGRATIONS:
+        await run_migrations(db)
+    await manager.broker.start(manager.deliver_local)
+    await presence.start(db.users)
+    message_store = create_message_store(db, **MESSAGE_STORE_OPTIONS)
+    await message_store.start()
+    await message_writer.start(message_store, dead_letters=db.message_dead_letters)
+    await sync_feed_ranker()
+    await sync_connection_graph()
+    if MONGO_EXPLAIN_QUERIES:
+        # Report query shapes that would scan a whole collection
+        for entry in await explain_query_shapes(db):
+            if entry["collscan"]:
+                logger.warning("COLLSCAN for %s on %s: %s", entry["endpoint"], entry["collection"], entry["stages"])
+
+async def shutdown_step(name: str, step):
+    # One failing step (or one startup never reached) must not skip the rest of the cleanup
+    try:
+        result = step()
+        if inspect.isawaitable(result):
+            await result
+    except Exception:
+        logger.exception("Shutdown step failed: %s", name)
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    await shutdown_step("broker", manager.broker.stop)
+    await shutdown_step("presence", presence.stop)
+    await shutdown_step("message writer", message_writer.stop)
+    if message_store is not None:
+        await shutdown_step("message store", message_store.stop)
+    if client is not None:
+        await shutdown_step("mongo client", client.close)
+    await shutdown_step("rate limit store", rate_limit_buckets.close)
+    await shutdown_step("password hasher", password_hasher.shutdown)
+    logger.info("User cache stats: %s", user_cache.stats())
+    logger.info("Message writer stats: %s", message_writer.stats())
\ No newline at end of file
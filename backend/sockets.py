@@ -0,0 +1,71 @@
+"""
+Per-socket outbound queues for WebSocket delivery.
+
+Messages are handed to a bounded queue and written by a dedicated task per
+socket, so a slow client only ever delays its own queue. When the queue is
+full the slow-consumer policy applies:
+
+- "drop": discard the oldest queued message to make room
+- "disconnect": close the socket (1013 Try Again Later); the client is
+  expected to reconnect and catch up through the chat history API
+"""
+
+import asyncio
+import logging
+
+from fastapi import WebSocket
+
+logger = logging.getLogger(__name__)
+
+SLOW_CONSUMER_POLICIES = ("drop", "disconnect")
+
+
+class OutboundSocket:
+    def __init__(self, websocket: WebSocket, max_queue: int = 256, policy: str = "disconnect"):
+        if policy not in SLOW_CONSUMER_POLICIES:
+            raise ValueError(f"Unknown slow consumer policy: {policy}")
+        self.websocket = websocket
+        self.policy = policy
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.dropped = 0
+        self.closed = False
+        self.writer = asyncio.create_task(self._drain())
+
+    def send(self, message: str) -> None:
+        if self.closed:
+            return
+        try:
+            self.queue.put_nowait(message)
+            return
+        except asyncio.QueueFull:
+            pass
+
+        if self.policy == "drop":
+            self.queue.get_nowait()
+            self.queue.put_nowait(message)
+            self.dropped += 1
+        else:
+            logger.warning("Disconnecting slow WebSocket consumer")
+            self.discard()
+            asyncio.ensure_future(self._close_websocket(1013))
+
+    async def _drain(self) -> None:
+        while True:
+            message = await self.queue.get()
+            try:
+                await self.websocket.send_text(message)
+            except Exception:
+                # The receive loop notices the disconnect and cleans up
+                self.closed = True
+                return
+
+    async def _close_websocket(self, code: int) -> None:
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass
+
+    def discard(self) -> None:
+        # Stop the writer; anything still queued is dropped
+        self.closed = True
+        self.writer.cancel()
@@ -0,0 +1,56 @@
+"""
+Per-user "already seen" sets for the swipe feed.
+
+Each set is a sorted, unique int32 array of surrogate ids (the user's row in
+the feed ranking index), so excluding seen users from a ranking is a single
+vectorised mask regardless of how many swipes a user has made.
+
+Swipes recorded by this process are added in place. Sets expire after
+`ttl_seconds`, which bounds how long a swipe or request recorded by another
+worker can take to show up here.
+"""
+
+import time
+from collections import OrderedDict
+from typing import Iterable, Optional, Tuple
+
+import numpy as np
+
+
+class SwipeHistory:
+    def __init__(self, max_users: int = 100_000, ttl_seconds: float = 30.0):
+        # Least recently used or expired sets are dropped and reloaded from Mongo on demand
+        self.max_users = max_users
+        self.ttl_seconds = ttl_seconds
+        # user id -> (expiry, rows)
+        self.seen: "OrderedDict[str, Tuple[float, np.ndarray]]" = OrderedDict()
+
+    def get(self, user_id: str) -> Optional[np.ndarray]:
+        entry = self.seen.get(user_id)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del self.seen[user_id]
+            return None
+        self.seen.move_to_end(user_id)
+        return entry[1]
+
+    def load(self, user_id: str, rows: Iterable[int]) -> np.ndarray:
+        seen = np.unique(np.fromiter(rows, dtype=np.int32))
+        self.seen[user_id] = (time.monotonic() + self.ttl_seconds, seen)
+        self.seen.move_to_end(user_id)
+        while len(self.seen) > self.max_users:
+            self.seen.popitem(last=False)
+        return seen
+
+    def add(self, user_id: str, row: int) -> None:
+        # Sets that are not loaded will pick the swipe up from Mongo on load
+        entry = self.seen.get(user_id)
+        if entry is None:
+            return
+        expires, seen = entry
+        position = int(np.searchsorted(seen, row))
+        if position < len(seen) and seen[position] == row:
+            return
+        self.seen[user_id] = (expires, np.insert(seen, position, row))
+
@@ -0,0 +1,55 @@
+"""
+In-process TTL + LRU cache of authenticated user records, keyed by user id.
+
+Handlers that modify a user document must invalidate (or refresh) the
+affected entries. The TTL bounds how stale an entry written by another
+worker can get.
+"""
+
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+
+class UserCache:
+    def __init__(self, max_size: int = 10_000, ttl_seconds: float = 30.0):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, user_id: str) -> Optional[Any]:
+        entry = self.entries.get(user_id)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self.entries[user_id]
+            self.misses += 1
+            return None
+        self.entries.move_to_end(user_id)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, user_id: str, user: Any) -> None:
+        if self.max_size <= 0:
+            return
+        self.entries[user_id] = (time.monotonic() + self.ttl_seconds, user)
+        self.entries.move_to_end(user_id)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, *user_ids: str) -> None:
+        for user_id in user_ids:
+            self.entries.pop(user_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
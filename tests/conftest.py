@@ -0,0 +1,115 @@
+import importlib
+import os
+import sys
+import tempfile
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict
+
+import httpx
+import pytest
+
+# The backend modules import each other as top-level modules
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+# server.py reads its configuration at import time. Every test client shares one
+# address, so admission control is off unless a test sets it up itself.
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "devtinder_test")
+os.environ.update({
+    "BCRYPT_ROUNDS": "4",
+    "RATE_LIMIT_ENABLED": "false",
+    "MAX_CONCURRENT_REQUESTS": "0",
+    "IMAGE_STORE_DIR": tempfile.mkdtemp(prefix="devtinder-test-images-"),
+})
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def server(monkeypatch):
+    # server.py with an empty in-memory database and fresh in-process state
+    from mongomock_motor import AsyncMongoMockClient
+
+    from feed_ranking import FeedRanker
+    from graph_engine import ConnectionGraph
+    from message_writer import MessageWriter
+    from passwords import PasswordHasher
+    from presence import PresenceRegistry
+    from pubsub import InProcessBroker
+    from search_index import SearchIndex
+    from swipes import SwipeHistory
+    from user_cache import UserCache
+
+    server = importlib.import_module("server")
+    monkeypatch.setattr(server, "db", AsyncMongoMockClient(tz_aware=True)[f"test_{uuid.uuid4().hex}"])
+    monkeypatch.setattr(server, "client", None)
+    monkeypatch.setattr(server, "user_cache", UserCache())
+    monkeypatch.setattr(server, "connected_pairs", UserCache())
+    monkeypatch.setattr(server, "presence", PresenceRegistry(debounce_seconds=10, flush_interval=3600))
+    monkeypatch.setattr(server, "password_hasher", PasswordHasher(rounds=4))
+    monkeypatch.setattr(server, "message_writer", MessageWriter())
+    monkeypatch.setattr(server, "manager", server.ConnectionManager(InProcessBroker()))
+    monkeypatch.setattr(server, "feed_ranker", FeedRanker())
+    monkeypatch.setattr(server, "swipe_history", SwipeHistory())
+    monkeypatch.setattr(server, "connection_graph", ConnectionGraph())
+    monkeypatch.setattr(server, "search_index", SearchIndex())
+    return server
+
+
+@dataclass
+class ApiUser:
+    id: str
+    name: str
+    token: str
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.token}"}
+
+
+class Api:
+    """httpx client on the app's ASGI interface, plus shortcuts for common setup."""
+
+    def __init__(self, server, http: httpx.AsyncClient):
+        self.server = server
+        self.http = http
+
+    async def signup(self, name: str, **profile) -> ApiUser:
+        response = await self.http.post(
+            "/api/auth/signup", json={"name": name, "email": f"{name}-{uuid.uuid4().hex[:8]}@example.com", "password": "pw"}
+        )
+        assert response.status_code == 200, response.text
+        body = response.json()
+        user = ApiUser(body["user"]["id"], name, body["access_token"])
+        if profile:
+            response = await self.http.put("/api/profile", json={"name": name, **profile}, headers=user.headers)
+            assert response.status_code == 200, response.text
+        return user
+
+    async def connect(self, sender: ApiUser, receiver: ApiUser) -> None:
+        response = await self.http.post(f"/api/users/{receiver.id}/friend-request", headers=sender.headers)
+        assert response.json()["success"], response.text
+        response = await self.http.post(f"/api/users/{sender.id}/accept-request", headers=receiver.headers)
+        assert response.json()["success"], response.text
+
+    def websocket(self, user: ApiUser):
+        from benchmarks.loadtest import ASGIWebSocket
+
+        return ASGIWebSocket(self.server.app, f"/ws/{user.id}", f"token={user.token}")
+
+
+@pytest.fixture
+async def api(server):
+    await server.app.router.startup()
+    try:
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as http:
+            yield Api(server, http)
+    finally:
+        await server.app.router.shutdown()
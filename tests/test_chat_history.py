@@ -0,0 +1,74 @@
+import pytest
+
+
+async def send(api, sender, receiver, text):
+    response = await api.http.post("/api/chat/send", json={"receiver_id": receiver.id, "text": text}, headers=sender.headers)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+@pytest.fixture
+async def chat(api):
+    alice, bob = await api.signup("alice"), await api.signup("bob")
+    await api.connect(alice, bob)
+    for i in range(5):
+        await send(api, alice if i % 2 == 0 else bob, bob if i % 2 == 0 else alice, f"m{i}")
+    return alice, bob
+
+
+@pytest.mark.anyio
+async def test_history_pages_back_by_cursor(api, chat):
+    alice, bob = chat
+    texts, params = [], {"limit": 2}
+    while True:
+        page = (await api.http.get(f"/api/chat/{bob.id}/history", params=params, headers=alice.headers)).json()
+        texts = [message["text"] for message in page["messages"]] + texts
+        if not page["has_more"]:
+            break
+        params["before"] = page["before_cursor"]
+    assert texts == ["m0", "m1", "m2", "m3", "m4"]
+
+    # The other side reads the same conversation
+    page = (await api.http.get(f"/api/chat/{alice.id}/history", headers=bob.headers)).json()
+    assert [message["text"] for message in page["messages"]] == texts
+    assert all(message["conversation_id"] == page["messages"][0]["conversation_id"] for message in page["messages"])
+
+
+@pytest.mark.anyio
+async def test_after_cursor_polls_for_newer_messages(api, chat):
+    alice, bob = chat
+    page = (await api.http.get(f"/api/chat/{bob.id}/history", headers=alice.headers)).json()
+    empty = (await api.http.get(f"/api/chat/{bob.id}/history", params={"after": page["after_cursor"]}, headers=alice.headers)).json()
+    assert empty["messages"] == [] and empty["after_cursor"] == page["after_cursor"]
+
+    await send(api, bob, alice, "m5")
+    newer = (await api.http.get(f"/api/chat/{bob.id}/history", params={"after": page["after_cursor"]}, headers=alice.headers)).json()
+    assert [message["text"] for message in newer["messages"]] == ["m5"]
+
+
+@pytest.mark.anyio
+async def test_history_rejects_bad_cursors_and_strangers(api, chat):
+    alice, bob = chat
+    carol = await api.signup("carol")
+    cursor = (await api.http.get(f"/api/chat/{bob.id}/history", headers=alice.headers)).json()["before_cursor"]
+
+    both = await api.http.get(f"/api/chat/{bob.id}/history", params={"before": cursor, "after": cursor}, headers=alice.headers)
+    assert both.status_code == 400
+    garbage = await api.http.get(f"/api/chat/{bob.id}/history", params={"before": "not-a-cursor"}, headers=alice.headers)
+    assert garbage.status_code == 400
+    stranger = await api.http.get(f"/api/chat/{alice.id}/history", headers=carol.headers)
+    assert stranger.status_code == 403
+
+
+@pytest.mark.anyio
+async def test_legacy_endpoint_sends_cursors_as_link_headers(api, chat):
+    alice, bob = chat
+    response = await api.http.get(f"/api/chat/{bob.id}", params={"limit": 3}, headers=alice.headers)
+    assert response.headers["Deprecation"] == "true"
+    assert [message["text"] for message in response.json()] == ["m2", "m3", "m4"]
+    assert set(response.links) == {"prev", "next"}
+
+    older = await api.http.get(response.links["prev"]["url"], headers=alice.headers)
+    assert [message["text"] for message in older.json()] == ["m0", "m1"]
+    # Nothing older is left, so only the polling link remains
+    assert set(older.links) == {"next"}
@@ -0,0 +1,74 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from migrate import migrate_social_graph
+
+
+async def request(api, sender, receiver):
+    return (await api.http.post(f"/api/users/{receiver.id}/friend-request", headers=sender.headers)).json()
+
+
+async def accept(api, receiver, sender):
+    return (await api.http.post(f"/api/users/{sender.id}/accept-request", headers=receiver.headers)).json()
+
+
+async def edge_states(db):
+    return {(edge["from_id"], edge["to_id"]): edge["state"] async for edge in db.edges.find({})}
+
+
+@pytest.mark.anyio
+async def test_friend_request_lifecycle(api):
+    alice, bob = await api.signup("alice"), await api.signup("bob")
+
+    assert (await request(api, alice, alice))["message"] == "Cannot send friend request to yourself"
+    assert (await accept(api, bob, alice))["message"] == "No friend request found from this user"
+    assert (await request(api, alice, bob))["success"]
+    assert (await request(api, alice, bob))["message"] == "Friend request already sent"
+    assert (await request(api, bob, alice))["message"] == "This user has already sent you a request"
+
+    received = (await api.http.get("/api/friend-requests", headers=bob.headers)).json()
+    sent = (await api.http.get("/api/friend-requests", params={"direction": "sent"}, headers=alice.headers)).json()
+    assert [user["id"] for user in received] == [alice.id] and [user["id"] for user in sent] == [bob.id]
+
+    assert (await accept(api, bob, alice))["success"]
+    assert await edge_states(api.server.db) == {(alice.id, bob.id): "accepted", (bob.id, alice.id): "accepted"}
+    assert (await request(api, alice, bob))["message"] == "Already connected with this user"
+    assert (await api.http.get("/api/friend-requests", headers=bob.headers)).json() == []
+
+
+@pytest.mark.anyio
+async def test_connections_page_by_user_id(api):
+    me = await api.signup("me")
+    friends = [await api.signup(f"friend{i}") for i in range(5)]
+    for friend in friends:
+        await api.connect(friend, me)
+    expected = sorted(friend.id for friend in friends)
+
+    seen, after = [], None
+    while True:
+        params = {"limit": 2, **({"after": after} if after else {})}
+        page = (await api.http.get("/api/connections", params=params, headers=me.headers)).json()
+        if not page:
+            break
+        assert len(page) <= 2
+        seen += [user["id"] for user in page]
+        after = page[-1]["id"]
+    assert seen == expected
+
+
+@pytest.mark.anyio
+async def test_social_edges_migration_moves_the_legacy_arrays(server):
+    db = server.db
+    now = datetime.now(timezone.utc)
+    await db.users.insert_many([
+        {"id": "a", "connections": ["b"], "friend_requests_sent": ["c"], "friend_requests_received": [], "updated_at": now},
+        {"id": "b", "connections": ["a"], "friend_requests_sent": [], "friend_requests_received": [], "updated_at": now},
+        {"id": "c", "connections": [], "friend_requests_sent": [], "friend_requests_received": ["a"], "updated_at": now},
+    ])
+    assert await migrate_social_graph(db) == 3
+    assert await migrate_social_graph(db) == 0
+
+    assert await edge_states(db) == {("a", "b"): "accepted", ("b", "a"): "accepted", ("a", "c"): "pending"}
+    assert await db.users.count_documents({"connections": {"$exists": True}}) == 0
+    assert await db.users.count_documents({"friend_requests_received": {"$exists": True}}) == 0
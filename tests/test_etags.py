@@ -0,0 +1,80 @@
+import pytest
+
+from etags import etag_matches, make_etag
+
+
+def test_make_etag_is_weak_and_stable():
+    etag = make_etag("user", 3)
+    assert etag.startswith('W/"') and etag == make_etag("user", 3)
+    assert etag != make_etag("user", 4)
+
+
+def test_etag_matches_weak_comparison():
+    etag = make_etag("user", 3)
+    opaque = etag.removeprefix("W/")
+    assert etag_matches(etag, etag)
+    assert etag_matches(opaque, etag)
+    assert etag_matches(f'"other", {opaque}', etag)
+    assert etag_matches(" * ", etag)
+    assert not etag_matches(None, etag)
+    assert not etag_matches("", etag)
+    assert not etag_matches(make_etag("user", 4), etag)
+
+
+async def revalidate(api, path, user):
+    first = await api.http.get(path, headers=user.headers)
+    assert first.status_code == 200 and first.headers["etag"]
+    second = await api.http.get(path, headers={**user.headers, "If-None-Match": first.headers["etag"]})
+    return first, second
+
+
+@pytest.mark.anyio
+async def test_profile_not_modified_until_edited(api):
+    alice = await api.signup("alice")
+    first, second = await revalidate(api, "/api/profile", alice)
+    assert second.status_code == 304 and second.headers["etag"] == first.headers["etag"]
+
+    await api.http.put("/api/profile", json={"name": "alice", "skills": ["go"]}, headers=alice.headers)
+    third = await api.http.get("/api/profile", headers={**alice.headers, "If-None-Match": first.headers["etag"]})
+    assert third.status_code == 200 and third.json()["skills"] == ["go"]
+
+
+@pytest.mark.anyio
+async def test_connections_tag_ignores_presence(api):
+    alice, bob = await api.signup("alice"), await api.signup("bob")
+    await api.connect(alice, bob)
+    first, second = await revalidate(api, "/api/connections", alice)
+    assert second.status_code == 304
+    assert "is_online" not in first.json()[0]
+
+    # Bob coming online and the presence flush write nothing to Alice's list
+    socket = api.websocket(bob)
+    await socket.connect()
+    try:
+        await api.server.presence.flush()
+        presence = (await api.http.get("/api/connections/presence", headers=alice.headers)).json()
+        assert [(user["id"], user["is_online"]) for user in presence] == [(bob.id, True)]
+        again = await api.http.get("/api/connections", headers={**alice.headers, "If-None-Match": first.headers["etag"]})
+        assert again.status_code == 304
+    finally:
+        await socket.close()
+    stored = await api.server.db.users.find_one({"id": alice.id})
+    assert stored.get("connections_version") == 1
+
+    # A connection's profile edit does change the list
+    await api.http.put("/api/profile", json={"name": "robert"}, headers=bob.headers)
+    edited = await api.http.get("/api/connections", headers={**alice.headers, "If-None-Match": first.headers["etag"]})
+    assert edited.status_code == 200 and edited.json()[0]["name"] == "robert"
+
+
+@pytest.mark.anyio
+async def test_chat_history_not_modified_until_a_message_arrives(api):
+    alice, bob = await api.signup("alice"), await api.signup("bob")
+    await api.connect(alice, bob)
+    await api.http.post("/api/chat/send", json={"receiver_id": bob.id, "text": "hi"}, headers=alice.headers)
+    first, second = await revalidate(api, f"/api/chat/{bob.id}/history", alice)
+    assert second.status_code == 304
+
+    await api.http.post("/api/chat/send", json={"receiver_id": alice.id, "text": "yo"}, headers=bob.headers)
+    third = await api.http.get(f"/api/chat/{bob.id}/history", headers={**alice.headers, "If-None-Match": first.headers["etag"]})
+    assert third.status_code == 200 and [m["text"] for m in third.json()["messages"]] == ["hi", "yo"]
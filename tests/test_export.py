@@ -0,0 +1,49 @@
+import asyncio
+import gzip
+import json
+
+import pytest
+
+from export import ndjson_stream
+
+
+async def records(count):
+    for i in range(count):
+        yield {"i": i}
+
+
+async def collect(chunks):
+    return [chunk async for chunk in chunks]
+
+
+def test_ndjson_is_written_in_batches_and_gzips_incrementally():
+    chunks = asyncio.run(collect(ndjson_stream(records(5), batch_size=2)))
+    assert chunks == [b'{"i":0}\n{"i":1}\n', b'{"i":2}\n{"i":3}\n', b'{"i":4}\n']
+
+    compressed = asyncio.run(collect(ndjson_stream(records(5), compress=True, batch_size=2)))
+    assert gzip.decompress(b"".join(compressed)) == b"".join(chunks)
+    assert asyncio.run(collect(ndjson_stream(records(0)))) == []
+
+
+def lines(body):
+    return [json.loads(line) for line in body.splitlines()]
+
+
+@pytest.mark.anyio
+async def test_chat_and_account_exports(api):
+    alice, bob = await api.signup("alice"), await api.signup("bob")
+    await api.connect(alice, bob)
+    for text in ("one", "two"):
+        await api.http.post("/api/chat/send", json={"receiver_id": bob.id, "text": text}, headers=alice.headers)
+
+    chat = await api.http.get(f"/api/export/chat/{alice.id}", headers=bob.headers)
+    assert chat.headers["content-type"] == "application/x-ndjson"
+    assert chat.headers["content-disposition"] == f'attachment; filename="chat-{alice.id}.ndjson"'
+    assert [message["text"] for message in lines(chat.content)] == ["one", "two"]
+
+    account = await api.http.get("/api/export/account", params={"compress": "true"}, headers=alice.headers)
+    assert account.headers["content-type"] == "application/gzip"
+    exported = lines(gzip.decompress(account.content))
+    assert [record["type"] for record in exported] == ["profile", "edge", "edge", "swipe", "conversation", "message", "message"]
+    assert exported[0]["id"] == alice.id and "password" not in exported[0]
+    assert exported[-1]["timestamp"].endswith("Z")
@@ -0,0 +1,57 @@
+from datetime import datetime, timezone
+
+import numpy as np
+import pytest
+
+from feed_ranking import FeedRanker
+
+NOTHING = np.array([], dtype=np.int64)
+
+
+def test_rank_orders_by_overlap_then_signup():
+    ranker = FeedRanker(initial_capacity=1)
+    ranker.upsert("me", ["Python", "rust "], ["ml"])
+    ranker.upsert("none", [], [])
+    ranker.upsert("one", ["python"], [])
+    ranker.upsert("three", ["python", "rust"], ["ML"])
+    ranker.upsert("also-one", [], ["ml"])
+    assert ranker.rank("me", NOTHING, 10) == ["three", "one", "also-one", "none"]
+    assert ranker.rank("me", NOTHING, 2) == ["three", "one"]
+
+
+def test_rank_skips_excluded_and_unprofiled_rows():
+    ranker = FeedRanker()
+    ranker.upsert("me", ["go"], [])
+    ranker.upsert("seen", ["go"], [])
+    ranker.upsert("fresh", ["go"], [])
+    # A row created for a swipe or edge only, without a loaded profile
+    ranker.row_for("ghost")
+    assert ranker.rank("me", np.array([ranker.row_for("seen")]), 10) == ["fresh"]
+
+
+def test_upsert_replaces_earlier_terms_and_boost_adds_to_score():
+    ranker = FeedRanker()
+    ranker.upsert("me", ["go"], [])
+    ranker.upsert("a", ["go"], [])
+    ranker.upsert("b", ["java"], [])
+    ranker.upsert("a", ["java"], [])
+    boost = np.zeros(len(ranker), dtype=np.int32)
+    boost[ranker.row_for("b")] = 2
+    assert ranker.rank("me", NOTHING, 10, boost=boost) == ["b", "a"]
+
+
+@pytest.mark.anyio
+async def test_feed_ranks_by_overlap_and_picks_up_edits_from_other_workers(api):
+    me = await api.signup("me", skills=["python", "rust"], interests=["ml"])
+    close = await api.signup("close", skills=["python", "rust"])
+    far = await api.signup("far", skills=["cobol"])
+    feed = (await api.http.get("/api/feed", headers=me.headers)).json()
+    assert [user["id"] for user in feed] == [close.id, far.id]
+
+    # Another worker saves an edit: only Mongo changes, not this worker's ranker
+    await api.server.db.users.update_one(
+        {"id": far.id},
+        {"$set": {"skills": ["python", "rust"], "interests": ["ml"], "updated_at": datetime.now(timezone.utc)}}
+    )
+    feed = (await api.http.get("/api/feed", headers=me.headers)).json()
+    assert [user["id"] for user in feed] == [far.id, close.id]
@@ -0,0 +1,86 @@
+from datetime import datetime, timezone
+
+import numpy as np
+import pytest
+
+from graph_engine import ConnectionGraph
+
+EDGES = [(0, 1), (0, 2), (1, 2), (1, 3), (2, 3), (3, 4)]
+
+
+def test_load_stores_both_directions_sorted():
+    graph = ConnectionGraph()
+    graph.load([(1, 0), (0, 2), (2, 0)])
+    assert graph.neighbors(0).tolist() == [1, 2]
+    assert graph.neighbors(1).tolist() == [0]
+    assert graph.edge_count == 4
+    assert graph.neighbors(9).tolist() == []
+
+
+def test_delta_edges_match_a_full_rebuild():
+    incremental = ConnectionGraph(compact_threshold=1_000)
+    incremental.load(EDGES[:3])
+    for a, b in EDGES[3:]:
+        incremental.add_edge(a, b)
+    # Already in the base arrays: not counted again
+    incremental.add_edge(0, 1)
+    rebuilt = ConnectionGraph()
+    rebuilt.load(EDGES)
+    assert incremental.edge_count == rebuilt.edge_count == 2 * len(EDGES)
+    for node in range(5):
+        assert incremental.neighbors(node).tolist() == rebuilt.neighbors(node).tolist()
+
+    incremental.compact()
+    assert incremental.delta_size == 0
+    assert incremental.neighbor_ids.tolist() == rebuilt.neighbor_ids.tolist()
+
+
+def test_add_edge_compacts_past_threshold():
+    graph = ConnectionGraph(compact_threshold=3)
+    graph.load([])
+    graph.add_edge(0, 1)
+    graph.add_edge(1, 2)
+    assert graph.delta_size == 0 and graph.neighbors(1).tolist() == [0, 2]
+
+
+def test_mutual_and_suggestions():
+    graph = ConnectionGraph()
+    graph.load(EDGES)
+    assert graph.mutual(0, 3).tolist() == [1, 2]
+    counts = graph.mutual_counts(0, 5)
+    # Only node 3 is a friend of a friend; 0 itself and its connections score zero
+    assert counts.tolist() == [0, 0, 0, 2, 0]
+    assert graph.suggestions(4, 5, np.zeros(0, dtype=np.int32), 10) == [(1, 1), (2, 1)]
+    assert graph.suggestions(4, 5, np.array([1], dtype=np.int32), 10) == [(2, 1)]
+    assert graph.suggestions(4, 5, np.zeros(0, dtype=np.int32), 1) == [(1, 1)]
+
+
+async def accept_elsewhere(db, a, b):
+    # What accept_friend_request on another worker leaves in Mongo
+    now = datetime.now(timezone.utc)
+    for from_id, to_id in ((a.id, b.id), (b.id, a.id)):
+        await db.edges.update_one(
+            {"from_id": from_id, "to_id": to_id},
+            {"$set": {"state": "accepted", "updated_at": now}, "$setOnInsert": {"created_at": now}},
+            upsert=True
+        )
+
+
+@pytest.mark.anyio
+async def test_graph_picks_up_connections_accepted_on_other_workers(api):
+    alice, bob, carol, dave = [await api.signup(name) for name in ("alice", "bob", "carol", "dave")]
+    await api.connect(alice, bob)
+    await api.connect(bob, carol)
+    suggestions = (await api.http.get("/api/suggestions", headers=alice.headers)).json()
+    assert [(user["id"], user["mutual_count"]) for user in suggestions] == [(carol.id, 1)]
+
+    await accept_elsewhere(api.server.db, alice, carol)
+    await accept_elsewhere(api.server.db, carol, dave)
+    await accept_elsewhere(api.server.db, bob, dave)
+
+    # Carol is a connection now, not a suggestion; Dave is a friend of two friends
+    suggestions = (await api.http.get("/api/suggestions", headers=alice.headers)).json()
+    assert [(user["id"], user["mutual_count"]) for user in suggestions] == [(dave.id, 2)]
+    mutual = (await api.http.get(f"/api/users/{dave.id}/mutual-connections", headers=alice.headers)).json()
+    assert mutual["count"] == 2 and sorted(mutual["user_ids"]) == sorted([bob.id, carol.id])
+    assert api.server.connection_graph.synced_until is not None
@@ -0,0 +1,69 @@
+import io
+
+import pytest
+from PIL import Image
+
+from images import UnsatisfiableRange, parse_range
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("bytes=0-99", (0, 99)),
+    ("bytes=10-", (10, 999)),
+    ("bytes=900-5000", (900, 999)),
+    ("bytes=-100", (900, 999)),
+    ("bytes=-5000", (0, 999)),
+    ("bytes=0-1,5-6", None),
+    ("items=0-1", None),
+    ("bytes=a-b", None),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=1000-", "bytes=20-10"])
+def test_parse_range_unsatisfiable(header):
+    with pytest.raises(UnsatisfiableRange):
+        parse_range(header, 1000)
+
+
+def png(size=(300, 200)):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, (200, 30, 30)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+@pytest.mark.anyio
+async def test_upload_then_serve_with_ranges_and_etag(api):
+    alice = await api.signup("alice")
+    body = png()
+    upload = await api.http.post("/api/profile/image", content=body, headers={**alice.headers, "Content-Type": "image/png"})
+    assert upload.status_code == 200, upload.text
+    image = upload.json()
+    profile = (await api.http.get("/api/profile", headers=alice.headers)).json()
+    assert profile["profile_pic"] == image["profile_pic"]
+
+    full = await api.http.get(image["profile_pic"])
+    assert full.content == body and full.headers["content-type"] == "image/png"
+    assert full.headers["accept-ranges"] == "bytes"
+    cached = await api.http.get(image["profile_pic"], headers={"If-None-Match": full.headers["etag"]})
+    assert cached.status_code == 304
+
+    part = await api.http.get(image["profile_pic"], headers={"Range": "bytes=0-9"})
+    assert part.status_code == 206 and part.content == body[:10]
+    assert part.headers["content-range"] == f"bytes 0-9/{len(body)}"
+    beyond = await api.http.get(image["profile_pic"], headers={"Range": f"bytes={len(body)}-"})
+    assert beyond.status_code == 416
+
+    thumbnail = await api.http.get(image["thumbnails"]["64"])
+    assert max(Image.open(io.BytesIO(thumbnail.content)).size) <= 64
+
+
+@pytest.mark.anyio
+async def test_upload_rejects_non_images(api):
+    alice = await api.signup("alice")
+    garbage = await api.http.post("/api/profile/image", content=b"not an image", headers={**alice.headers, "Content-Type": "image/png"})
+    assert garbage.status_code == 400
+    text = await api.http.post("/api/profile/image", content=b"hello", headers={**alice.headers, "Content-Type": "text/plain"})
+    assert text.status_code == 415
+    assert (await api.http.get("/api/images/not-a-hash.png")).status_code == 404
@@ -0,0 +1,53 @@
+import asyncio
+
+import pytest
+
+from migrate import MESSAGE_PREVIEW_LENGTH
+
+
+async def send(api, sender, receiver, text):
+    response = await api.http.post("/api/chat/send", json={"receiver_id": receiver.id, "text": text}, headers=sender.headers)
+    assert response.status_code == 200, response.text
+
+
+async def inbox(api, user, **params):
+    response = await api.http.get("/api/conversations", params=params, headers=user.headers)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+@pytest.mark.anyio
+async def test_inbox_tracks_last_message_and_unread_counts(api):
+    alice, bob = await api.signup("alice"), await api.signup("bob")
+    await api.connect(alice, bob)
+    await send(api, alice, bob, "hi")
+    await send(api, alice, bob, "x" * (MESSAGE_PREVIEW_LENGTH + 50))
+
+    [entry] = await inbox(api, bob)
+    assert entry["participant_id"] == alice.id and entry["unread_count"] == 2
+    assert entry["last_message"]["sender_id"] == alice.id
+    assert len(entry["last_message"]["text"]) == MESSAGE_PREVIEW_LENGTH
+    assert (await inbox(api, alice))[0]["unread_count"] == 0
+
+    # Replying reads the conversation for the sender
+    await send(api, bob, alice, "hey")
+    assert (await inbox(api, bob))[0]["unread_count"] == 0
+    assert (await inbox(api, alice))[0]["unread_count"] == 1
+    read = await api.http.post(f"/api/conversations/{bob.id}/read", headers=alice.headers)
+    assert read.json()["success"]
+    assert (await inbox(api, alice))[0]["unread_count"] == 0
+
+
+@pytest.mark.anyio
+async def test_inbox_pages_most_recent_first(api):
+    me = await api.signup("me")
+    others = [await api.signup(f"friend{i}") for i in range(3)]
+    for other in others:
+        await api.connect(me, other)
+        await send(api, other, me, "hi")
+        await asyncio.sleep(0.005)
+
+    first = await inbox(api, me, limit=2)
+    assert [entry["participant_id"] for entry in first] == [others[2].id, others[1].id]
+    rest = await inbox(api, me, limit=2, before=first[-1]["updated_at"])
+    assert [entry["participant_id"] for entry in rest] == [others[0].id]
@@ -0,0 +1,26 @@
+import pytest
+
+
+class FailingStop:
+    async def stop(self):
+        raise RuntimeError("broker connection already gone")
+
+
+@pytest.mark.anyio
+async def test_shutdown_after_a_failed_startup(server, monkeypatch):
+    # Startup died before the message store was created
+    monkeypatch.setattr(server, "message_store", None)
+    await server.app.router.shutdown()
+
+
+@pytest.mark.anyio
+async def test_one_failing_shutdown_step_does_not_skip_the_rest(server, monkeypatch, caplog):
+    await server.app.router.startup()
+    monkeypatch.setattr(server.manager, "broker", FailingStop())
+    stopped = []
+    monkeypatch.setattr(server.message_store, "stop", lambda: stopped.append("message store"))
+    monkeypatch.setattr(server.password_hasher, "shutdown", lambda: stopped.append("password hasher"))
+
+    await server.app.router.shutdown()
+    assert stopped == ["message store", "password hasher"]
+    assert "Shutdown step failed: broker" in caplog.text
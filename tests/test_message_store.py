@@ -0,0 +1,147 @@
+import asyncio
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+from message_store import BucketMessageStore, DocumentMessageStore, _PageCollector
+
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def message(i, timestamp):
+    return {"id": f"m{i:03d}", "conversation_id": "a:b", "sender_id": "a", "receiver_id": "b",
+            "text": str(i), "timestamp": timestamp}
+
+
+def key(m):
+    return m["timestamp"].replace(tzinfo=None), m["id"]
+
+
+def conversation(count=60):
+    # Ten messages a day, several sharing a timestamp so cursors must break ties on id
+    return [message(i, START + timedelta(days=i // 10, seconds=(i * 7) % 3)) for i in range(count)]
+
+
+async def walk(store, limit, forward):
+    # Every page from newest to oldest (or oldest to newest), following the cursors
+    pages, cursor = [], None
+    if forward:
+        cursor = (START - timedelta(days=1), "")
+    while True:
+        page, has_more = await store.page("a:b", None if forward else cursor, cursor if forward else None, limit)
+        pages.append(([m["id"] for m in page], has_more))
+        if not page or not has_more:
+            return pages
+        edge = page[-1] if forward else page[0]
+        cursor = (edge["timestamp"], edge["id"])
+
+
+async def stores(archive_dir=None, archive_before=None):
+    db = AsyncMongoMockClient()["test_" + uuid.uuid4().hex]
+    documents = DocumentMessageStore(db)
+    buckets = BucketMessageStore(db, bucket_size=7, archive_dir=archive_dir)
+    for m in conversation():
+        await documents.insert_one(dict(m))
+        await buckets.insert_one(dict(m))
+    if archive_before is not None:
+        assert await buckets.archive_older_than(archive_before) > 0
+    return db, documents, buckets
+
+
+@pytest.mark.parametrize("archived", ["none", "inline", "files"])
+@pytest.mark.parametrize("limit", [1, 5, 13, 100])
+@pytest.mark.parametrize("forward", [False, True])
+def test_bucket_pages_match_document_pages(tmp_path, archived, limit, forward):
+    async def check():
+        archive_before = None if archived == "none" else datetime(2024, 1, 4)
+        archive_dir = str(tmp_path) if archived == "files" else None
+        _, documents, buckets = await stores(archive_dir, archive_before)
+        assert await walk(buckets, limit, forward) == await walk(documents, limit, forward)
+
+    asyncio.run(check())
+
+
+def test_archive_files_replace_inline_messages(tmp_path):
+    async def check():
+        db, _, buckets = await stores(str(tmp_path), datetime(2024, 1, 4))
+        archived = await db.message_archive.find().to_list(length=None)
+        assert archived and all("file" in bucket and "messages" not in bucket for bucket in archived)
+        assert list(tmp_path.rglob("*.bson.gz"))
+        # Each message exactly once, whichever tier it lives in
+        exported = [m["id"] async for m in buckets.conversation_messages("a:b", 10)]
+        assert sorted(exported) == [m["id"] for m in conversation()]
+
+    asyncio.run(check())
+
+
+def test_duplicate_across_buckets_is_returned_once():
+    async def check():
+        db = AsyncMongoMockClient()["test_" + uuid.uuid4().hex]
+        buckets = BucketMessageStore(db, bucket_size=2)
+        messages = conversation(5)
+        for m in messages:
+            await buckets.insert_one(dict(m))
+        # A retried write lands the same message in a later bucket
+        await buckets.insert_one(dict(messages[1]))
+        page, has_more = await buckets.page("a:b", None, None, 10)
+        assert [m["id"] for m in page] == [m["id"] for m in sorted(messages, key=key)]
+        assert not has_more
+
+    asyncio.run(check())
+
+
+def test_collector_keeps_limit_plus_one_newest_before_cursor():
+    ordered = sorted(conversation(20), key=key)
+    page = _PageCollector(key(ordered[15]), None, 3)
+    page.add(ordered[:2])
+    assert not page.full
+    page.add(ordered[2:])
+    assert page.full
+    assert page.messages() == ordered[11:15][::-1]
+    # A bucket ending before the threshold cannot improve the page
+    assert page.beyond({"start": START, "end": ordered[9]["timestamp"]})
+    # Ending on the threshold itself it may still hold a tied message
+    assert not page.beyond({"start": START, "end": ordered[10]["timestamp"]})
+    assert not page.beyond({"start": START, "end": ordered[19]["timestamp"]})
+
+
+def test_collector_pages_forward_from_after_cursor():
+    ordered = sorted(conversation(20), key=key)
+    page = _PageCollector(None, key(ordered[4]), 2)
+    page.add(ordered[::-1])
+    assert page.messages() == ordered[5:8]
+    assert page.beyond({"start": ordered[19]["timestamp"], "end": ordered[19]["timestamp"]})
+    assert not page.beyond({"start": ordered[5]["timestamp"], "end": ordered[19]["timestamp"]})
+
+
+@pytest.fixture
+def server(server, monkeypatch):
+    # Bucketed layout for the endpoint tests below
+    monkeypatch.setattr(server, "MESSAGE_STORE_OPTIONS", {**server.MESSAGE_STORE_OPTIONS, "layout": "buckets", "bucket_size": 2})
+    return server
+
+
+@pytest.mark.anyio
+async def test_chat_endpoints_in_bucket_mode(api):
+    alice, bob = await api.signup("alice"), await api.signup("bob")
+    await api.connect(alice, bob)
+    sent = []
+    for i in range(5):
+        response = await api.http.post("/api/chat/send", json={"receiver_id": bob.id, "text": f"m{i}"}, headers=alice.headers)
+        sent.append(response.json()["id"])
+    assert await api.server.db.messages.count_documents({}) == 0
+    assert await api.server.db.message_buckets.count_documents({}) == 3
+
+    ids, params = [], {"limit": 2}
+    while True:
+        page = (await api.http.get(f"/api/chat/{alice.id}/history", params=params, headers=bob.headers)).json()
+        ids = [message["id"] for message in page["messages"]] + ids
+        if not page["has_more"]:
+            break
+        params["before"] = page["before_cursor"]
+    assert ids == sent
+
+    exported = (await api.http.get(f"/api/export/chat/{bob.id}", headers=alice.headers)).text.splitlines()
+    assert len(exported) == 5
@@ -0,0 +1,133 @@
+import asyncio
+
+import pytest
+from pymongo.errors import AutoReconnect, BulkWriteError
+
+from message_writer import MessageRejected, MessageWriter
+
+
+class FakeStore:
+    """Records insert_many batches; texts listed in `reject` fail like a validation error."""
+
+    def __init__(self, reject=(), outages=0):
+        self.reject = set(reject)
+        self.outages = outages
+        self.batches = []
+        self.stored = []
+
+    async def insert_many(self, documents, ordered=True):
+        if self.outages:
+            self.outages -= 1
+            raise AutoReconnect("primary stepped down")
+        self.batches.append([document["id"] for document in documents])
+        for index, document in enumerate(documents):
+            if document["text"] in self.reject:
+                raise BulkWriteError({"nInserted": index, "writeErrors": [
+                    {"index": index, "code": 121, "errmsg": "Document failed validation"}
+                ]})
+            self.stored.append(document["id"])
+
+    async def insert_one(self, document):
+        await self.insert_many([document])
+
+
+class FakeCollection:
+    def __init__(self):
+        self.documents = []
+
+    async def insert_one(self, document):
+        self.documents.append(document)
+
+
+def message(i, text="hi"):
+    return {"id": f"m{i}", "text": text}
+
+
+def run_writer(store, check, dead_letters=None, **options):
+    async def main():
+        writer = MessageWriter(mode="batched", **options)
+        await writer.start(store, dead_letters)
+        try:
+            await check(writer)
+        finally:
+            await writer.stop()
+
+    asyncio.run(main())
+
+
+def test_batched_write_returns_once_stored_and_shares_a_batch():
+    store = FakeStore()
+
+    async def check(writer):
+        await asyncio.gather(*(writer.write(message(i)) for i in range(5)))
+        assert store.stored == [f"m{i}" for i in range(5)]
+        assert store.batches == [[f"m{i}" for i in range(5)]]
+        assert writer.pending == 0 and not writer.waiters
+
+    run_writer(store, check, flush_interval=0.01)
+
+
+def test_rejected_message_raises_and_the_rest_are_written():
+    store = FakeStore(reject={"poison"})
+    dead_letters = FakeCollection()
+
+    async def check(writer):
+        results = await asyncio.gather(
+            writer.write(message(0)), writer.write(message(1, "poison")), writer.write(message(2)),
+            return_exceptions=True
+        )
+        assert results[0] is None and results[2] is None
+        assert isinstance(results[1], MessageRejected)
+        assert store.stored == ["m0", "m2"]
+        assert [record["message"]["id"] for record in dead_letters.documents] == ["m1"]
+        assert writer.stats()["dead_lettered"] == 1
+
+    run_writer(store, check, dead_letters, flush_interval=0.01)
+
+
+def test_transient_failure_is_retried_before_write_returns():
+    store = FakeStore(outages=2)
+
+    async def check(writer):
+        await writer.write(message(0))
+        assert store.stored == ["m0"] and writer.flush_errors == 2
+
+    run_writer(store, check, flush_interval=0.01)
+
+
+@pytest.fixture
+def server(server, monkeypatch):
+    # Write-behind batching on for the endpoint tests below
+    monkeypatch.setattr(server, "message_writer", MessageWriter(mode="batched", flush_interval=0.01))
+    return server
+
+
+@pytest.mark.anyio
+async def test_send_answers_after_the_message_is_stored(api):
+    alice, bob = await api.signup("alice"), await api.signup("bob")
+    await api.connect(alice, bob)
+    socket = api.websocket(bob)
+    await socket.connect()
+    try:
+        sent = await api.http.post("/api/chat/send", json={"receiver_id": bob.id, "text": "hi"}, headers=alice.headers)
+        assert sent.status_code == 200
+        # By the time the sender has an answer the message is in Mongo, not only in the buffer
+        assert api.server.message_writer.pending == 0
+        assert await api.server.db.messages.count_documents({"id": sent.json()["id"]}) == 1
+        pushed = await socket.receive_text()
+        assert sent.json()["id"] in pushed
+    finally:
+        await socket.close()
+
+
+@pytest.mark.anyio
+async def test_rejected_message_is_neither_acked_nor_delivered(api, monkeypatch):
+    alice, bob = await api.signup("alice"), await api.signup("bob")
+    await api.connect(alice, bob)
+    store = FakeStore(reject={"poison"})
+    monkeypatch.setattr(api.server.message_writer, "store", store)
+
+    sent = await api.http.post("/api/chat/send", json={"receiver_id": bob.id, "text": "poison"}, headers=alice.headers)
+    assert sent.status_code == 400
+    assert await api.server.db.conversations.count_documents({}) == 0
+    assert await api.server.db.message_dead_letters.count_documents({}) == 1
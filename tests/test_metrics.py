@@ -0,0 +1,67 @@
+from types import SimpleNamespace
+
+import pytest
+
+from metrics import CONTENT_TYPE, MongoCommandMetrics, Registry
+
+
+def test_registry_renders_the_text_exposition_format():
+    registry = Registry()
+    requests = registry.counter("requests_total", "Requests", ("route",))
+    latency = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+    registry.callback("queue_size", "Queued", lambda: 3)
+    requests.inc('/a"b')
+    requests.inc('/a"b', amount=2)
+    for value in (0.05, 0.1, 0.5, 7.0):
+        latency.observe(value)
+
+    assert registry.render().splitlines() == [
+        "# HELP requests_total Requests",
+        "# TYPE requests_total counter",
+        'requests_total{route="/a\\"b"} 3',
+        "# HELP latency_seconds Latency",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{le="0.1"} 2',
+        'latency_seconds_bucket{le="1.0"} 3',
+        'latency_seconds_bucket{le="+Inf"} 4',
+        "latency_seconds_sum 7.65",
+        "latency_seconds_count 4",
+        "# HELP queue_size Queued",
+        "# TYPE queue_size gauge",
+        "queue_size 3",
+    ]
+
+
+def test_command_listener_times_commands_by_collection():
+    registry = Registry()
+    latency = registry.histogram("mongo_seconds", "Latency", ("collection", "command"), buckets=(1.0,))
+    failures = registry.counter("mongo_failures_total", "Failures", ("collection", "command"))
+    listener = MongoCommandMetrics(latency, failures)
+
+    def event(request_id, **fields):
+        return SimpleNamespace(connection_id=("localhost", 27017), request_id=request_id, **fields)
+
+    listener.started(event(1, command_name="find", command={"find": "users"}))
+    listener.started(event(2, command_name="ping", command={"ping": 1}))
+    listener.succeeded(event(1, command_name="find", duration_micros=2000))
+    listener.failed(event(2, command_name="ping", duration_micros=500))
+
+    assert set(latency.series) == {("users", "find"), ("", "ping")}
+    assert failures.values == {("", "ping"): 1}
+    assert not listener.inflight
+
+
+@pytest.mark.anyio
+async def test_metrics_endpoint_reports_requests_by_route_template(api):
+    alice = await api.signup("alice")
+    await api.http.get(f"/api/users/{alice.id}", headers=alice.headers)
+    await api.http.get("/no/such/path")
+
+    response = await api.http.get("/metrics")
+    assert response.headers["content-type"] == CONTENT_TYPE
+    body = response.text
+    assert 'http_requests_total{method="GET",route="/api/users/{user_id}",status="200"}' in body
+    assert 'http_requests_total{method="GET",route="unmatched",status="404"}' in body
+    assert alice.id not in body
+    assert 'route="/metrics"' not in body
+    assert "websocket_connections 0" in body
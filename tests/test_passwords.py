@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+
+from passwords import PasswordHasher, PasswordHasherBusy
+
+
+def test_hash_verify_and_rehash_check():
+    async def main():
+        hasher = PasswordHasher(rounds=4)
+        try:
+            hashed = await hasher.hash("pw")
+            assert await hasher.verify("pw", hashed)
+            assert not await hasher.verify("wrong", hashed)
+            assert not hasher.needs_rehash(hashed)
+            assert PasswordHasher(rounds=5).needs_rehash(hashed)
+            assert hasher.needs_rehash("not-a-bcrypt-hash")
+        finally:
+            hasher.shutdown()
+
+    asyncio.run(main())
+
+
+def test_calls_beyond_the_queue_cap_are_rejected():
+    async def main():
+        hasher = PasswordHasher(rounds=4, max_workers=1, max_pending=1)
+        try:
+            results = await asyncio.gather(hasher.hash("a"), hasher.hash("b"), return_exceptions=True)
+            assert isinstance(results[0], str)
+            assert isinstance(results[1], PasswordHasherBusy)
+        finally:
+            hasher.shutdown()
+
+    asyncio.run(main())
+
+
+async def signup(api, email):
+    response = await api.http.post("/api/auth/signup", json={"name": "alice", "email": email, "password": "pw"})
+    assert response.status_code == 200, response.text
+    return response.json()["user"]["id"]
+
+
+@pytest.mark.anyio
+async def test_login_upgrades_the_hash_to_the_configured_cost(api, monkeypatch):
+    user_id = await signup(api, "alice@example.com")
+    monkeypatch.setattr(api.server, "password_hasher", PasswordHasher(rounds=5))
+
+    response = await api.http.post("/api/auth/login", json={"email": "alice@example.com", "password": "pw"})
+    assert response.status_code == 200
+    stored = (await api.server.db.users.find_one({"id": user_id}))["password"]
+    assert stored.startswith("$2b$05$")
+
+
+@pytest.mark.anyio
+async def test_saturated_hasher_answers_503(api, monkeypatch):
+    await signup(api, "alice@example.com")
+    monkeypatch.setattr(api.server, "password_hasher", PasswordHasher(rounds=4, max_pending=0))
+
+    response = await api.http.post("/api/auth/login", json={"email": "alice@example.com", "password": "pw"})
+    assert response.status_code == 503 and response.headers["Retry-After"] == "1"
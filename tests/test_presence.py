@@ -0,0 +1,93 @@
+import asyncio
+
+import pytest
+from pymongo.errors import AutoReconnect
+
+from presence import PresenceRegistry
+
+
+class FakeUsers:
+    def __init__(self, outages=0):
+        self.outages = outages
+        self.writes = []
+
+    async def bulk_write(self, operations, ordered=True):
+        if self.outages:
+            self.outages -= 1
+            raise AutoReconnect("primary stepped down")
+        self.writes.append({op._filter["id"]: op._doc["$set"]["is_online"] for op in operations})
+
+
+def run(check, **options):
+    async def main():
+        registry = PresenceRegistry(flush_interval=3600, **options)
+        users = FakeUsers()
+        await registry.start(users)
+        try:
+            await check(registry, users)
+        finally:
+            registry.flusher.cancel()
+
+    asyncio.run(main())
+
+
+def test_quick_reconnect_writes_nothing():
+    async def check(registry, users):
+        registry.connected("a")
+        assert await registry.flush() == 1
+        registry.disconnected("a")
+        registry.connected("a")
+        await registry.flush()
+        await registry.flush(force=True)
+        assert users.writes == [{"a": True}]
+
+    run(check, debounce_seconds=10)
+
+
+def test_going_offline_is_written_after_the_debounce():
+    async def check(registry, users):
+        registry.connected("a")
+        registry.connected("a")
+        registry.disconnected("a")
+        assert registry.is_online("a")
+        registry.disconnected("a")
+        assert registry.is_online("a") is False
+        # Never flushed as online, so a single write carries the final state
+        await registry.flush()
+        assert users.writes == [{"a": False}]
+        # Written: the stored document is authoritative again
+        assert registry.is_online("a") is None
+        assert registry.apply({"id": "a", "is_online": False}) == {"id": "a", "is_online": False}
+
+    run(check, debounce_seconds=0)
+
+
+def test_failed_flush_is_retried():
+    async def check(registry, users):
+        users.outages = 1
+        registry.connected("a")
+        registry.connected("b")
+        with pytest.raises(AutoReconnect):
+            await registry.flush()
+        assert await registry.flush() == 2
+        assert users.writes == [{"a": True, "b": True}]
+
+    run(check)
+
+
+@pytest.mark.anyio
+async def test_sockets_show_up_as_online_to_connections(api):
+    alice, bob = await api.signup("alice"), await api.signup("bob")
+    await api.connect(alice, bob)
+
+    socket = api.websocket(bob)
+    await socket.connect()
+    try:
+        presence = (await api.http.get("/api/connections/presence", headers=alice.headers)).json()
+        assert [(user["id"], user["is_online"]) for user in presence] == [(bob.id, True)]
+        # Nothing is written until the flush
+        assert not (await api.server.db.users.find_one({"id": bob.id}))["is_online"]
+        await api.server.presence.flush()
+        assert (await api.server.db.users.find_one({"id": bob.id}))["is_online"]
+    finally:
+        await socket.close()
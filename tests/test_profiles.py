@@ -0,0 +1,22 @@
+import pytest
+
+
+@pytest.mark.anyio
+async def test_other_users_profile_leaves_out_account_fields(api):
+    alice = await api.signup("alice", bio="compilers", skills=["rust"])
+    bob = await api.signup("bob")
+
+    profile = (await api.http.get(f"/api/users/{alice.id}", headers=bob.headers)).json()
+    assert "email" not in profile
+    assert profile["id"] == alice.id and profile["bio"] == "compilers" and profile["skills"] == ["rust"]
+    assert profile["created_at"].endswith("Z")
+
+    own = (await api.http.get("/api/profile", headers=alice.headers)).json()
+    assert own["email"].startswith("alice-")
+
+
+@pytest.mark.anyio
+async def test_unknown_user_profile_is_404(api):
+    bob = await api.signup("bob")
+    response = await api.http.get("/api/users/nope", headers=bob.headers)
+    assert response.status_code == 404
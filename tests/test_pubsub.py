@@ -0,0 +1,119 @@
+import asyncio
+import json
+import shutil
+import tempfile
+
+import pytest
+
+from pubsub import MAX_DATAGRAM_BYTES, InProcessBroker, MemoryPubSubClient, RedisBroker, UnixSocketBroker, create_broker
+
+
+class Inbox:
+    def __init__(self):
+        self.received = []
+        self.arrived = asyncio.Event()
+
+    async def deliver(self, user_id, message):
+        self.received.append((user_id, message))
+        self.arrived.set()
+
+
+@pytest.fixture
+def socket_dir():
+    # AF_UNIX paths are limited to about 100 bytes, so stay out of pytest's long tmp paths
+    directory = tempfile.mkdtemp(prefix="ws-", dir="/tmp")
+    yield directory
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+def test_create_broker_checks_its_configuration(socket_dir):
+    assert type(create_broker("memory")) is InProcessBroker
+    assert isinstance(create_broker("unix", socket_dir=socket_dir), UnixSocketBroker)
+    with pytest.raises(ValueError, match="REDIS_URL"):
+        create_broker("redis")
+    with pytest.raises(ValueError, match="Unknown"):
+        create_broker("carrier-pigeon")
+
+
+def test_unix_brokers_fan_out_to_the_worker_holding_the_user(socket_dir):
+    async def main():
+        a_inbox, b_inbox = Inbox(), Inbox()
+        a, b = UnixSocketBroker(socket_dir), UnixSocketBroker(socket_dir)
+        await a.start(a_inbox.deliver)
+        await b.start(b_inbox.deliver)
+        try:
+            await b.subscribe("bob")
+            await a.publish("bob", "hi")
+            await asyncio.wait_for(b_inbox.arrived.wait(), 1)
+            assert b_inbox.received == [("bob", "hi")] and a_inbox.received == []
+
+            # Unsubscribed users are ignored, and oversized messages stay on the publishing worker
+            await b.unsubscribe("bob")
+            await a.publish("bob", "gone")
+            await asyncio.sleep(0.05)
+            await b.subscribe("bob")
+            await a.publish("bob", "x" * MAX_DATAGRAM_BYTES)
+            await asyncio.sleep(0.05)
+            assert b_inbox.received == [("bob", "hi")]
+        finally:
+            await a.stop()
+            await b.stop()
+
+    asyncio.run(main())
+
+
+def test_unix_broker_removes_sockets_of_dead_workers(socket_dir):
+    async def main():
+        alive = UnixSocketBroker(socket_dir)
+        await alive.start(Inbox().deliver)
+        dead = UnixSocketBroker(socket_dir)
+        await dead.start(Inbox().deliver)
+        dead.transport.close()
+        await asyncio.sleep(0)
+        try:
+            await alive.publish("bob", "hi")
+            assert not dead.path.exists() and alive.path.exists()
+        finally:
+            await alive.stop()
+            await dead.stop()
+
+    asyncio.run(main())
+
+
+def test_redis_broker_delivers_through_the_subscribed_channel():
+    async def main():
+        client, inbox = MemoryPubSubClient(), Inbox()
+        publisher, holder = RedisBroker(client), RedisBroker(client)
+        await publisher.start(Inbox().deliver)
+        await holder.start(inbox.deliver)
+        try:
+            await holder.subscribe("bob")
+            await publisher.publish("bob", json.dumps({"type": "message"}))
+            await publisher.publish("carol", "nobody listens")
+            await asyncio.wait_for(inbox.arrived.wait(), 1)
+            assert inbox.received == [("bob", '{"type": "message"}')]
+        finally:
+            await publisher.stop()
+            await holder.stop()
+
+    asyncio.run(main())
+
+
+@pytest.fixture
+def server(server, monkeypatch):
+    monkeypatch.setattr(server, "manager", server.ConnectionManager(RedisBroker(MemoryPubSubClient())))
+    return server
+
+
+@pytest.mark.anyio
+async def test_chat_push_goes_through_the_broker(api):
+    alice, bob = await api.signup("alice"), await api.signup("bob")
+    await api.connect(alice, bob)
+    socket = api.websocket(bob)
+    await socket.connect()
+    try:
+        sent = await api.http.post("/api/chat/send", json={"receiver_id": bob.id, "text": "hi"}, headers=alice.headers)
+        pushed = json.loads(await asyncio.wait_for(socket.receive_text(), 2))
+        assert pushed["message"]["id"] == sent.json()["id"]
+    finally:
+        await socket.close()
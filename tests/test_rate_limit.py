@@ -0,0 +1,151 @@
+import asyncio
+
+import pytest
+
+import rate_limit
+from rate_limit import AdmissionMiddleware, ConcurrencyLimiter, Limit, MemoryBucketStore, RouteClass, client_ip
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(rate_limit.time, "monotonic", lambda: now[0])
+    return now
+
+
+def take(store, key, limit):
+    return asyncio.run(store.take(key, limit))
+
+
+def test_limit_parse():
+    assert Limit.parse("10/60") == Limit(rate=10 / 60, capacity=10)
+    assert Limit.parse("5") == Limit(rate=5, capacity=5)
+
+
+def test_bucket_allows_burst_then_refills(clock):
+    store = MemoryBucketStore()
+    limit = Limit.parse("2/10")
+    assert take(store, "k", limit) == (True, 0.0)
+    assert take(store, "k", limit) == (True, 0.0)
+    allowed, retry_after = take(store, "k", limit)
+    assert not allowed and retry_after == pytest.approx(5.0)
+    # Other keys have their own bucket
+    assert take(store, "other", limit)[0]
+    clock[0] += 5
+    assert take(store, "k", limit)[0]
+    assert not take(store, "k", limit)[0]
+
+
+def test_idle_buckets_are_evicted(clock):
+    store = MemoryBucketStore()
+    limit = Limit.parse("2/10")
+    take(store, "idle", limit)
+    clock[0] += 4
+    take(store, "busy", limit)
+    assert list(store.buckets) == ["idle", "busy"]
+    clock[0] += 6
+    take(store, "new", limit)
+    assert list(store.buckets) == ["busy", "new"] and store.evictions == 1
+
+
+def test_max_keys_evicts_least_recently_used(clock):
+    store = MemoryBucketStore(max_keys=2)
+    limit = Limit.parse("2/10")
+    for key in ("a", "b", "a", "c"):
+        take(store, key, limit)
+    assert list(store.buckets) == ["a", "c"]
+
+
+def test_client_ip_uses_trusted_hops_only():
+    scope = {"client": ("10.0.0.9", 1234), "headers": [(b"x-forwarded-for", b"6.6.6.6, 1.2.3.4, 10.0.0.2")]}
+    assert client_ip(scope) == "10.0.0.9"
+    assert client_ip(scope, trusted_proxies=1) == "10.0.0.2"
+    assert client_ip(scope, trusted_proxies=2) == "1.2.3.4"
+    assert client_ip(scope, trusted_proxies=5) == "6.6.6.6"
+    assert client_ip({"headers": []}, trusted_proxies=1) == "unknown"
+
+
+def test_queued_requests_time_out_without_shrinking_the_cap():
+    async def check():
+        limiter = ConcurrencyLimiter(1, max_queued=5, queue_timeout=0.01)
+        assert await limiter.acquire()
+        results = await asyncio.gather(*(limiter.acquire() for _ in range(5)))
+        assert results == [False] * 5
+        # Over the queue bound: rejected without waiting
+        limiter.queued = 5
+        assert not await limiter.acquire()
+        limiter.queued = 0
+        limiter.release()
+        assert await limiter.acquire()
+        limiter.release()
+        assert limiter.in_flight == 0 and limiter.queued == 0
+        assert limiter.semaphore._value == 1
+
+    asyncio.run(check())
+
+
+class LateSemaphore:
+    # Grants the permit even though the wait for it was cancelled
+    def __init__(self):
+        self.released = 0
+
+    async def acquire(self):
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            pass
+        return True
+
+    def release(self):
+        self.released += 1
+
+
+def test_permit_granted_at_the_timeout_is_released():
+    async def check():
+        limiter = ConcurrencyLimiter(1, max_queued=1, queue_timeout=0.01)
+        limiter.in_flight = 1
+        limiter.semaphore = LateSemaphore()
+        assert not await limiter.acquire()
+        assert limiter.semaphore.released == 1 and limiter.in_flight == 1
+
+    asyncio.run(check())
+
+
+async def call(middleware, path="/api/auth/login", headers=(), client=("10.0.0.1", 1234)):
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "POST", "path": path, "headers": list(headers), "client": client}
+    await middleware(scope, receive, send)
+    return sent[0]["status"], dict(sent[0].get("headers", []))
+
+
+async def ok_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b""})
+
+
+def test_middleware_keys_per_ip_classes_by_trusted_hop(caplog):
+    auth = RouteClass("auth", frozenset({"POST"}), ("/api/auth/",), Limit.parse("1/60"), per_ip=True)
+
+    async def check():
+        behind_proxy = AdmissionMiddleware(ok_app, [auth], MemoryBucketStore(), lambda token: None, trusted_proxies=1)
+        first = [(b"x-forwarded-for", b"1.1.1.1")]
+        second = [(b"x-forwarded-for", b"2.2.2.2")]
+        assert (await call(behind_proxy, headers=first))[0] == 200
+        assert (await call(behind_proxy, headers=second))[0] == 200
+        status, headers = await call(behind_proxy, headers=first)
+        assert status == 429 and int(headers[b"retry-after"]) >= 1
+
+        # Without a trusted hop count every client shares the proxy's bucket, and that is logged
+        untrusted = AdmissionMiddleware(ok_app, [auth], MemoryBucketStore(), lambda token: None)
+        assert (await call(untrusted, headers=first))[0] == 200
+        assert (await call(untrusted, headers=second))[0] == 429
+        assert "RATE_LIMIT_TRUSTED_PROXIES" in caplog.text
+
+    asyncio.run(check())
@@ -0,0 +1,70 @@
+import random
+
+from search_index import SearchIndex
+
+PROFILES = [
+    (0, ["Python", "Rust"], ["Hiking"], "Alice Smith"),
+    (1, ["python"], ["hiking", "Chess"], "Bob Stone"),
+    (2, ["Go", "Rust"], [], "Alicia Keys"),
+    (3, [], ["chess"], "Carol"),
+]
+
+
+def built(profiles, bulk):
+    index = SearchIndex()
+    if bulk:
+        index.load(profiles)
+    else:
+        for profile in profiles:
+            index.upsert(*profile)
+    return index
+
+
+def state(index):
+    return ({key: postings.tolist() for key, postings in index.postings.items() if len(postings)},
+            index.vocabulary, index.doc_terms)
+
+
+def test_search_intersects_fields_and_name_prefixes():
+    index = built(PROFILES, bulk=True)
+    assert index.search(skills=["PYTHON"]).tolist() == [0, 1]
+    assert index.search(skills=["python"], interests=["chess"]).tolist() == [1]
+    assert index.search(name_prefix="ali").tolist() == [0, 2]
+    assert index.search(name_prefix="ali sm").tolist() == [0]
+    assert index.search(skills=["cobol"], name_prefix="ali").tolist() == []
+    assert index.search().tolist() == []
+
+
+def test_upsert_replaces_terms():
+    index = built(PROFILES, bulk=False)
+    index.upsert(1, ["Go"], [], "Bob Stone")
+    assert index.search(skills=["python"]).tolist() == [0]
+    assert index.search(skills=["go"]).tolist() == [1, 2]
+    assert len(index) == 4
+
+
+def test_load_matches_upserts():
+    rng = random.Random(7)
+    words = ["python", "go", "rust", "java", "chess", "hiking", "ann", "andy", "bo"]
+    profiles = [
+        (doc, rng.sample(words, 2), rng.sample(words, 1), " ".join(rng.sample(words, 2)))
+        for doc in rng.sample(range(500), 200)
+    ]
+    assert state(built(profiles, bulk=True)) == state(built(profiles, bulk=False))
+
+    # Loading on top of an index: new documents are merged, known ones updated
+    bulk = built(profiles[:100], bulk=True)
+    bulk.load([(profiles[0][0], ["scala"], [], "Zed")] + profiles[100:])
+    upserted = built(profiles, bulk=False)
+    upserted.upsert(profiles[0][0], ["scala"], [], "Zed")
+    assert state(bulk) == state(upserted)
+
+
+def test_autocomplete_orders_by_use_and_skips_empty_terms():
+    index = built(PROFILES, bulk=True)
+    assert index.autocomplete("skill", "r") == [("Rust", 2)]
+    # Ties keep vocabulary order
+    assert index.autocomplete("interest", "") == [("Chess", 2), ("Hiking", 2)]
+    index.upsert(3, [], [], "Carol")
+    assert index.autocomplete("interest", "ch") == [("Chess", 1)]
+    assert index.autocomplete("name", "ali", limit=1) in ([("Alice", 1)], [("Alicia", 1)])
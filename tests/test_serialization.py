@@ -0,0 +1,54 @@
+import json
+from datetime import datetime, timezone
+
+import pytest
+from pydantic import BaseModel
+
+from serialization import UTCDateTime, dump_models, dumps
+
+
+class Stamped(BaseModel):
+    at: UTCDateTime
+
+
+def test_naive_and_aware_utc_encode_the_same():
+    aware = datetime(2026, 10, 17, 2, 17, 7, 860000, tzinfo=timezone.utc)
+    naive = aware.replace(tzinfo=None)
+    expected = "2026-10-17T02:17:07.860000Z"
+    assert json.loads(dumps({"at": naive})) == json.loads(dumps({"at": aware})) == {"at": expected}
+    assert dump_models(Stamped, [{"at": naive}, {"at": aware}]) == [{"at": expected}, {"at": expected}]
+    assert json.loads(dumps(Stamped(at=naive))) == {"at": expected}
+
+
+@pytest.mark.anyio
+async def test_message_timestamp_is_identical_on_every_path(api):
+    alice, bob = await api.signup("alice"), await api.signup("bob")
+    await api.connect(alice, bob)
+
+    socket = api.websocket(bob)
+    await socket.connect()
+    try:
+        sent = await api.http.post("/api/chat/send", json={"receiver_id": bob.id, "text": "hi"}, headers=alice.headers)
+        pushed = json.loads(await socket.receive_text())["message"]
+    finally:
+        await socket.close()
+    history = (await api.http.get(f"/api/chat/{alice.id}/history", headers=bob.headers)).json()["messages"]
+
+    timestamp = sent.json()["timestamp"]
+    assert timestamp.endswith("Z")
+    assert pushed["timestamp"] == timestamp
+    assert [message["timestamp"] for message in history] == [timestamp]
+
+
+@pytest.mark.anyio
+async def test_profile_datetimes_share_one_format(api):
+    alice, bob = await api.signup("alice"), await api.signup("bob")
+    socket = api.websocket(alice)
+    await socket.connect()
+    try:
+        # last_seen now comes from presence, created_at from the stored document
+        profile = (await api.http.get(f"/api/users/{alice.id}", headers=bob.headers)).json()
+    finally:
+        await socket.close()
+    assert profile["is_online"]
+    assert profile["last_seen"].endswith("Z") and profile["created_at"].endswith("Z")
@@ -0,0 +1,81 @@
+import json
+
+import pytest
+
+from rate_limit import Limit, MemoryBucketStore, RouteClass
+
+
+async def exchange(socket, frame):
+    await socket.send_text(frame if isinstance(frame, str) else json.dumps(frame))
+    return json.loads(await socket.receive_text())
+
+
+@pytest.fixture
+async def pair(api):
+    alice, bob = await api.signup("alice"), await api.signup("bob")
+    await api.connect(alice, bob)
+    return alice, bob
+
+
+@pytest.mark.anyio
+async def test_send_frame_is_acked_stored_and_pushed(api, pair):
+    alice, bob = pair
+    sender, receiver = api.websocket(alice), api.websocket(bob)
+    await sender.connect()
+    await receiver.connect()
+    try:
+        ack = await exchange(sender, {"type": "send", "client_id": "c1", "receiver_id": bob.id, "text": "hi"})
+        pushed = json.loads(await receiver.receive_text())
+    finally:
+        await sender.close()
+        await receiver.close()
+
+    assert ack["type"] == "ack" and ack["client_id"] == "c1"
+    assert pushed["type"] == "new_message" and pushed["message"]["id"] == ack["id"]
+    assert pushed["message"]["timestamp"] == ack["timestamp"]
+    history = (await api.http.get(f"/api/chat/{alice.id}/history", headers=bob.headers)).json()["messages"]
+    assert [message["id"] for message in history] == [ack["id"]]
+
+
+@pytest.mark.anyio
+async def test_bad_frames_get_errors_and_ping_gets_pong(api, pair):
+    alice, bob = pair
+    carol = await api.signup("carol")
+    socket = api.websocket(alice)
+    await socket.connect()
+    try:
+        assert await exchange(socket, {"type": "ping"}) == {"type": "pong"}
+        assert await exchange(socket, "not json") == {"type": "error", "detail": "Invalid frame"}
+        assert (await exchange(socket, {"type": "shout", "client_id": "c1"}))["detail"] == "Unknown frame type"
+        missing = await exchange(socket, {"type": "send", "client_id": "c2", "receiver_id": bob.id})
+        assert missing["type"] == "error" and missing["client_id"] == "c2"
+        stranger = await exchange(socket, {"type": "send", "client_id": "c3", "receiver_id": carol.id, "text": "hi"})
+        assert stranger == {"type": "error", "client_id": "c3", "detail": "Not connected with this user"}
+    finally:
+        await socket.close()
+    assert await api.server.db.messages.count_documents({}) == 0
+
+
+@pytest.mark.anyio
+async def test_socket_sends_share_the_write_rate_limit(api, pair, monkeypatch):
+    alice, bob = pair
+    monkeypatch.setattr(api.server, "WS_SEND_CLASS", RouteClass("write", None, ("/api/",), Limit.parse("1/60")))
+    monkeypatch.setattr(api.server, "rate_limit_buckets", MemoryBucketStore())
+    socket = api.websocket(alice)
+    await socket.connect()
+    try:
+        frame = {"type": "send", "client_id": "c1", "receiver_id": bob.id, "text": "hi"}
+        assert (await exchange(socket, frame))["type"] == "ack"
+        limited = await exchange(socket, dict(frame, client_id="c2"))
+    finally:
+        await socket.close()
+    assert limited["detail"] == "Too many requests" and limited["retry_after"] > 0
+
+
+@pytest.mark.anyio
+async def test_handshake_requires_the_users_token(api, pair):
+    alice, bob = pair
+    socket = api.websocket(alice)
+    socket.query_string = f"token={bob.token}"
+    with pytest.raises(ConnectionError, match="1008"):
+        await socket.connect()
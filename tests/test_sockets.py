@@ -0,0 +1,96 @@
+import asyncio
+import json
+
+import pytest
+
+from sockets import OutboundSocket
+
+
+class SlowWebSocket:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.sent = []
+        self.closed_with = None
+        self.release = asyncio.Event()
+
+    async def send_text(self, message):
+        if self.fail:
+            raise RuntimeError("connection reset")
+        await self.release.wait()
+        self.sent.append(message)
+
+    async def close(self, code=1000):
+        self.closed_with = code
+
+
+def run(check):
+    asyncio.run(check())
+
+
+def test_drop_policy_discards_the_oldest_queued_message():
+    async def check():
+        websocket = SlowWebSocket()
+        socket = OutboundSocket(websocket, max_queue=2, policy="drop")
+        for i in range(4):
+            socket.send(f"m{i}")
+            await asyncio.sleep(0)
+        websocket.release.set()
+        await asyncio.sleep(0.01)
+        # m0 was already being written when the queue filled up
+        assert websocket.sent == ["m0", "m2", "m3"] and socket.dropped == 1
+        socket.discard()
+
+    run(check)
+
+
+def test_disconnect_policy_closes_a_slow_consumer():
+    async def check():
+        websocket = SlowWebSocket()
+        socket = OutboundSocket(websocket, max_queue=1, policy="disconnect")
+        for i in range(3):
+            socket.send(f"m{i}")
+            await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        assert socket.closed and websocket.closed_with == 1013
+        socket.send("ignored")
+        assert socket.queue.qsize() == 1
+
+    run(check)
+
+
+def test_failed_send_stops_the_writer():
+    async def check():
+        socket = OutboundSocket(SlowWebSocket(fail=True))
+        socket.send("m0")
+        await asyncio.sleep(0)
+        assert socket.closed and socket.writer.done()
+
+    run(check)
+
+
+def test_unknown_policy_is_rejected():
+    async def check():
+        with pytest.raises(ValueError):
+            OutboundSocket(SlowWebSocket(), policy="buffer-forever")
+
+    run(check)
+
+
+@pytest.mark.anyio
+async def test_every_socket_of_a_user_gets_the_push(api):
+    alice, bob = await api.signup("alice"), await api.signup("bob")
+    await api.connect(alice, bob)
+    phone, laptop = api.websocket(bob), api.websocket(bob)
+    await phone.connect()
+    await laptop.connect()
+    try:
+        first = await api.http.post("/api/chat/send", json={"receiver_id": bob.id, "text": "one"}, headers=alice.headers)
+        for socket in (phone, laptop):
+            assert json.loads(await socket.receive_text())["message"]["id"] == first.json()["id"]
+
+        await phone.close()
+        second = await api.http.post("/api/chat/send", json={"receiver_id": bob.id, "text": "two"}, headers=alice.headers)
+        assert json.loads(await laptop.receive_text())["message"]["id"] == second.json()["id"]
+        assert len(api.server.manager.active_connections[bob.id]) == 1
+    finally:
+        await laptop.close()
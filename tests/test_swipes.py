@@ -0,0 +1,54 @@
+from datetime import datetime, timezone
+
+import pytest
+
+import swipes
+from swipes import SwipeHistory
+
+
+def test_add_keeps_sets_sorted_and_unique():
+    history = SwipeHistory()
+    history.add("a", 3)
+    assert history.get("a") is None
+    assert list(history.load("a", [7, 2, 7])) == [2, 7]
+    for row in (5, 2, 9, 0):
+        history.add("a", row)
+    assert list(history.get("a")) == [0, 2, 5, 7, 9]
+
+
+def test_sets_expire_and_least_recently_used_are_dropped(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(swipes.time, "monotonic", lambda: now[0])
+    history = SwipeHistory(max_users=2, ttl_seconds=30)
+    history.load("a", [1])
+    history.load("b", [2])
+    history.get("a")
+    history.load("c", [3])
+    assert history.get("b") is None and list(history.get("a")) == [1]
+
+    now[0] += 31
+    assert history.get("a") is None and history.get("c") is None
+
+
+@pytest.mark.anyio
+async def test_feed_excludes_passed_and_requested_users(api):
+    me = await api.signup("me")
+    passed, requested, asking, fresh = [await api.signup(name) for name in ("passed", "requested", "asking", "fresh")]
+    assert (await api.http.post(f"/api/users/{passed.id}/pass", headers=me.headers)).json()["success"]
+    assert (await api.http.post(f"/api/users/{requested.id}/friend-request", headers=me.headers)).json()["success"]
+    assert (await api.http.post(f"/api/users/{me.id}/friend-request", headers=asking.headers)).json()["success"]
+
+    feed = (await api.http.get("/api/feed", headers=me.headers)).json()
+    assert [user["id"] for user in feed] == [fresh.id]
+
+
+@pytest.mark.anyio
+async def test_swipes_from_other_workers_show_up_once_the_set_expires(api, monkeypatch):
+    monkeypatch.setattr(api.server, "swipe_history", SwipeHistory(ttl_seconds=0))
+    me, other = await api.signup("me"), await api.signup("other")
+    assert [user["id"] for user in (await api.http.get("/api/feed", headers=me.headers)).json()] == [other.id]
+
+    await api.server.db.swipes.insert_one(
+        {"user_id": me.id, "target_id": other.id, "action": "pass", "timestamp": datetime.now(timezone.utc)}
+    )
+    assert (await api.http.get("/api/feed", headers=me.headers)).json() == []
@@ -0,0 +1,52 @@
+import pytest
+
+import user_cache
+from user_cache import UserCache
+
+
+def test_entries_expire_and_least_recently_used_are_evicted(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(user_cache.time, "monotonic", lambda: now[0])
+    cache = UserCache(max_size=2, ttl_seconds=30)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None and cache.get("c") == 3
+
+    now[0] += 31
+    assert cache.get("a") is None
+    assert cache.stats() == {"size": 1, "hits": 2, "misses": 2, "evictions": 1, "hit_ratio": 0.5}
+
+
+def test_zero_size_disables_the_cache_and_invalidate_ignores_unknown_ids():
+    cache = UserCache(max_size=0)
+    cache.set("a", 1)
+    assert cache.get("a") is None
+    cache.invalidate("a", "missing")
+
+
+@pytest.mark.anyio
+async def test_authenticated_requests_reuse_the_cached_user(api):
+    alice = await api.signup("alice")
+    await api.http.get("/api/profile", headers=alice.headers)
+    misses = api.server.user_cache.misses
+    for _ in range(3):
+        assert (await api.http.get("/api/profile", headers=alice.headers)).status_code == 200
+    assert api.server.user_cache.misses == misses
+
+
+@pytest.mark.anyio
+async def test_profile_edits_write_through_and_invalidation_reloads(api):
+    alice = await api.signup("alice")
+    await api.http.get("/api/profile", headers=alice.headers)
+
+    response = await api.http.put("/api/profile", json={"name": "alice", "bio": "new bio"}, headers=alice.headers)
+    assert response.status_code == 200
+    assert (await api.http.get("/api/profile", headers=alice.headers)).json()["bio"] == "new bio"
+
+    # A write the cache did not see is served stale until the entry is dropped
+    await api.server.db.users.update_one({"id": alice.id}, {"$set": {"bio": "edited elsewhere"}})
+    assert (await api.http.get("/api/profile", headers=alice.headers)).json()["bio"] == "new bio"
+    api.server.user_cache.invalidate(alice.id)
+    assert (await api.http.get("/api/profile", headers=alice.headers)).json()["bio"] == "edited elsewhere"